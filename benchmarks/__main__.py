@@ -0,0 +1,175 @@
+"""
+Run the benchmark suite and write a machine-readable baseline:
+
+    python -m benchmarks --scale small medium -o results.json
+
+Compare against a baseline written earlier on the same machine,
+failing on slower or larger runs:
+
+    python -m benchmarks --scale small medium --compare results.json
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import platform
+import sys
+from argparse import ArgumentParser
+from datetime import datetime, timezone
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from .suite import BENCHMARKS, Measurement, measure
+from .synthetic import SOURCES, SyntheticParameters, generate_dataset
+
+# Measurements below these floors are too noisy to be compared
+MIN_MEMORY = 2**20
+
+SCALES = {
+    "tiny": SyntheticParameters(
+        individuals=20, length=200, haplotypes=8, subsets=3, spartitions=2
+    ),
+    "small": SyntheticParameters(
+        individuals=100, length=500, haplotypes=30, subsets=5, spartitions=3
+    ),
+    "medium": SyntheticParameters(
+        individuals=500, length=1000, haplotypes=80, subsets=10, spartitions=4
+    ),
+    "large": SyntheticParameters(
+        individuals=2000, length=2000, haplotypes=200, subsets=25, spartitions=6
+    ),
+}
+
+
+def _get_parser() -> ArgumentParser:
+    parser = ArgumentParser(
+        prog="python -m benchmarks", description="Hapsolutely benchmark suite"
+    )
+    parser.add_argument(
+        "--scale", nargs="+", choices=list(SCALES), default=["small"], help="Sizes"
+    )
+    parser.add_argument(
+        "--source",
+        nargs="+",
+        choices=list(SOURCES),
+        default=list(SOURCES),
+        help="Example files to seed the datasets from",
+    )
+    parser.add_argument(
+        "-k", "--filter", help="Only run benchmarks whose name contains this"
+    )
+    parser.add_argument("-r", "--repeat", type=int, default=3, help="Timed calls")
+    parser.add_argument("-o", "--output", type=Path, help="Write results as JSON")
+    parser.add_argument("--compare", type=Path, help="Baseline to compare against")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="Allowed relative slowdown or memory growth",
+    )
+    parser.add_argument(
+        "--min-seconds",
+        type=float,
+        default=0.05,
+        help="Shorter times are compared as if they took this long",
+    )
+    return parser
+
+
+def _get_environment() -> dict:
+    return {
+        "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def _print_measurement(measurement: Measurement):
+    print(
+        f"{measurement.dataset:<40} {measurement.name:<36} "
+        f"{measurement.wall_seconds:>9.4f}s {measurement.cpu_seconds:>9.4f}s "
+        f"{measurement.peak_memory / 2**20:>8.1f}MiB "
+        f"{measurement.throughput:>10.0f}/s",
+        file=sys.stderr,
+    )
+
+
+def compare(
+    baseline: list[dict],
+    measurements: list[Measurement],
+    tolerance: float,
+    min_seconds: float = 0.05,
+) -> list[str]:
+    """
+    Returns a description of every regression beyond the tolerance.
+    Values under the floors are raised to them, so that a few milliseconds
+    or kilobytes of noise on the smallest benchmarks are not flagged.
+    """
+    previous = {(entry["name"], entry["dataset"]): entry for entry in baseline}
+    floors = {"wall_seconds": min_seconds, "peak_memory": MIN_MEMORY}
+    regressions = []
+    for measurement in measurements:
+        entry = previous.get((measurement.name, measurement.dataset))
+        if entry is None:
+            continue
+        for key, unit in [("wall_seconds", "s"), ("peak_memory", "B")]:
+            before = entry[key]
+            after = getattr(measurement, key)
+            reference = max(before, floors[key])
+            if after > reference * (1 + tolerance):
+                regressions.append(
+                    f"{measurement.dataset} {measurement.name}: {key} "
+                    f"{before:.4g}{unit} -> {after:.4g}{unit} "
+                    f"(+{after / reference - 1:.0%})"
+                )
+    return regressions
+
+
+def run():
+    args = _get_parser().parse_args()
+
+    from itaxotools.hapsolutely.pipeline import initialize_worker
+
+    initialize_worker()
+
+    benchmarks = [
+        benchmark
+        for benchmark in BENCHMARKS
+        if args.filter is None or args.filter in benchmark.name
+    ]
+
+    measurements = []
+    with TemporaryDirectory(prefix="hapsolutely_benchmarks_") as root:
+        root = Path(root)
+        for scale in args.scale:
+            for source in args.source:
+                dataset = generate_dataset(source, SCALES[scale], root / "data")
+                for benchmark in benchmarks:
+                    measurement = measure(benchmark, dataset, root, args.repeat)
+                    measurements.append(measurement)
+                    _print_measurement(measurement)
+
+    results = {
+        "environment": _get_environment(),
+        "datasets": {scale: SCALES[scale]._asdict() for scale in args.scale},
+        "benchmarks": [measurement._asdict() for measurement in measurements],
+    }
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2) + "\n")
+
+    if args.compare:
+        baseline = json.loads(args.compare.read_text())
+        regressions = compare(
+            baseline["benchmarks"], measurements, args.tolerance, args.min_seconds
+        )
+        for regression in regressions:
+            print(f"Regression: {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,337 @@
+"""Timed hot paths and end-to-end runs over a synthetic dataset"""
+
+from __future__ import annotations
+
+import gc
+import os
+import tracemalloc
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from time import perf_counter, process_time
+from typing import Callable, NamedTuple
+
+from itaxotools.common.utility import AttrDict
+
+from .synthetic import SyntheticDataset
+
+
+class Benchmark(NamedTuple):
+    name: str
+    setup: Callable[[SyntheticDataset, Path], AttrDict]
+    run: Callable[[AttrDict], int | tuple]
+
+
+class Measurement(NamedTuple):
+    name: str
+    dataset: str
+    items: int
+    repeat: int
+    wall_seconds: float
+    wall_seconds_min: float
+    cpu_seconds: float
+    peak_memory: int
+    throughput: float
+    stages: list[dict]
+
+
+def _median(values: list[float]) -> float:
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2
+
+
+def _get_sequence_model(path: Path) -> AttrDict:
+    from itaxotools.hapsolutely.model.phased_sequence import PhasedSequenceModel
+    from itaxotools.hapsolutely.tasks.common.work import get_phased_file_info
+
+    phased_info = get_phased_file_info(path)
+    return PhasedSequenceModel.from_file_info(
+        phased_info.info, phased_info.is_phased
+    ).as_dict()
+
+
+def _get_species_model(path: Path) -> AttrDict:
+    from itaxotools.taxi_gui.model.partition import PartitionModel
+    from itaxotools.taxi_gui.tasks.common.process import get_file_info
+
+    return PartitionModel.from_file_info(get_file_info(path), "species").as_dict()
+
+
+def _setup_models(dataset: SyntheticDataset, work_dir: Path) -> AttrDict:
+    return AttrDict(
+        dataset=dataset,
+        work_dir=work_dir,
+        input_sequences=_get_sequence_model(dataset.phased),
+        unphased_sequences=_get_sequence_model(dataset.unphased),
+        input_species=_get_species_model(dataset.spart),
+    )
+
+
+def _setup_network_inputs(dataset: SyntheticDataset, work_dir: Path) -> AttrDict:
+    """Sequences with alleles appended to their ids, as the builders get them"""
+    from itaxotools.hapsolutely.metrics import StageRecorder
+    from itaxotools.hapsolutely.tasks.haplodemo.process import _prepare_inputs
+
+    models = _setup_models(dataset, work_dir)
+    inputs = _prepare_inputs(
+        models.input_sequences, models.input_species, None, [], StageRecorder()
+    )
+    inputs.sequences = list(inputs.sequences)
+    return inputs
+
+
+def _setup_stats_inputs(dataset: SyntheticDataset, work_dir: Path) -> AttrDict:
+    from itaxotools.hapsolutely.tasks.common.work import (
+        get_all_possible_partition_models,
+        get_partition_from_optional_model,
+    )
+    from itaxotools.hapsolutely.tasks.haplostats.work import (
+        get_sequences_from_phased_model,
+    )
+
+    models = _setup_models(dataset, work_dir)
+    models.sequences = list(get_sequences_from_phased_model(models.input_sequences))
+    models.partition = get_partition_from_optional_model(models.input_species)
+    models.partitions = [
+        get_partition_from_optional_model(model)
+        for model in get_all_possible_partition_models(models.input_species)
+    ]
+    models.names = models.input_species.info.spartitions
+    return models
+
+
+def _setup_table(dataset: SyntheticDataset, work_dir: Path) -> AttrDict:
+    inputs = _setup_stats_inputs(dataset, work_dir)
+    inputs.table, inputs.partitions = _scan_table(inputs)
+    return inputs
+
+
+def _scan_table(inputs: AttrDict):
+    from itaxotools.hapsolutely.tasks.common.work import (
+        AmbiguityScanner,
+        PartitionIndex,
+        match_partition_to_phased_sequences,
+        scan_sequences,
+    )
+    from itaxotools.hapsolutely.tasks.haplostats.work import (
+        AlleleScanner,
+        HaplotypeTable,
+    )
+
+    table = HaplotypeTable()
+    scan_sequences(inputs.sequences, [AmbiguityScanner(), AlleleScanner(), table])
+    index = PartitionIndex()
+    partitions = [
+        match_partition_to_phased_sequences(partition, table.records, index=index)[0]
+        for partition in inputs.partitions
+    ]
+    return table, partitions
+
+
+def _run_parse(inputs: AttrDict) -> int:
+    from itaxotools.hapsolutely.tasks.common.work import sequences_from_phased_model
+
+    return sum(1 for _ in sequences_from_phased_model(inputs.input_sequences))
+
+
+def _run_ambiguity_scan(inputs: AttrDict) -> int:
+    from itaxotools.hapsolutely.tasks.common.work import scan_sequence_ambiguity
+
+    scan_sequence_ambiguity(inputs.sequences)
+    return len(inputs.sequences)
+
+
+def _run_stats(inputs: AttrDict) -> int:
+    from itaxotools.hapsolutely.tasks.haplostats.work import (
+        get_stats_from_sequences,
+    )
+
+    get_stats_from_sequences(inputs.sequences, True, inputs.partition)
+    return len(inputs.sequences)
+
+
+def _run_haplotype_table(inputs: AttrDict) -> int:
+    _scan_table(inputs)
+    return len(inputs.sequences)
+
+
+def _run_bulk_write(inputs: AttrDict) -> int:
+    from itaxotools.hapsolutely.tasks.haplostats.work import write_bulk_stats_to_path
+
+    path = inputs.work_dir / "bulk.yaml"
+    write_bulk_stats_to_path(inputs.table, True, inputs.partitions, inputs.names, path)
+    return len(inputs.partitions)
+
+
+def _run_tree_nj(inputs: AttrDict) -> int:
+    from itaxotools.hapsolutely.tasks.haplodemo.work import make_tree_nj
+
+    make_tree_nj(inputs.sequences)
+    return len(inputs.sequences)
+
+
+def _run_tree_mp(inputs: AttrDict) -> int:
+    from itaxotools.hapsolutely.tasks.haplodemo.work import make_tree_mp
+
+    make_tree_mp(inputs.sequences, max_moves=200)
+    return len(inputs.sequences)
+
+
+def _run_haplo_tree(inputs: AttrDict) -> int:
+    from itaxotools.hapsolutely.tasks.haplodemo.work import (
+        make_haplo_tree,
+        make_tree_nj,
+    )
+
+    if inputs.get("newick_string") is None:
+        inputs.newick_string = make_tree_nj(inputs.sequences)
+    make_haplo_tree(inputs.sequences, inputs.partition, inputs.newick_string, False)
+    return len(inputs.sequences)
+
+
+def _run_haplo_graph(inputs: AttrDict) -> int:
+    from itaxotools.hapsolutely.tasks.haplodemo.work import make_haplo_graph
+    from itaxotools.popart_networks import Sequence, build_tcs
+
+    graph = build_tcs(
+        Sequence(x.id, x.seq, inputs.partition.get(x.id, "unknown"))
+        for x in inputs.sequences
+    )
+    make_haplo_graph(graph)
+    return len(inputs.sequences)
+
+
+def _run_stats_execute(inputs: AttrDict, phased: bool, bulk_mode: bool):
+    from itaxotools.hapsolutely.tasks.haplostats import process
+
+    sequences = inputs.input_sequences if phased else inputs.unphased_sequences
+    results = process.execute(
+        inputs.work_dir, sequences, inputs.input_species, bulk_mode
+    )
+    items = inputs.dataset.parameters.individuals * (2 if phased else 1)
+    return items, results.stages
+
+
+def _run_network_execute(inputs: AttrDict, algorithm: str):
+    from itaxotools.hapsolutely.tasks.haplodemo import process
+    from itaxotools.hapsolutely.tasks.haplodemo.types import (
+        NetworkAlgorithm,
+        TreeContructionMethod,
+    )
+
+    results = process.execute(
+        inputs.work_dir,
+        inputs.input_sequences,
+        inputs.input_species,
+        None,
+        TreeContructionMethod.NJ,
+        NetworkAlgorithm[algorithm],
+        False,
+        0,
+    )
+    return inputs.dataset.sequence_count, results.stages
+
+
+BENCHMARKS = [
+    Benchmark("work.sequences_from_phased_model", _setup_models, _run_parse),
+    Benchmark("work.scan_sequence_ambiguity", _setup_stats_inputs, _run_ambiguity_scan),
+    Benchmark("work.get_stats_from_sequences", _setup_stats_inputs, _run_stats),
+    Benchmark("work.haplotype_table", _setup_stats_inputs, _run_haplotype_table),
+    Benchmark("work.write_bulk_stats_to_path", _setup_table, _run_bulk_write),
+    Benchmark("work.make_tree_nj", _setup_network_inputs, _run_tree_nj),
+    Benchmark("work.make_tree_mp", _setup_network_inputs, _run_tree_mp),
+    Benchmark("work.make_haplo_tree", _setup_network_inputs, _run_haplo_tree),
+    Benchmark("work.make_haplo_graph", _setup_network_inputs, _run_haplo_graph),
+    Benchmark(
+        "haplostats.execute",
+        _setup_models,
+        lambda inputs: _run_stats_execute(inputs, True, False),
+    ),
+    Benchmark(
+        "haplostats.execute.unphased",
+        _setup_models,
+        lambda inputs: _run_stats_execute(inputs, False, False),
+    ),
+    Benchmark(
+        "haplostats.execute.bulk",
+        _setup_models,
+        lambda inputs: _run_stats_execute(inputs, True, True),
+    ),
+    Benchmark(
+        "haplodemo.execute.TCS",
+        _setup_models,
+        lambda inputs: _run_network_execute(inputs, "TCS"),
+    ),
+    Benchmark(
+        "haplodemo.execute.Fitchi",
+        _setup_models,
+        lambda inputs: _run_network_execute(inputs, "Fitchi"),
+    ),
+]
+
+
+def _get_items(result: int | tuple) -> tuple[int, list[dict]]:
+    """End-to-end runs also return the metrics of their stages"""
+    if isinstance(result, int):
+        return result, []
+    items, stages = result
+    return items, [stage._asdict() for stage in stages]
+
+
+def _call(benchmark: Benchmark, dataset: SyntheticDataset, root: Path, trace: bool):
+    """
+    Every call gets a fresh work directory and user cache, so that nothing
+    is reused from an earlier call. Setup is not part of the measurement.
+    """
+    with TemporaryDirectory(dir=root) as tmp:
+        tmp = Path(tmp)
+        os.environ["HAPSOLUTELY_CACHE_DIR"] = str(tmp / "cache")
+        (tmp / "work").mkdir()
+        inputs = benchmark.setup(dataset, tmp / "work")
+        gc.collect()
+
+        if trace:
+            tracemalloc.start()
+        wall = perf_counter()
+        cpu = process_time()
+        result = benchmark.run(inputs)
+        wall = perf_counter() - wall
+        cpu = process_time() - cpu
+        peak = 0
+        if trace:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        return result, wall, cpu, peak
+
+
+def measure(
+    benchmark: Benchmark, dataset: SyntheticDataset, root: Path, repeat: int
+) -> Measurement:
+    """
+    Times are medians over the repeats. Memory is the peak of traced
+    allocations during one extra call, since tracing slows down the timed ones.
+    """
+    walls = []
+    cpus = []
+    for _ in range(repeat):
+        result, wall, cpu, _ = _call(benchmark, dataset, root, False)
+        walls.append(wall)
+        cpus.append(cpu)
+    _, _, _, peak = _call(benchmark, dataset, root, True)
+
+    items, stages = _get_items(result)
+    wall = _median(walls)
+    return Measurement(
+        benchmark.name,
+        dataset.name,
+        items,
+        repeat,
+        wall,
+        min(walls),
+        _median(cpus),
+        peak,
+        items / wall if wall else 0.0,
+        stages,
+    )
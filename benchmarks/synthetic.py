@@ -0,0 +1,233 @@
+"""Synthetic population datasets, seeded from the shipped example files"""
+
+from __future__ import annotations
+
+from pathlib import Path
+from typing import NamedTuple
+
+import numpy as np
+
+EXAMPLES = Path(__file__).parent.parent / "examples"
+
+SOURCES = {
+    "malagasius": EXAMPLES / "malagasius" / "malagasius.phased.fas",
+    "cmos_mabuya": EXAMPLES / "cmos_mabuya" / "cmos_mabuya.phased.fas",
+}
+
+BASES = np.frombuffer(b"ACGT", dtype=np.uint8)
+
+# Heterozygous sites of unphased individuals use the IUPAC codes
+IUPAC = {
+    frozenset("AG"): "R",
+    frozenset("CT"): "Y",
+    frozenset("CG"): "S",
+    frozenset("AT"): "W",
+    frozenset("GT"): "K",
+    frozenset("AC"): "M",
+}
+
+
+class SyntheticParameters(NamedTuple):
+    individuals: int
+    length: int
+    haplotypes: int
+    subsets: int
+    spartitions: int
+    seed: int = 0
+
+    @property
+    def label(self) -> str:
+        return (
+            f"{self.individuals}i_{self.length}bp_{self.haplotypes}h"
+            f"_{self.subsets}s_{self.spartitions}p"
+        )
+
+
+class SyntheticDataset(NamedTuple):
+    name: str
+    parameters: SyntheticParameters
+    phased: Path
+    unphased: Path
+    spart: Path
+
+    @property
+    def sequence_count(self) -> int:
+        return 2 * self.parameters.individuals
+
+
+def read_seed_sequences(path: Path) -> list[str]:
+    """Only the sequences are needed, the identifiers are discarded"""
+    sequences = []
+    with open(path) as file:
+        for line in file:
+            line = line.strip()
+            if line.startswith(">"):
+                sequences.append([])
+            elif line and sequences:
+                sequences[-1].append(line)
+    return ["".join(lines).upper() for lines in sequences]
+
+
+def get_root_sequence(seeds: list[str], length: int) -> np.ndarray:
+    """
+    Concatenate the seeds until the requested length is reached. Gaps and
+    ambiguity codes are replaced with random bases.
+    """
+    rng = np.random.default_rng(len(seeds))
+    joined = np.frombuffer("".join(seeds).encode(), dtype=np.uint8).copy()
+    invalid = ~np.isin(joined, BASES)
+    joined[invalid] = rng.choice(BASES, invalid.sum())
+    repeats = -(-length // len(joined))
+    return np.tile(joined, repeats)[:length]
+
+
+def get_haplotypes(
+    root: np.ndarray, count: int, rng: np.random.Generator
+) -> np.ndarray:
+    """
+    Every new haplotype is a copy of an earlier one with a few mutations,
+    so that the resulting networks resemble a genealogy.
+    """
+    haplotypes = np.empty((count, len(root)), dtype=np.uint8)
+    haplotypes[0] = root
+    seen = {root.tobytes()}
+    index = 1
+    while index < count:
+        haplotype = haplotypes[rng.integers(index)].copy()
+        sites = rng.choice(len(root), rng.integers(1, 4), replace=False)
+        for site in sites:
+            haplotype[site] = rng.choice(BASES[BASES != haplotype[site]])
+        if haplotype.tobytes() in seen:
+            continue
+        seen.add(haplotype.tobytes())
+        haplotypes[index] = haplotype
+        index += 1
+    return haplotypes
+
+
+def get_alleles(
+    parameters: SyntheticParameters, rng: np.random.Generator
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Individuals are split evenly into subsets. Each subset mostly draws
+    from its own pool of haplotypes, with some sharing between subsets.
+    Returns the subset of each individual and the haplotypes of its alleles.
+    """
+    individuals = np.arange(parameters.individuals)
+    subsets = individuals * parameters.subsets // parameters.individuals
+    pools = [
+        np.arange(subset, parameters.haplotypes, parameters.subsets)
+        for subset in range(parameters.subsets)
+    ]
+    alleles = rng.integers(parameters.haplotypes, size=(parameters.individuals, 2))
+    for individual, subset in zip(individuals, subsets):
+        pool = pools[subset]
+        if not len(pool):
+            continue
+        local = rng.random(2) < 0.9
+        alleles[individual, local] = rng.choice(pool, local.sum())
+    return subsets, alleles
+
+
+def get_individual_ids(parameters: SyntheticParameters) -> list[str]:
+    width = len(str(parameters.individuals))
+    return [f"ind{i:0{width}}" for i in range(1, parameters.individuals + 1)]
+
+
+def get_subset_names(parameters: SyntheticParameters) -> list[str]:
+    width = len(str(parameters.subsets))
+    return [f"sp{i:0{width}}" for i in range(1, parameters.subsets + 1)]
+
+
+def get_spartition_assignments(
+    parameters: SyntheticParameters, subsets: np.ndarray
+) -> list[np.ndarray]:
+    """The first spartition matches the subsets, the rest merge them in halves"""
+    assignments = []
+    for level in range(parameters.spartitions):
+        groups = max(1, parameters.subsets >> level)
+        assignments.append(subsets * groups // parameters.subsets + 1)
+    return assignments
+
+
+def write_phased_fasta(
+    path: Path,
+    ids: list[str],
+    names: list[str],
+    subsets: np.ndarray,
+    haplotypes: np.ndarray,
+    alleles: np.ndarray,
+):
+    with open(path, "w") as file:
+        for id, subset, pair in zip(ids, subsets, alleles):
+            for suffix, haplotype in zip("ab", pair):
+                sequence = haplotypes[haplotype].tobytes().decode()
+                file.write(f">{id}_{suffix}|{names[subset]}\n{sequence}\n")
+
+
+def write_unphased_fasta(
+    path: Path,
+    ids: list[str],
+    names: list[str],
+    subsets: np.ndarray,
+    haplotypes: np.ndarray,
+    alleles: np.ndarray,
+):
+    with open(path, "w") as file:
+        for id, subset, (a, b) in zip(ids, subsets, alleles):
+            sequence = [
+                x if x == y else IUPAC[frozenset((x, y))]
+                for x, y in zip(
+                    haplotypes[a].tobytes().decode(), haplotypes[b].tobytes().decode()
+                )
+            ]
+            file.write(f">{id}|{names[subset]}\n{''.join(sequence)}\n")
+
+
+def write_spart(
+    path: Path, project: str, ids: list[str], assignments: list[np.ndarray]
+):
+    labels = [f"level_{level + 1}" for level in range(len(assignments))]
+    counts = [str(len(np.unique(assignment))) for assignment in assignments]
+    with open(path, "w") as file:
+        file.write("begin spart;\n")
+        file.write(f"Project_name = {project};\n")
+        file.write("Date = 2023-01-01T00:00:00;\n")
+        file.write(f"N_spartitions = {len(labels)} : {' / '.join(labels)};\n")
+        file.write(f"N_individuals = {' / '.join([str(len(ids))] * len(labels))};\n")
+        file.write(f"N_subsets = {' / '.join(counts)};\n")
+        file.write("Individual_assignment =\n")
+        for index, id in enumerate(ids):
+            groups = " / ".join(str(assignment[index]) for assignment in assignments)
+            end = ";" if index == len(ids) - 1 else ""
+            file.write(f"{id} : {groups}{end}\n")
+        file.write("end;\n")
+
+
+def generate_dataset(
+    source: str, parameters: SyntheticParameters, directory: Path
+) -> SyntheticDataset:
+    """Write phased and unphased sequences along with a matching spart file"""
+    rng = np.random.default_rng(parameters.seed)
+    seeds = read_seed_sequences(SOURCES[source])
+    root = get_root_sequence(seeds, parameters.length)
+    haplotypes = get_haplotypes(root, parameters.haplotypes, rng)
+    subsets, alleles = get_alleles(parameters, rng)
+
+    ids = get_individual_ids(parameters)
+    names = get_subset_names(parameters)
+    assignments = get_spartition_assignments(parameters, subsets)
+
+    name = f"{source}_{parameters.label}"
+    directory.mkdir(parents=True, exist_ok=True)
+    dataset = SyntheticDataset(
+        name,
+        parameters,
+        directory / f"{name}.phased.fas",
+        directory / f"{name}.fas",
+        directory / f"{name}.spart",
+    )
+    write_phased_fasta(dataset.phased, ids, names, subsets, haplotypes, alleles)
+    write_unphased_fasta(dataset.unphased, ids, names, subsets, haplotypes, alleles)
+    write_spart(dataset.spart, dataset.phased.name, ids, assignments)
+    return dataset
@@ -0,0 +1,207 @@
+# -----------------------------------------------------------------------------
+# Hapsolutely - Reconstruct haplotypes and produce genealogy graphs
+# Copyright (C) 2023  Patmanidis Stefanos
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+# -----------------------------------------------------------------------------
+
+
+"""Batch queue of pipeline jobs over many loci"""
+
+from __future__ import annotations
+
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from concurrent.futures.process import BrokenProcessPool
+from enum import Enum
+from pathlib import Path
+from typing import Callable, NamedTuple
+
+from .pipeline import PipelineOptions, PipelineResult
+
+SEQUENCE_SUFFIXES = {".fas", ".fasta", ".fa", ".fna", ".tsv", ".tab"}
+
+
+class JobStatus(Enum):
+    Pending = "pending"
+    Running = "running"
+    Done = "done"
+    Failed = "failed"
+
+
+class BatchJob:
+    def __init__(self, path: Path, species: Path | None = None):
+        self.path = path
+        self.species = species
+        self.status = JobStatus.Pending
+        self.attempts = 0
+        self.error: str | None = None
+        self.result: PipelineResult | None = None
+
+    def __repr__(self):
+        return f"<{type(self).__name__} {self.path.name}: {self.status.value}>"
+
+
+class BatchProgress(NamedTuple):
+    total: int
+    pending: int
+    running: int
+    done: int
+    failed: int
+
+    @property
+    def finished(self) -> int:
+        return self.done + self.failed
+
+
+def read_manifest(path: Path) -> list[BatchJob]:
+    """
+    Each line holds the path of a sequence file, optionally followed by
+    a tab and the path of its species file. Relative paths are resolved
+    against the manifest directory. Empty lines and comments are skipped.
+    """
+    jobs = []
+    with open(path) as file:
+        for line in file:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            fields = line.split("\t")
+            sequences = path.parent / fields[0]
+            species = path.parent / fields[1] if len(fields) > 1 else None
+            jobs.append(BatchJob(sequences, species))
+    return jobs
+
+
+def get_jobs_from_path(path: Path) -> list[BatchJob]:
+    """A directory yields every sequence file in it, anything else is a manifest"""
+    if not path.is_dir():
+        return read_manifest(path)
+    paths = sorted(
+        child
+        for child in path.iterdir()
+        if child.is_file() and child.suffix.lower() in SEQUENCE_SUFFIXES
+    )
+    return [BatchJob(child) for child in paths]
+
+
+class BatchQueue:
+    """
+    Runs the pipeline for every job on a pool of at most max_workers
+    processes. Jobs that fail are retried one at a time, each on a fresh
+    worker process, so that a crashed worker cannot take other jobs along.
+    The callback is invoked whenever a job changes status.
+    """
+
+    def __init__(
+        self,
+        jobs: list[BatchJob],
+        output_dir: Path,
+        work_dir: Path,
+        options: PipelineOptions,
+        max_workers: int,
+        retries: int = 1,
+        callback: Callable[[BatchJob], None] | None = None,
+    ):
+        self.jobs = jobs
+        self.output_dir = output_dir
+        self.work_dir = work_dir
+        self.options = options
+        self.max_workers = max_workers
+        self.retries = retries
+        self.callback = callback
+
+    def get_progress(self) -> BatchProgress:
+        counts = {status: 0 for status in JobStatus}
+        for job in self.jobs:
+            counts[job.status] += 1
+        return BatchProgress(
+            len(self.jobs),
+            counts[JobStatus.Pending],
+            counts[JobStatus.Running],
+            counts[JobStatus.Done],
+            counts[JobStatus.Failed],
+        )
+
+    def _set_status(self, job: BatchJob, status: JobStatus):
+        job.status = status
+        if self.callback is not None:
+            self.callback(job)
+
+    def _submit(self, executor, index: int, job: BatchJob) -> Future:
+        from .pipeline import run_pipeline
+
+        options = self.options
+        if job.species is not None:
+            options = options._replace(species=job.species)
+        work_dir = self.work_dir / f"{index}_{job.attempts + 1}"
+        future = executor.submit(
+            run_pipeline, job.path, self.output_dir, work_dir, options
+        )
+        job.attempts += 1
+        job.error = None
+        self._set_status(job, JobStatus.Running)
+        return future
+
+    def _collect(self, job: BatchJob, future: Future):
+        try:
+            job.result = future.result()
+        except Exception as exception:
+            job.error = str(exception) or type(exception).__name__
+            self._set_status(job, JobStatus.Failed)
+        else:
+            self._set_status(job, JobStatus.Done)
+
+    def _run_jobs(self, indexed_jobs: list[tuple[int, BatchJob]], max_workers: int):
+        """
+        Keep at most max_workers jobs in flight, so that statuses stay accurate.
+        If a worker dies, the jobs in flight fail and a new pool takes over.
+        """
+        from .pipeline import initialize_worker
+        from .tasks.common.work import process_pool
+
+        queue = list(reversed(indexed_jobs))
+        while queue:
+            with process_pool(max_workers, initializer=initialize_worker) as executor:
+                running: dict[Future, BatchJob] = {}
+                broken = False
+                while (queue and not broken) or running:
+                    while queue and not broken and len(running) < max_workers:
+                        index, job = queue[-1]
+                        try:
+                            future = self._submit(executor, index, job)
+                        except BrokenProcessPool:
+                            broken = True
+                            break
+                        running[future] = job
+                        queue.pop()
+                    if not running:
+                        break
+                    finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        if isinstance(future.exception(), BrokenProcessPool):
+                            broken = True
+                        self._collect(running.pop(future), future)
+
+    def run(self) -> BatchProgress:
+        indexed_jobs = [
+            (index, job)
+            for index, job in enumerate(self.jobs)
+            if job.status != JobStatus.Done
+        ]
+        self._run_jobs(indexed_jobs, self.max_workers)
+        for _ in range(self.retries):
+            for index, job in enumerate(self.jobs):
+                if job.status == JobStatus.Failed:
+                    self._run_jobs([(index, job)], 1)
+        return self.get_progress()
@@ -0,0 +1,158 @@
+# -----------------------------------------------------------------------------
+# Hapsolutely - Reconstruct haplotypes and produce genealogy graphs
+# Copyright (C) 2023  Patmanidis Stefanos
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+# -----------------------------------------------------------------------------
+
+from __future__ import annotations
+
+import mmap
+import os
+import pickle
+import sys
+from hashlib import sha256
+from pathlib import Path
+from typing import Any
+
+DEFAULT_CACHE_SIZE = 2 * 2**30
+
+_buffer_alignment = 64
+
+_cache_dir_variable = "HAPSOLUTELY_CACHE_DIR"
+
+
+def get_user_cache_dir() -> Path:
+    if path := os.environ.get(_cache_dir_variable):
+        return Path(path)
+    if sys.platform == "win32":
+        base = os.environ.get("LOCALAPPDATA") or Path.home() / "AppData" / "Local"
+        return Path(base) / "iTaxoTools" / "Hapsolutely" / "Cache"
+    if sys.platform == "darwin":
+        return Path.home() / "Library" / "Caches" / "Hapsolutely"
+    base = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(base) / "hapsolutely"
+
+
+def get_file_key(path: Path, *options: Any) -> str:
+    """Identifies a file by its location, size and modification time"""
+    stat = path.stat()
+    return repr((str(path.resolve()), stat.st_size, stat.st_mtime_ns, *options))
+
+
+class DiskCache:
+    """
+    Pickled values stored as files under a directory, named by the hash
+    of their key. Reading an entry refreshes its modification time, and
+    the least recently used entries are evicted when the total size of
+    the directory exceeds the cap. All failures are treated as misses.
+
+    If mapped is set, buffers such as numpy arrays are written raw after
+    the pickle, using out-of-band pickling, and are memory-mapped back
+    when read instead of being copied into memory.
+    """
+
+    def __init__(
+        self, root: Path, max_size: int = DEFAULT_CACHE_SIZE, mapped: bool = False
+    ):
+        self.root = root
+        self.max_size = max_size
+        self.mapped = mapped
+
+    @classmethod
+    def from_namespace(cls, namespace: str, *args, **kwargs) -> DiskCache:
+        return cls(get_user_cache_dir() / namespace, *args, **kwargs)
+
+    def _get_path(self, key: str) -> Path:
+        return self.root / sha256(key.encode("utf-8")).hexdigest()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        path = self._get_path(key)
+        try:
+            with open(path, "rb") as file:
+                stored_key, value = self._load(file)
+            if stored_key != key:
+                return default
+            os.utime(path)
+            return value
+        except Exception:
+            return default
+
+    def put(self, key: str, value: Any):
+        path = self._get_path(key)
+        temp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        try:
+            self.root.mkdir(parents=True, exist_ok=True)
+            with open(temp, "wb") as file:
+                self._dump(file, key, value)
+            os.replace(temp, path)
+        except Exception:
+            temp.unlink(missing_ok=True)
+            return
+        self.evict()
+
+    def _load(self, file) -> tuple[str, Any]:
+        if not self.mapped:
+            return pickle.load(file)
+        key, sizes, payload = pickle.load(file)
+        view = memoryview(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))
+        buffers = []
+        position = file.tell()
+        for size in sizes:
+            position = _align(position)
+            buffers.append(view[position : position + size])
+            position += size
+        return key, pickle.loads(payload, buffers=buffers)
+
+    def _dump(self, file, key: str, value: Any):
+        if not self.mapped:
+            pickle.dump((key, value), file, protocol=pickle.HIGHEST_PROTOCOL)
+            return
+        buffers = []
+        payload = pickle.dumps(
+            value, protocol=pickle.HIGHEST_PROTOCOL, buffer_callback=buffers.append
+        )
+        views = [buffer.raw() for buffer in buffers]
+        sizes = [view.nbytes for view in views]
+        pickle.dump((key, sizes, payload), file, protocol=pickle.HIGHEST_PROTOCOL)
+        for view in views:
+            file.write(bytes(_align(file.tell()) - file.tell()))
+            file.write(view)
+
+    def evict(self):
+        try:
+            entries = [
+                (entry.stat().st_mtime_ns, entry.stat().st_size, entry.path)
+                for entry in os.scandir(self.root)
+                if entry.is_file() and not entry.name.endswith(".tmp")
+            ]
+        except OSError:
+            return
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+    def clear(self):
+        for path in self.root.glob("*"):
+            path.unlink(missing_ok=True)
+
+
+def _align(position: int) -> int:
+    return -(-position // _buffer_alignment) * _buffer_alignment
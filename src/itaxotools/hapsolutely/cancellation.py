@@ -0,0 +1,121 @@
+# -----------------------------------------------------------------------------
+# Hapsolutely - Reconstruct haplotypes and produce genealogy graphs
+# Copyright (C) 2023  Patmanidis Stefanos
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+# -----------------------------------------------------------------------------
+
+
+"""Cooperative cancellation of computations through a flag file"""
+
+from __future__ import annotations
+
+from contextlib import contextmanager
+from functools import wraps
+from pathlib import Path
+from time import perf_counter
+from typing import Callable, Iterator
+
+CANCEL_REQUEST = "cancel.request"
+CHECK_INTERVAL = 0.1
+
+# How long to wait for a computation to stop before terminating its worker
+CANCEL_GRACE_MS = 5000
+
+
+class Cancelled(Exception):
+    pass
+
+
+def request_cancel(work_dir: Path) -> bool:
+    """
+    Ask the computation running in the work directory to stop at its next
+    checkpoint. Returns False if a cancellation was already requested.
+    """
+    path = work_dir / CANCEL_REQUEST
+    if path.exists():
+        return False
+    path.touch()
+    return True
+
+
+class CancellationToken:
+    """
+    Watches for the cancel request of a work directory. The file system is
+    polled at most once per interval, so that checkpoints can be placed
+    inside tight loops. Once cancelled, the token stays cancelled.
+    """
+
+    def __init__(self, work_dir: Path, interval: float = CHECK_INTERVAL):
+        self.path = work_dir / CANCEL_REQUEST
+        self.interval = interval
+        self.last = perf_counter()
+        self.cancelled = False
+
+    def is_cancelled(self) -> bool:
+        if self.cancelled:
+            return True
+        now = perf_counter()
+        if now - self.last >= self.interval:
+            self.last = now
+            self.cancelled = self.path.exists()
+        return self.cancelled
+
+
+_token: CancellationToken | None = None
+
+
+def install_token(work_dir: Path | None):
+    """Used by pool workers, which are cancelled along with their parent"""
+    global _token
+    _token = CancellationToken(work_dir) if work_dir is not None else None
+
+
+def checkpoint():
+    """Raise Cancelled if cancellation was requested, otherwise do nothing"""
+    if _token is not None and _token.is_cancelled():
+        raise Cancelled()
+
+
+@contextmanager
+def cancellation_scope(work_dir: Path) -> Iterator[CancellationToken]:
+    """Checkpoints within the scope watch the given work directory"""
+    global _token
+    previous = _token
+    _token = CancellationToken(work_dir)
+    try:
+        yield _token
+    finally:
+        _token = previous
+        (work_dir / CANCEL_REQUEST).unlink(missing_ok=True)
+
+
+def cancellable(function: Callable) -> Callable:
+    """
+    Decorate process functions that take the work directory as their first
+    argument. On cancellation, the worker abort() is called, which lets the
+    worker process report the task as stopped and carry on with the next one.
+    """
+
+    @wraps(function)
+    def wrapper(work_dir: Path, *args, **kwargs):
+        from itaxotools import abort
+
+        with cancellation_scope(work_dir):
+            try:
+                return function(work_dir, *args, **kwargs)
+            except Cancelled:
+                abort()
+
+    return wrapper
@@ -0,0 +1,231 @@
+# -----------------------------------------------------------------------------
+# Hapsolutely - Reconstruct haplotypes and produce genealogy graphs
+# Copyright (C) 2023  Patmanidis Stefanos
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+# -----------------------------------------------------------------------------
+
+
+"""Command-line entry point"""
+
+from __future__ import annotations
+
+import sys
+from argparse import ArgumentParser
+from pathlib import Path
+
+from .batch import BatchJob, BatchQueue
+from .pipeline import PipelineOptions
+
+
+def _get_parser() -> ArgumentParser:
+    from .store import DEFAULT_MEMORY_BUDGET
+    from .tasks.haplodemo.types import NetworkAlgorithm, TreeContructionMethod
+
+    parser = ArgumentParser(
+        prog="hapsolutely-cli",
+        description="Phase sequences, then compute haplotype statistics and networks",
+    )
+    parser.add_argument(
+        "inputs",
+        nargs="*",
+        type=Path,
+        help="Sequence files, or directories of sequence files",
+    )
+    parser.add_argument(
+        "-m",
+        "--manifest",
+        action="append",
+        type=Path,
+        default=[],
+        help="File listing a sequence file and optional species file per line",
+    )
+    parser.add_argument(
+        "-o", "--output", type=Path, required=True, help="Output directory"
+    )
+    parser.add_argument(
+        "-s", "--species", type=Path, help="Partition file for all inputs"
+    )
+    parser.add_argument("--spartition", help="Spartition to use from the species file")
+    parser.add_argument(
+        "--bulk", action="store_true", help="Statistics for all spartitions"
+    )
+    parser.add_argument(
+        "--network",
+        choices=[algorithm.label for algorithm in NetworkAlgorithm],
+        default=NetworkAlgorithm.TCS.label,
+        help="Network algorithm",
+    )
+    parser.add_argument(
+        "--tree",
+        choices=[method.label for method in TreeContructionMethod],
+        default=TreeContructionMethod.NJ.label,
+        help="Tree construction method for Fitchi",
+    )
+    parser.add_argument("--transversions-only", action="store_true")
+    parser.add_argument("--epsilon", type=int, default=0, help="Epsilon for MJN")
+    parser.add_argument(
+        "--search-seconds", type=int, default=60, help="Time budget for MP trees"
+    )
+    parser.add_argument(
+        "--search-moves", type=int, default=0, help="Move budget for MP trees"
+    )
+    parser.add_argument("--no-phase", action="store_true", help="Never phase inputs")
+    parser.add_argument("--no-stats", action="store_true", help="Skip statistics")
+    parser.add_argument("--no-network", action="store_true", help="Skip networks")
+    parser.add_argument(
+        "--persistent-cache",
+        action="store_true",
+        help="Keep results and parsed inputs in user cache",
+    )
+    parser.add_argument(
+        "--memory-budget",
+        type=int,
+        default=DEFAULT_MEMORY_BUDGET // 2**20,
+        help="Keep sequences in memory up to this many MiB, otherwise stream them",
+    )
+    parser.add_argument("--strict", action="store_true", help="Fail on warnings")
+    parser.add_argument("-j", "--jobs", type=int, help="Number of worker processes")
+    parser.add_argument(
+        "--retries", type=int, default=1, help="Retries for each failed input"
+    )
+    parser.add_argument("-v", "--verbose", action="store_true", help="Report progress")
+    parser.add_argument(
+        "--metrics", action="store_true", help="Write the metrics of every stage"
+    )
+    return parser
+
+
+def _get_options(args) -> PipelineOptions:
+    from .pipeline import get_pipeline_options
+
+    return get_pipeline_options(
+        species=args.species,
+        spartition=args.spartition,
+        phase=not args.no_phase,
+        stats=not args.no_stats,
+        network=not args.no_network,
+        bulk_mode=args.bulk,
+        network_algorithm=args.network,
+        tree_contruction_method=args.tree,
+        transversions_only=args.transversions_only,
+        epsilon=args.epsilon,
+        search_seconds=args.search_seconds,
+        search_moves=args.search_moves,
+        persistent_cache=args.persistent_cache,
+        memory_budget=args.memory_budget * 2**20,
+        strict=args.strict,
+        verbose=args.verbose,
+        metrics=args.metrics,
+    )
+
+
+def _get_jobs(parser: ArgumentParser, args) -> list[BatchJob]:
+    from .batch import get_jobs_from_path
+
+    jobs = []
+    for path in args.inputs:
+        if path.is_dir():
+            jobs.extend(get_jobs_from_path(path))
+        else:
+            jobs.append(BatchJob(path))
+    for path in args.manifest:
+        jobs.extend(get_jobs_from_path(path))
+
+    if not jobs:
+        parser.error("No input files given")
+    stems = [job.path.stem for job in jobs]
+    if len(set(stems)) < len(stems):
+        parser.error("Input file names must be unique")
+    for job in jobs:
+        for path in (job.path, job.species):
+            if path is not None and not path.is_file():
+                parser.error(f"Input file not found: {path}")
+    return jobs
+
+
+def _print_status(queue: BatchQueue, job: BatchJob):
+    from .batch import JobStatus
+
+    progress = queue.get_progress()
+    prefix = f"[{progress.finished}/{progress.total}]"
+    match job.status:
+        case JobStatus.Running:
+            attempt = f" (attempt {job.attempts})" if job.attempts > 1 else ""
+            print(f"{prefix} Running: {job.path}{attempt}", file=sys.stderr)
+        case JobStatus.Done:
+            seconds = job.result.seconds_taken
+            print(f"{prefix} Done: {job.path} ({seconds:.2f}s)", file=sys.stderr)
+            for warn in job.result.warns:
+                print(f"Warning: {job.path}: {warn}", file=sys.stderr)
+        case JobStatus.Failed:
+            print(f"{prefix} Failed: {job.path}: {job.error}", file=sys.stderr)
+
+
+def _write_summary(path: Path, jobs: list[BatchJob]):
+    from .yamlify import yamlify
+
+    summary = {
+        str(job.path): {
+            "status": job.status.value,
+            "attempts": job.attempts,
+            "error": job.error,
+            "seconds": round(job.result.seconds_taken, 3) if job.result else None,
+            "outputs": [str(output) for output in job.result.outputs]
+            if job.result
+            else [],
+            "warnings": list(job.result.warns) if job.result else [],
+        }
+        for job in jobs
+    }
+    path.write_text(yamlify(summary, "jobs"))
+
+
+def run():
+    """
+    Run the pipeline for each input on a bounded pool of worker processes.
+    No Qt application is created. Exits with an error if any input failed.
+    """
+
+    from tempfile import TemporaryDirectory
+
+    from .tasks.common.work import get_pool_size
+
+    parser = _get_parser()
+    args = parser.parse_args()
+    options = _get_options(args)
+    jobs = _get_jobs(parser, args)
+
+    args.output.mkdir(parents=True, exist_ok=True)
+    max_workers = args.jobs or get_pool_size(len(jobs))
+
+    with TemporaryDirectory(prefix="hapsolutely_") as root:
+        queue = BatchQueue(
+            jobs,
+            args.output,
+            Path(root),
+            options,
+            max_workers,
+            args.retries,
+            callback=lambda job: _print_status(queue, job),
+        )
+        progress = queue.run()
+
+    _write_summary(args.output / "batch.yaml", jobs)
+    print(f"Completed {progress.done} of {progress.total} inputs")
+    sys.exit(1 if progress.failed else 0)
+
+
+if __name__ == "__main__":
+    run()
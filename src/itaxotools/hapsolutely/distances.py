@@ -0,0 +1,275 @@
+# -----------------------------------------------------------------------------
+# Hapsolutely - Reconstruct haplotypes and produce genealogy graphs
+# Copyright (C) 2023  Patmanidis Stefanos
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+# -----------------------------------------------------------------------------
+
+from __future__ import annotations
+
+from collections import OrderedDict
+from enum import Enum
+from hashlib import sha256
+from typing import NamedTuple
+
+import numpy as np
+
+from itaxotools.taxi2.sequences import Sequences
+
+from .cancellation import checkpoint
+from .store import SequenceStore
+
+DEFAULT_BLOCK_SIZE = 256
+DEFAULT_DISTANCE_CACHE_SIZE = 256 * 2**20
+
+# Two bits per base: the high bit separates pyrimidines from purines,
+# so that transversions are exactly the sites where the high bits differ
+_base_codes = {"A": 0b00, "G": 0b01, "C": 0b10, "T": 0b11}
+_high_bits = np.zeros(256, dtype=bool)
+_low_bits = np.zeros(256, dtype=bool)
+_base_mask = np.zeros(256, dtype=bool)
+_upper_base_mask = np.zeros(256, dtype=bool)
+for _symbol, _code in _base_codes.items():
+    _upper_base_mask[ord(_symbol)] = True
+    for _byte in (ord(_symbol), ord(_symbol.lower())):
+        _high_bits[_byte] = bool(_code & 0b10)
+        _low_bits[_byte] = bool(_code & 0b01)
+        _base_mask[_byte] = True
+
+_popcount_table = np.array([bin(x).count("1") for x in range(256)], dtype=np.uint8)
+
+
+class DistanceMetric(Enum):
+    Identity = "identity"
+    PDistance = "p-distance"
+    Transversions = "transversions"
+
+
+def encode_alignment(sequences: Sequences) -> tuple[list[str], np.ndarray]:
+    """Return the sequence ids and the alignment as a matrix of bytes"""
+    if isinstance(sequences, SequenceStore) and sequences.matrix is not None:
+        return list(sequences.ids), sequences.matrix
+
+    ids = []
+    rows = []
+    for sequence in sequences:
+        ids.append(sequence.id)
+        rows.append(sequence.seq.encode("utf-8"))
+    if len(set(len(row) for row in rows)) > 1:
+        raise ValueError("Sequences must all be the same length")
+    length = len(rows[0]) if rows else 0
+    matrix = np.frombuffer(b"".join(rows), dtype=np.uint8)
+    return ids, matrix.reshape(len(rows), length)
+
+
+class PackedAlignment(NamedTuple):
+    """
+    Alignment packed as two bitplanes of 64-bit words, one bit per site,
+    along with a mask of the sites holding an unambiguous nucleotide.
+    Words are laid out one row per word, one column per sequence.
+    """
+
+    high: np.ndarray
+    low: np.ndarray
+    mask: np.ndarray
+    length: int
+
+    @classmethod
+    def from_matrix(cls, matrix: np.ndarray) -> PackedAlignment:
+        return cls(
+            _pack_bits(_high_bits[matrix]),
+            _pack_bits(_low_bits[matrix]),
+            _pack_bits(_base_mask[matrix]),
+            matrix.shape[1],
+        )
+
+    def __len__(self) -> int:
+        return self.mask.shape[1]
+
+
+def _pack_bits(bits: np.ndarray) -> np.ndarray:
+    count, length = bits.shape
+    padded = np.zeros((count, -(-length // 64) * 64), dtype=bool)
+    padded[:, :length] = bits
+    words = np.packbits(padded, axis=1).view(np.uint64)
+    return np.ascontiguousarray(words.T)
+
+
+def popcount(words: np.ndarray, out: np.ndarray | None = None) -> np.ndarray:
+    """Count the bits set in each of the given 64-bit words"""
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(words, out=out)
+    counts = _popcount_table[words.view(np.uint8)]
+    return counts.reshape(*words.shape, 8).sum(axis=-1, dtype=np.uint8, out=out)
+
+
+def _get_packed_distances(
+    packed: PackedAlignment, metric: DistanceMetric, block_size: int
+) -> np.ndarray:
+    """
+    Differences are counted with XOR and popcount, one word at a time for
+    a block of rows against the rest of the upper triangle. Only the sites
+    where both sequences have a nucleotide are counted. For the identity
+    metric, every site must hold an unambiguous nucleotide.
+    """
+    count = len(packed)
+    distances = np.empty((count, count), dtype=np.float64)
+    for block in _iter_blocks(count, block_size):
+        columns = slice(block.start, count)
+        shape = (block.stop - block.start, count - block.start)
+        differences = np.zeros(shape, dtype=np.int32)
+        sites = np.zeros(shape, dtype=np.int32)
+        different = np.empty(shape, dtype=np.uint64)
+        buffer = np.empty(shape, dtype=np.uint64)
+        counts = np.empty(shape, dtype=np.uint8)
+        for word in range(len(packed.mask)):
+            high = packed.high[word]
+            np.bitwise_xor(high[block, None], high[None, columns], out=different)
+            if metric != DistanceMetric.Transversions:
+                low = packed.low[word]
+                np.bitwise_xor(low[block, None], low[None, columns], out=buffer)
+                np.bitwise_or(different, buffer, out=different)
+            if metric != DistanceMetric.Identity:
+                mask = packed.mask[word]
+                np.bitwise_and(mask[block, None], mask[None, columns], out=buffer)
+                np.bitwise_and(different, buffer, out=different)
+                sites += popcount(buffer, out=counts)
+            differences += popcount(different, out=counts)
+
+        if metric == DistanceMetric.Identity:
+            # Rounded the same way as the indicator plane products
+            matches = (packed.length - differences).astype(np.float32)
+            values = 1 - matches / packed.length if packed.length else 1
+        else:
+            with np.errstate(divide="ignore", invalid="ignore"):
+                values = np.where(sites > 0, differences / sites, 1)
+        distances[block, columns] = values
+        distances[columns, block] = np.transpose(values)
+    return distances
+
+
+def _get_identity_planes(matrix: np.ndarray) -> tuple[list[np.ndarray], int]:
+    # Invariant columns match for every pair and can be left out
+    variable = np.any(matrix != matrix[:1], axis=0)
+    length = matrix.shape[1]
+    matrix = matrix[:, variable]
+    planes = [(matrix == symbol).astype(np.float32) for symbol in np.unique(matrix)]
+    return planes, length - matrix.shape[1]
+
+
+def _iter_blocks(size: int, block_size: int) -> iter[slice]:
+    for start in range(0, size, block_size):
+        checkpoint()
+        yield slice(start, min(start + block_size, size))
+
+
+def _get_identity_distances(matrix: np.ndarray, block_size: int) -> np.ndarray:
+    """Mismatches over the full length, same as the Biopython identity model"""
+    count, length = matrix.shape
+    planes, invariant = _get_identity_planes(matrix)
+    distances = np.empty((count, count), dtype=np.float64)
+    for block in _iter_blocks(count, block_size):
+        matches = np.full((block.stop - block.start, count), invariant, np.float32)
+        for plane in planes:
+            matches += plane[block] @ plane.T
+        distances[block] = 1 - np.rint(matches) / length if length else 1
+    return distances
+
+
+def get_distance_matrix(
+    matrix: np.ndarray,
+    metric: DistanceMetric = DistanceMetric.Identity,
+    block_size: int = DEFAULT_BLOCK_SIZE,
+) -> np.ndarray:
+    """
+    Pairwise distances between the rows of an alignment matrix, a block of
+    rows at a time. Nucleotides are compared as packed bitplanes, except
+    for identity over ambiguous alignments, which is computed as products
+    of per-symbol indicator planes instead.
+    """
+    if metric != DistanceMetric.Identity or _upper_base_mask[matrix].all():
+        packed = PackedAlignment.from_matrix(matrix)
+        distances = _get_packed_distances(packed, metric, block_size)
+    else:
+        distances = _get_identity_distances(matrix, block_size)
+    np.fill_diagonal(distances, 0)
+    return distances
+
+
+def condense_distances(distances: np.ndarray) -> np.ndarray:
+    """Keep the upper triangle of a symmetric distance matrix as a flat array"""
+    return distances[np.triu_indices(len(distances), k=1)]
+
+
+def expand_distances(condensed: np.ndarray, count: int) -> np.ndarray:
+    distances = np.zeros((count, count), dtype=condensed.dtype)
+    rows, columns = np.triu_indices(count, k=1)
+    distances[rows, columns] = condensed
+    distances[columns, rows] = condensed
+    return distances
+
+
+class DistanceCache:
+    """
+    Condensed distance matrices kept in memory, keyed by the digest of the
+    alignment and the metric, which also fixes how ambiguity is handled.
+    The least recently used matrices are dropped once over the size cap.
+    """
+
+    def __init__(self, max_size: int = DEFAULT_DISTANCE_CACHE_SIZE):
+        self.max_size = max_size
+        self.size = 0
+        self.entries: OrderedDict[tuple, np.ndarray] = OrderedDict()
+
+    @staticmethod
+    def get_key(matrix: np.ndarray, metric: DistanceMetric) -> tuple:
+        matrix = np.ascontiguousarray(matrix)
+        return matrix.shape, sha256(matrix).hexdigest(), metric.value
+
+    def get(self, key: tuple) -> np.ndarray | None:
+        condensed = self.entries.get(key)
+        if condensed is not None:
+            self.entries.move_to_end(key)
+        return condensed
+
+    def put(self, key: tuple, condensed: np.ndarray):
+        if condensed.nbytes > self.max_size:
+            return
+        if key in self.entries:
+            self.size -= self.entries.pop(key).nbytes
+        self.entries[key] = condensed
+        self.size += condensed.nbytes
+        while self.size > self.max_size:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= evicted.nbytes
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
+
+
+distance_cache = DistanceCache()
+
+
+def get_cached_distance_matrix(
+    matrix: np.ndarray, metric: DistanceMetric = DistanceMetric.Identity
+) -> np.ndarray:
+    """Same as get_distance_matrix(), reusing matrices computed earlier in this process"""
+    key = DistanceCache.get_key(matrix, metric)
+    condensed = distance_cache.get(key)
+    if condensed is None:
+        distances = get_distance_matrix(matrix, metric)
+        distance_cache.put(key, condense_distances(distances))
+        return distances
+    return expand_distances(condensed, len(matrix))
@@ -0,0 +1,196 @@
+# -----------------------------------------------------------------------------
+# Hapsolutely - Reconstruct haplotypes and produce genealogy graphs
+# Copyright (C) 2023  Patmanidis Stefanos
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+# -----------------------------------------------------------------------------
+
+from __future__ import annotations
+
+import mmap
+from pathlib import Path
+from typing import NamedTuple
+
+from itaxotools.taxi2.sequences import Sequence, Sequences
+
+INDEXED_FASTA_MIN_SIZE = 32 * 2**20
+
+_index_header = "#hapsolutely-fasta-index"
+_line_whitespace = b" \r\n"
+_trailing_whitespace = b" \t\r\n\x0b\x0c\x1c\x1d\x1e\x1f"
+
+
+def _strip_whitespace(data: bytes) -> bytes:
+    """Same as Biopython: strip each line, then drop any spaces left"""
+    clean = data.translate(None, _line_whitespace)
+    rest = clean.translate(None, _trailing_whitespace)
+    if len(rest) == len(clean) and clean.isascii():
+        return clean
+    text = str(data, "utf-8").replace("\r\n", "\n").replace("\r", "\n")
+    lines = (line.rstrip() for line in text.split("\n"))
+    return "".join(lines).replace(" ", "").encode("utf-8")
+
+
+class FastaRecord(NamedTuple):
+    title: str
+    start: int
+    end: int
+    length: int
+
+
+class IndexedFasta:
+    """
+    Memory-mapped FASTA file with an offset index, similar to samtools faidx.
+    The index is kept in a sidecar file and rebuilt when the source changes.
+    Unlike faidx, records are named by their full title line, as parsed
+    by Biopython, so that identifiers with spaces are not truncated.
+    """
+
+    def __init__(self, path: Path, index_path: Path | None = None):
+        self.path = Path(path)
+        self.index_path = index_path or self.get_default_index_path(self.path)
+        self.file = open(self.path, "rb")
+        self.data = b""
+        if self.path.stat().st_size:
+            self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.records = self._load_index() or self._build_index()
+        self.titles = {record.title: index for index, record in enumerate(self.records)}
+
+    def __len__(self):
+        return len(self.records)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self.file.close()
+
+    @staticmethod
+    def get_default_index_path(path: Path) -> Path:
+        return path.with_name(path.name + ".hfai")
+
+    def _get_stamp(self) -> str:
+        stat = self.path.stat()
+        return f"{_index_header}\t{stat.st_size}\t{stat.st_mtime_ns}"
+
+    def _load_index(self) -> list[FastaRecord] | None:
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as file:
+                if file.readline().rstrip("\n") != self._get_stamp():
+                    return None
+                records = []
+                for line in file:
+                    title, start, end, length = line.rstrip("\n").rsplit("\t", 3)
+                    records.append(
+                        FastaRecord(title, int(start), int(end), int(length))
+                    )
+                return records
+        except (OSError, ValueError):
+            return None
+
+    def _save_index(self, records: list[FastaRecord]):
+        try:
+            with open(self.index_path, "w", encoding="utf-8") as file:
+                print(self._get_stamp(), file=file)
+                for record in records:
+                    print(*record, sep="\t", file=file)
+        except OSError:
+            pass
+
+    def _build_index(self) -> list[FastaRecord]:
+        data = self.data
+        size = len(data)
+        records = []
+
+        position = data.find(b"\n>")
+        position = position + 1 if position >= 0 else -1
+        if data[:1] == b">":
+            position = 0
+
+        while position >= 0:
+            line_end = data.find(b"\n", position)
+            if line_end < 0:
+                line_end = size
+            title = data[position + 1 : line_end].decode("utf-8").rstrip()
+            start = min(line_end + 1, size)
+            next_header = data.find(b"\n>", line_end)
+            end = next_header + 1 if next_header >= 0 else size
+            length = len(_strip_whitespace(data[start:end]))
+            records.append(FastaRecord(title, start, end, length))
+            position = end if next_header >= 0 else -1
+
+        self._save_index(records)
+        return records
+
+    def get_bytes(self, index: int) -> memoryview | bytes:
+        """Zero-copy view when the sequence is a single clean line"""
+        record = self.records[index]
+        end = record.end
+        while end > record.start and self.data[end - 1 : end] in (b"\n", b"\r"):
+            end -= 1
+        if end - record.start == record.length:
+            return memoryview(self.data)[record.start : end]
+        return _strip_whitespace(self.data[record.start : record.end])
+
+    def get_seq(self, index: int) -> str:
+        return str(self.get_bytes(index), "utf-8")
+
+    def get(self, title: str) -> Sequence:
+        return Sequence(title, self.get_seq(self.titles[title]))
+
+    def _iter_read_plain(self) -> iter[Sequence]:
+        for index, record in enumerate(self.records):
+            yield Sequence(record.title, self.get_seq(index))
+
+    def _iter_read_organism(self, separator: str, tag: str) -> iter[Sequence]:
+        for index, record in enumerate(self.records):
+            try:
+                id, organism = record.title.split(separator, 1)
+            except ValueError:
+                id = record.title
+                organism = None
+            yield Sequence(id, self.get_seq(index), extras={tag: organism})
+
+    def get_sequences(
+        self,
+        parse_organism: bool = False,
+        organism_separator: str = "|",
+        organism_tag: str = "organism",
+    ) -> Sequences:
+        """Same as reading with the taxi2 FASTA handler"""
+        if parse_organism:
+            return Sequences(self._iter_read_organism, organism_separator, organism_tag)
+        return Sequences(self._iter_read_plain)
+
+
+def _iter_indexed_fasta(path: Path, *args) -> iter[Sequence]:
+    with IndexedFasta(path) as fasta:
+        yield from fasta.get_sequences(*args)
+
+
+def read_indexed_fasta(
+    path: Path,
+    parse_organism: bool = False,
+    organism_separator: str = "|",
+    organism_tag: str = "organism",
+) -> Sequences:
+    """The file is only kept open while the sequences are iterated"""
+    return Sequences(
+        _iter_indexed_fasta, path, parse_organism, organism_separator, organism_tag
+    )
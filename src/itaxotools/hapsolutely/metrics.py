@@ -0,0 +1,114 @@
+# -----------------------------------------------------------------------------
+# Hapsolutely - Reconstruct haplotypes and produce genealogy graphs
+# Copyright (C) 2023  Patmanidis Stefanos
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+# -----------------------------------------------------------------------------
+
+
+"""Wall time, CPU time, memory and item counts for the stages of a run"""
+
+from __future__ import annotations
+
+import json
+from contextlib import contextmanager
+from time import perf_counter, process_time
+from typing import Iterator, NamedTuple
+
+
+class StageMetrics(NamedTuple):
+    name: str
+    wall_seconds: float
+    cpu_seconds: float
+    peak_rss: int | None
+    items: int | None
+
+
+class StageCounter:
+    def __init__(self):
+        self.items: int | None = None
+
+
+def reset_peak_rss() -> bool:
+    """Only possible on Linux, the peak is left unknown elsewhere"""
+    try:
+        with open("/proc/self/clear_refs", "w") as file:
+            file.write("5")
+    except OSError:
+        return False
+    return True
+
+
+def get_peak_rss() -> int | None:
+    """High-water mark of the resident memory since the last reset, in bytes"""
+    try:
+        with open("/proc/self/status") as file:
+            for line in file:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+class StageRecorder:
+    """
+    Collects the metrics of each stage in the order they finish. CPU time
+    only counts the current process, so stages that run on worker
+    processes are recorded there and merged back with extend().
+
+    The memory peak is reset when a stage starts, so that each stage
+    reports its own peak. The peaks of nested stages are carried over
+    to the stages enclosing them.
+    """
+
+    def __init__(self):
+        self.stages: list[StageMetrics] = []
+        self._peaks: list[int | None] = []
+
+    def _carry_peak(self, peak: int | None):
+        if self._peaks and peak is not None:
+            self._peaks[-1] = max(self._peaks[-1] or 0, peak)
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[StageCounter]:
+        counter = StageCounter()
+        self._carry_peak(get_peak_rss())
+        measured = reset_peak_rss()
+        self._peaks.append(None)
+        wall = perf_counter()
+        cpu = process_time()
+        try:
+            yield counter
+        finally:
+            wall = perf_counter() - wall
+            cpu = process_time() - cpu
+            self._carry_peak(get_peak_rss())
+            peak = self._peaks.pop()
+            if not measured:
+                peak = None
+            self._carry_peak(peak)
+            self.stages.append(StageMetrics(name, wall, cpu, peak, counter.items))
+
+    def extend(self, stages: tuple[StageMetrics, ...], prefix: str = ""):
+        for stage in stages:
+            self.stages.append(stage._replace(name=prefix + stage.name))
+
+    @property
+    def seconds_taken(self) -> float:
+        return sum(stage.wall_seconds for stage in self.stages)
+
+
+def stages_to_json(stages: tuple[StageMetrics, ...]) -> str:
+    return json.dumps([stage._asdict() for stage in stages], indent=2)
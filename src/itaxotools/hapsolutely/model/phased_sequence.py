@@ -25,6 +25,9 @@ from itaxotools.common.utility import AttrDict, DecoratorDict
 from itaxotools.taxi_gui.model.common import Object, Property
 from itaxotools.taxi_gui.types import FileInfo
 
+from ..indexed_fasta import INDEXED_FASTA_MIN_SIZE
+from ..store import DEFAULT_MEMORY_BUDGET
+
 FileInfoType = TypeVar("FileInfoType", bound=FileInfo)
 
 models = DecoratorDict[FileInfo, Object]()
@@ -34,6 +37,8 @@ class PhasedSequenceModel(Object, Generic[FileInfoType]):
     info = Property(FileInfo, None)
     is_phasing_optional = Property(bool, False)
     is_phased = Property(bool, True)
+    use_cache = Property(bool, False)
+    memory_budget = Property(int, DEFAULT_MEMORY_BUDGET)
 
     def __init__(self, info: FileInfo, is_phased=True, is_phasing_optional=True):
         super().__init__()
@@ -65,12 +70,14 @@ class PhasedFasta(PhasedSequenceModel):
     has_subsets = Property(bool, False)
     subset_separator = Property(str, "|")
     parse_subset = Property(bool, False)
+    use_index = Property(bool, False)
 
     def __init__(self, info: FileInfo.Fasta, *args, **kwargs):
         super().__init__(info, *args, **kwargs)
         self.has_subsets = info.has_subsets
         self.subset_separator = info.subset_separator
         self.parse_subset = info.has_subsets
+        self.use_index = info.size >= INDEXED_FASTA_MIN_SIZE
 
 
 @models(FileInfo.Tabfile)
@@ -0,0 +1,163 @@
+# -----------------------------------------------------------------------------
+# Hapsolutely - Reconstruct haplotypes and produce genealogy graphs
+# Copyright (C) 2023  Patmanidis Stefanos
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+# -----------------------------------------------------------------------------
+
+from __future__ import annotations
+
+from typing import Callable
+
+import numpy as np
+from Bio.Phylo.BaseTree import Clade, Tree
+
+from .cancellation import checkpoint
+
+COMPACT_MIN_SIZE = 64
+SCAN_BLOCK_SIZE = 256
+
+_diagonal_penalty = np.where(np.tri(SCAN_BLOCK_SIZE, k=-1, dtype=bool), 0.0, np.inf)
+
+
+class _JoiningMatrix:
+    """
+    Distances between the remaining clades. Joined clades are kept in place
+    and zeroed out instead of being deleted, and the matrix is compacted
+    whenever half of it is unused. The order of live rows is preserved,
+    so pairs are scanned in the same order as Biopython.
+    """
+
+    def __init__(self, clades: list[Clade], distances: np.ndarray):
+        self.clades = list(clades)
+        self.distances = np.array(distances, dtype=np.float64)
+        self.sums = self.distances.sum(axis=1)
+        self.alive = np.ones(len(clades), dtype=bool)
+        self.count = len(clades)
+
+    def get_closest_pair(self) -> tuple[int, int, np.ndarray]:
+        """Minimize the Q criterion over the lower triangle, a block of rows at a time"""
+        size = len(self.distances)
+        node_dist = self.sums / (self.count - 2)
+        node_dist[~self.alive] = -np.inf
+
+        best, min_i, min_j = np.inf, 0, 0
+        for start in range(0, size, SCAN_BLOCK_SIZE):
+            stop = min(start + SCAN_BLOCK_SIZE, size)
+            block = self.distances[start:stop, :stop] - node_dist[start:stop, None]
+            block -= node_dist[None, :stop]
+            block[:, start:] += _diagonal_penalty[: stop - start, : stop - start]
+            index = np.argmin(block)
+            if block.flat[index] < best:
+                best = block.flat[index]
+                i, j = np.unravel_index(index, block.shape)
+                min_i, min_j = int(i) + start, int(j)
+
+        # Biopython starts from the first pair with its indices swapped
+        first, second = np.flatnonzero(self.alive)[:2]
+        if (min_i, min_j) == (second, first):
+            min_i, min_j = first, second
+
+        return int(min_i), int(min_j), node_dist
+
+    def join(self, i: int, j: int, clade: Clade):
+        """Replace clade j with the joined clade and drop clade i"""
+        distances = self.distances
+        joined = (distances[i] + distances[j] - distances[i, j]) / 2.0
+        joined[~self.alive] = 0
+        joined[[i, j]] = 0
+        self.sums += joined - distances[i] - distances[j]
+        self.sums[j] = joined.sum()
+        self.sums[i] = 0
+        distances[j, :] = joined
+        distances[:, j] = joined
+        distances[i, :] = 0
+        distances[:, i] = 0
+        self.clades[j] = clade
+        self.clades[i] = None
+        self.alive[i] = False
+        self.count -= 1
+
+        size = len(distances)
+        if size > COMPACT_MIN_SIZE and self.count <= size // 2:
+            self.compact()
+
+    def compact(self):
+        live = np.flatnonzero(self.alive)
+        self.distances = self.distances[np.ix_(live, live)]
+        self.sums = self.distances.sum(axis=1)
+        self.clades = [self.clades[index] for index in live]
+        self.alive = np.ones(len(live), dtype=bool)
+
+    def get_live_pair(self) -> tuple[Clade, Clade, float]:
+        first, second = np.flatnonzero(self.alive)
+        distance = self.distances[second, first]
+        return self.clades[first], self.clades[second], distance
+
+
+def neighbor_joining(
+    names: list[str],
+    distances: np.ndarray,
+    callback: Callable[[int, int], None] | None = None,
+) -> Tree:
+    """
+    Same algorithm as the Biopython DistanceTreeConstructor, but working
+    on a NumPy distance matrix, so that each join costs a few array passes.
+    Pairs with equal criteria may be resolved differently due to rounding.
+    The callback receives the number of joins done and the total after each join.
+    """
+    clades = [Clade(None, name) for name in names]
+
+    if len(clades) == 1:
+        return Tree(clades[0], rooted=False)
+    if len(clades) == 2:
+        clade1, clade2 = clades[1], clades[0]
+        clade1.branch_length = distances[1, 0] / 2.0
+        clade2.branch_length = distances[1, 0] - clade1.branch_length
+        return Tree(Clade(None, "Inner", clades=[clade1, clade2]), rooted=False)
+
+    matrix = _JoiningMatrix(clades, distances)
+    inner_count = 0
+    total = len(clades) - 2
+    while matrix.count > 2:
+        checkpoint()
+        min_i, min_j, node_dist = matrix.get_closest_pair()
+        distance = matrix.distances[min_i, min_j]
+
+        clade1 = matrix.clades[min_i]
+        clade2 = matrix.clades[min_j]
+        inner_count += 1
+        inner_clade = Clade(None, "Inner" + str(inner_count))
+        inner_clade.clades.append(clade1)
+        inner_clade.clades.append(clade2)
+        clade1.branch_length = (distance + node_dist[min_i] - node_dist[min_j]) / 2.0
+        clade2.branch_length = distance - clade1.branch_length
+
+        matrix.join(min_i, min_j, inner_clade)
+        if callback is not None:
+            callback(inner_count, total)
+
+    first, second, distance = matrix.get_live_pair()
+    if first is inner_clade:
+        first.branch_length = 0
+        second.branch_length = distance
+        first.clades.append(second)
+        root = first
+    else:
+        first.branch_length = distance
+        second.branch_length = 0
+        second.clades.append(first)
+        root = second
+
+    return Tree(root, rooted=False)
@@ -0,0 +1,407 @@
+# -----------------------------------------------------------------------------
+# Hapsolutely - Reconstruct haplotypes and produce genealogy graphs
+# Copyright (C) 2023  Patmanidis Stefanos
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+# -----------------------------------------------------------------------------
+
+from __future__ import annotations
+
+from time import perf_counter
+from typing import Callable
+
+import numpy as np
+from Bio.Phylo.BaseTree import Clade, Tree
+
+from .cancellation import checkpoint
+
+DEFAULT_SPR_RADIUS = 8
+
+_iupac_states = {
+    "A": 0b0001,
+    "C": 0b0010,
+    "G": 0b0100,
+    "T": 0b1000,
+    "U": 0b1000,
+    "R": 0b0101,
+    "Y": 0b1010,
+    "S": 0b0110,
+    "W": 0b1001,
+    "K": 0b1100,
+    "M": 0b0011,
+    "B": 0b1110,
+    "D": 0b1101,
+    "H": 0b1011,
+    "V": 0b0111,
+}
+
+# Gaps, N and any other symbols are treated as missing data
+_state_table = np.full(256, 0b1111, dtype=np.uint8)
+for _symbol, _states in _iupac_states.items():
+    _state_table[ord(_symbol)] = _states
+    _state_table[ord(_symbol.lower())] = _states
+
+
+def encode_states(matrix: np.ndarray) -> np.ndarray:
+    """Convert an alignment of bytes to 4-bit nucleotide state sets"""
+    return _state_table[matrix]
+
+
+def compress_sites(states: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Return the distinct site patterns as columns, together with their weights.
+    Sites where all sequences share a state never add to the score and are left out.
+    """
+    shared = np.bitwise_and.reduce(states, axis=0)
+    states = states[:, shared == 0]
+    if not states.shape[1]:
+        return states, np.zeros(0, dtype=np.int64)
+    patterns, weights = np.unique(states, axis=1, return_counts=True)
+    return np.ascontiguousarray(patterns), weights.astype(np.int64)
+
+
+class ParsimonyTree:
+    """
+    Unrooted binary tree scored with the Fitch algorithm. Leaves are numbered
+    after the rows of the alignment and internal nodes follow. For every
+    directed edge (u, v), the state sets and score of the subtree hanging
+    from v away from u are kept, so that rearrangements of the tree can be
+    rescored exactly by combining the sets of the few affected subtrees.
+    """
+
+    def __init__(
+        self,
+        names: list[str],
+        patterns: np.ndarray,
+        weights: np.ndarray,
+        neighbors: dict[int, list[int]],
+    ):
+        self.names = names
+        self.patterns = patterns
+        self.weights = weights
+        self.neighbors = neighbors
+        self.sets: dict[tuple[int, int], np.ndarray] = {}
+        self.costs: dict[tuple[int, int], int] = {}
+        self.score = 0
+        self.update()
+
+    @classmethod
+    def from_bio_tree(
+        cls, tree: Tree, names: list[str], patterns: np.ndarray, weights: np.ndarray
+    ) -> ParsimonyTree:
+        leaves = {name: index for index, name in enumerate(names)}
+        neighbors = {index: [] for index in range(len(names))}
+        stack = [(tree.root, None)]
+        while stack:
+            clade, parent = stack.pop()
+            if clade.is_terminal():
+                node = leaves[clade.name]
+            else:
+                node = len(neighbors)
+                neighbors[node] = []
+            if parent is not None:
+                neighbors[node].append(parent)
+                neighbors[parent].append(node)
+            stack.extend((child, node) for child in clade.clades)
+        _make_binary(neighbors, len(names))
+        return cls(names, patterns, weights, neighbors)
+
+    def to_bio_tree(self) -> Tree:
+        leaf_count = len(self.names)
+        internals = [node for node in self.neighbors if node >= leaf_count]
+        if not internals:
+            return Tree(Clade(clades=[Clade(name=name) for name in self.names]))
+
+        root = Clade()
+        stack = [(internals[0], None, root)]
+        while stack:
+            node, parent, clade = stack.pop()
+            for neighbor in self.neighbors[node]:
+                if neighbor == parent:
+                    continue
+                if neighbor < leaf_count:
+                    child = Clade(name=self.names[neighbor])
+                else:
+                    child = Clade()
+                    stack.append((neighbor, node, child))
+                clade.clades.append(child)
+        return Tree(root, rooted=False)
+
+    def fitch(self, a: np.ndarray, b: np.ndarray) -> tuple[np.ndarray, int]:
+        """Combine the state sets of two subtrees, counting the changes needed"""
+        shared = a & b
+        empty = shared == 0
+        return np.where(empty, a | b, shared), int(np.dot(empty, self.weights))
+
+    def _get_directed(self, u: int, v: int) -> tuple[np.ndarray, int]:
+        if v < len(self.names):
+            return self.patterns[v], 0
+        a, b = (w for w in self.neighbors[v] if w != u)
+        states, cost = self.fitch(self.sets[v, a], self.sets[v, b])
+        return states, cost + self.costs[v, a] + self.costs[v, b]
+
+    def _iter_preorder(self, root: int) -> iter[tuple[int, int]]:
+        stack = [(root, neighbor) for neighbor in self.neighbors[root]]
+        while stack:
+            parent, node = stack.pop()
+            yield parent, node
+            stack.extend((node, w) for w in self.neighbors[node] if w != parent)
+
+    def update(self, root: int | None = None):
+        """Compute the sets of all directed edges reachable from a leaf"""
+        self.sets = {}
+        self.costs = {}
+        self._update(0 if root is None else root, None)
+
+    def _update(self, root: int, touched: set[int] | None):
+        """
+        Directed edges are visited away from the root, then towards it, so
+        that the sets they combine are always ready. After a move, only the
+        touched nodes, whose neighbors changed, are given: an edge is then
+        recomputed only if it hangs from a touched node or one of the edges
+        it combines was changed, which stops wherever the sets settle.
+        """
+        changed = set()
+        preorder = list(self._iter_preorder(root))
+        for parent, node in reversed(preorder):
+            self._refresh(parent, node, touched, changed)
+        for parent, node in preorder:
+            self._refresh(node, parent, touched, changed)
+        neighbor = self.neighbors[root][0]
+        _, cost = self.fitch(self.sets[neighbor, root], self.sets[root, neighbor])
+        self.score = cost + self.costs[neighbor, root] + self.costs[root, neighbor]
+
+    def _refresh(
+        self,
+        u: int,
+        v: int,
+        touched: set[int] | None,
+        changed: set[tuple[int, int]],
+    ):
+        if touched is not None and v not in touched:
+            if not any((v, w) in changed for w in self.neighbors[v] if w != u):
+                return
+        states, cost = self._get_directed(u, v)
+        if self.costs.get((u, v)) == cost and np.array_equal(self.sets[u, v], states):
+            return
+        self.sets[u, v] = states
+        self.costs[u, v] = cost
+        changed.add((u, v))
+
+    def _get_pair(self, a: tuple[int, int], b: tuple[int, int]):
+        states, cost = self.fitch(self.sets[a], self.sets[b])
+        return states, cost + self.costs[a] + self.costs[b]
+
+    def find_best_nni(self) -> tuple[int, tuple[int, int, int, int] | None]:
+        """Return the best score change and the swap for any single NNI"""
+        leaf_count = len(self.names)
+        best_delta, best_move = 0, None
+        for u, neighbors in self.neighbors.items():
+            for v in neighbors:
+                if u < leaf_count or v <= u:
+                    continue
+                a, b = (w for w in self.neighbors[u] if w != v)
+                c, d = (w for w in self.neighbors[v] if w != u)
+                current = self._get_quartet((u, a), (u, b), (v, c), (v, d))
+                for swap, pairs in (
+                    ((b, c), ((u, a), (v, c), (u, b), (v, d))),
+                    ((b, d), ((u, a), (v, d), (u, b), (v, c))),
+                ):
+                    delta = self._get_quartet(*pairs) - current
+                    if delta < best_delta:
+                        best_delta, best_move = delta, (u, v, *swap)
+        return best_delta, best_move
+
+    def _get_quartet(self, a, b, c, d) -> int:
+        left, left_cost = self._get_pair(a, b)
+        right, right_cost = self._get_pair(c, d)
+        _, cost = self.fitch(left, right)
+        return left_cost + right_cost + cost
+
+    def apply_nni(self, u: int, v: int, b: int, c: int):
+        """Swap subtree b, next to u, with subtree c, next to v"""
+        self._replace(u, b, c)
+        self._replace(v, c, b)
+        self._replace(b, u, v)
+        self._replace(c, v, u)
+        self._update(u, {u, v, b, c})
+
+    def _replace(self, node: int, old: int, new: int):
+        neighbors = self.neighbors[node]
+        neighbors[neighbors.index(old)] = new
+        self._discard(node, old)
+
+    def _discard(self, u: int, v: int):
+        """Forget the sets of a directed edge that was removed"""
+        self.sets.pop((u, v), None)
+        self.costs.pop((u, v), None)
+
+    def find_best_spr(
+        self,
+        radius: int = DEFAULT_SPR_RADIUS,
+        interrupt: Callable[[], bool] | None = None,
+    ) -> tuple[int, tuple[int, int, int, int] | None]:
+        """
+        Return the best score change and the move for any SPR within radius.
+        If interrupted, the best move among those scanned so far is returned.
+        """
+        leaf_count = len(self.names)
+        best_delta, best_move = 0, None
+        for u, neighbors in self.neighbors.items():
+            if u < leaf_count:
+                continue
+            if interrupt is not None and interrupt():
+                break
+            for v in neighbors:
+                x, y = (w for w in neighbors if w != v)
+                _, rest_score = self._get_pair((u, x), (u, y))
+                edges, far, near = self._get_regraft_sides(u, x, y, radius)
+                if not edges:
+                    continue
+                shared = far & near
+                states = np.where(shared == 0, far | near, shared)
+                costs = ((states & self.sets[u, v]) == 0) @ self.weights
+                index = int(np.argmin(costs))
+                delta = rest_score + self.costs[u, v] + int(costs[index]) - self.score
+                if delta < best_delta:
+                    best_delta, best_move = delta, (u, v, *edges[index])
+        return best_delta, best_move
+
+    def _get_regraft_sides(self, u: int, x: int, y: int, radius: int):
+        """
+        List the edges left after pruning the subtree attached through u,
+        which joins x and y directly, up to radius edges away. For each edge,
+        return the sets of its two sides: the far side is unaffected by pruning,
+        while the sets of the near side are recomputed outwards.
+        """
+        edges, far, near = [], [], []
+        stack = [(x, u, self.sets[u, y], 1), (y, u, self.sets[u, x], 1)]
+        while stack:
+            node, parent, states, depth = stack.pop()
+            if node < len(self.names) or depth >= radius:
+                continue
+            a, b = (w for w in self.neighbors[node] if w != parent)
+            for child, sibling in ((a, b), (b, a)):
+                child_states, _ = self.fitch(states, self.sets[node, sibling])
+                edges.append((child, node))
+                far.append(self.sets[node, child])
+                near.append(child_states)
+                stack.append((child, node, child_states, depth + 1))
+        if not edges:
+            return edges, None, None
+        return edges, np.stack(far), np.stack(near)
+
+    def apply_spr(self, u: int, v: int, p: int, q: int):
+        """Move the subtree at v, attached through u, onto the edge (p, q)"""
+        x, y = (w for w in self.neighbors[u] if w != v)
+        self._replace(x, u, y)
+        self._replace(y, u, x)
+        self._replace(p, q, u)
+        self._replace(q, p, u)
+        self._discard(u, x)
+        self._discard(u, y)
+        self.neighbors[u] = [v, p, q]
+        self._update(u, {u, x, y, p, q})
+
+
+def _make_binary(neighbors: dict[int, list[int]], leaf_count: int):
+    """Suppress nodes of degree two and resolve polytomies arbitrarily"""
+    for node in [node for node in neighbors if node >= leaf_count]:
+        adjacent = neighbors[node]
+        if len(adjacent) == 2:
+            a, b = adjacent
+            neighbors[a][neighbors[a].index(node)] = b
+            neighbors[b][neighbors[b].index(node)] = a
+            del neighbors[node]
+        while len(adjacent) > 3:
+            new = max(neighbors) + 1
+            a, b = adjacent.pop(), adjacent.pop()
+            neighbors[new] = [node, a, b]
+            neighbors[a][neighbors[a].index(node)] = new
+            neighbors[b][neighbors[b].index(node)] = new
+            adjacent.append(new)
+
+
+def iter_parsimony_search(
+    tree: ParsimonyTree, interrupt: Callable[[], bool] | None = None
+) -> iter[int]:
+    """
+    Hill climbing by the best NNI, falling back to the best SPR when no NNI
+    improves the score. Yields the score after every accepted move.
+    The search ends early as soon as interrupt returns True.
+    """
+    while interrupt is None or not interrupt():
+        _, move = tree.find_best_nni()
+        if move is not None:
+            tree.apply_nni(*move)
+            yield tree.score
+            continue
+        _, move = tree.find_best_spr(interrupt=interrupt)
+        if move is not None:
+            tree.apply_spr(*move)
+            yield tree.score
+            continue
+        return
+
+
+def search_parsimony_tree(
+    tree: ParsimonyTree,
+    max_seconds: float = 0,
+    max_moves: int = 0,
+    should_stop: Callable[[], bool] | None = None,
+    callback: Callable[[int, int, float], None] | None = None,
+) -> bool:
+    """
+    Improve the tree in place until no move lowers its score, the time or
+    move budget runs out, or should_stop returns True. Zero means no limit.
+    Moves are only accepted when they lower the score, so the tree is always
+    the best found so far. The callback receives the score, the number of
+    moves and the seconds elapsed. Returns True if the search converged.
+    """
+    start = perf_counter()
+    interrupted = False
+
+    def interrupt() -> bool:
+        nonlocal interrupted
+        checkpoint()
+        if max_seconds and perf_counter() - start >= max_seconds:
+            interrupted = True
+        elif should_stop is not None and should_stop():
+            interrupted = True
+        return interrupted
+
+    moves = 0
+    if callback is not None:
+        callback(tree.score, moves, 0.0)
+    for score in iter_parsimony_search(tree, interrupt):
+        moves += 1
+        if callback is not None:
+            callback(score, moves, perf_counter() - start)
+        if max_moves and moves >= max_moves:
+            return False
+    return not interrupted
+
+
+def get_parsimony_tree(
+    names: list[str], matrix: np.ndarray, start: Tree, **kwargs
+) -> Tree:
+    """
+    Improve the starting tree until no NNI or SPR lowers the Fitch score.
+    Keyword arguments set the budget of the search and are passed on to
+    search_parsimony_tree().
+    """
+    patterns, weights = compress_sites(encode_states(matrix))
+    tree = ParsimonyTree.from_bio_tree(start, names, patterns, weights)
+    search_parsimony_tree(tree, **kwargs)
+    return tree.to_bio_tree()
@@ -0,0 +1,303 @@
+# -----------------------------------------------------------------------------
+# Hapsolutely - Reconstruct haplotypes and produce genealogy graphs
+# Copyright (C) 2023  Patmanidis Stefanos
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+# -----------------------------------------------------------------------------
+
+
+"""Headless pipeline: phase, then compute statistics and networks"""
+
+from __future__ import annotations
+
+import shutil
+from functools import partial
+from pathlib import Path
+from sys import stderr
+from time import perf_counter
+from typing import NamedTuple
+
+import itaxotools
+from itaxotools.common.utility import AttrDict
+
+from .metrics import StageMetrics, StageRecorder, stages_to_json
+from .store import DEFAULT_MEMORY_BUDGET
+from .tasks.haplodemo.types import NetworkAlgorithm, TreeContructionMethod
+
+
+class PipelineOptions(NamedTuple):
+    species: Path | None = None
+    spartition: str | None = None
+    phase: bool = True
+    stats: bool = True
+    network: bool = True
+    bulk_mode: bool = False
+    network_algorithm: NetworkAlgorithm = NetworkAlgorithm.TCS
+    tree_contruction_method: TreeContructionMethod = TreeContructionMethod.NJ
+    transversions_only: bool = False
+    epsilon: int = 0
+    search_seconds: int = 60
+    search_moves: int = 0
+    persistent_cache: bool = False
+    memory_budget: int = DEFAULT_MEMORY_BUDGET
+    strict: bool = False
+    verbose: bool = False
+    metrics: bool = False
+
+
+def get_pipeline_options(**kwargs) -> PipelineOptions:
+    """Same as PipelineOptions, but the enums may also be given by label"""
+    enums = {
+        "network_algorithm": NetworkAlgorithm,
+        "tree_contruction_method": TreeContructionMethod,
+    }
+    for key, enum in enums.items():
+        if isinstance(kwargs.get(key), str):
+            labels = {member.label: member for member in enum}
+            if kwargs[key] not in labels:
+                raise ValueError(f"Unknown value for {key}: {repr(kwargs[key])}")
+            kwargs[key] = labels[kwargs[key]]
+    return PipelineOptions(**kwargs)
+
+
+class PipelineResult(NamedTuple):
+    input: Path
+    outputs: list[Path]
+    warns: list[str]
+    seconds_taken: float
+    stages: tuple[StageMetrics, ...] = ()
+
+
+class PipelineAborted(Exception):
+    pass
+
+
+def _print_progress(name: str, captions: set[str], text: str, value=0, maximum=0):
+    if text not in captions:
+        captions.add(text)
+        print(f"{name}: {text}", file=stderr)
+
+
+def _get_feedback(warns: list[str], strict: bool, data: object):
+    """Warnings are collected and accepted, unless running in strict mode"""
+    if not isinstance(data, list):
+        return None
+    warns.extend(data)
+    return not strict
+
+
+def _abort():
+    raise PipelineAborted("Aborted due to warnings")
+
+
+def initialize_worker():
+    """
+    Install the functions that the task processes expect to find in the
+    worker namespace, so that they can run without the GUI worker loop.
+    """
+    itaxotools.progress_handler = lambda *args, **kwargs: None
+    itaxotools.get_feedback = lambda data: True
+    itaxotools.abort = _abort
+
+
+def get_output_paths(path: Path, output_dir: Path) -> AttrDict:
+    return AttrDict(
+        phased=output_dir / f"{path.stem}_phased{path.suffix}",
+        stats=output_dir / f"{path.stem}.stats.yaml",
+        network=output_dir / f"{path.stem}.network.yaml",
+        stages=output_dir / f"{path.stem}.stages.json",
+    )
+
+
+def _get_species_model(path: Path, options: PipelineOptions) -> AttrDict | None:
+    """Without a species file, use the subsets of the sequence file if any"""
+    from itaxotools.taxi2.file_types import FileFormat
+    from itaxotools.taxi_gui.model.partition import PartitionModel
+    from itaxotools.taxi_gui.tasks.common.process import get_file_info
+
+    if options.species is not None:
+        info = get_file_info(options.species)
+    else:
+        info = get_file_info(path)
+        if info.format == FileFormat.Tabfile:
+            headers = (info.header_species, info.header_genus, info.header_organism)
+            if not any(headers):
+                return None
+        elif info.format == FileFormat.Fasta:
+            if not info.has_subsets:
+                return None
+        else:
+            return None
+
+    model = PartitionModel.from_file_info(info, "species")
+    if options.spartition is not None and info.format == FileFormat.Spart:
+        if options.spartition not in info.spartitions:
+            raise ValueError(f"Spartition not found: {repr(options.spartition)}")
+        model.spartition = options.spartition
+    return model.as_dict()
+
+
+def _phase_sequences(path: Path, target: Path, work_dir: Path) -> Path:
+    from itaxotools.convphase_gui.task import process
+    from itaxotools.convphase_gui.task.input import InputModel
+    from itaxotools.convphase_gui.task.types import OutputFormat, Parameter
+    from itaxotools.taxi_gui.tasks.common.process import get_file_info
+
+    input_sequences = InputModel.from_file_info(get_file_info(path)).as_dict()
+    output_options = AttrDict(
+        format=OutputFormat.Mimic,
+        fasta_separator="|",
+        fasta_concatenate=False,
+    )
+    parameters = AttrDict({p.key: p.default for p in Parameter})
+
+    results = process.execute(work_dir, input_sequences, output_options, parameters)
+    shutil.copyfile(results.output_info.path, target)
+    return target
+
+
+def _compute_stats(
+    input_sequences: AttrDict,
+    input_species: AttrDict | None,
+    target: Path,
+    work_dir: Path,
+    options: PipelineOptions,
+    recorder: StageRecorder,
+) -> Path:
+    from itaxotools.taxi2.file_types import FileFormat
+
+    from .tasks.haplostats import process
+
+    bulk_mode = options.bulk_mode and input_species is not None
+    bulk_mode = bulk_mode and input_species.info.format == FileFormat.Spart
+
+    results = process.execute(work_dir, input_sequences, input_species, bulk_mode)
+    recorder.extend(results.stages, "stats: ")
+    shutil.copyfile(results.haplotype_stats, target)
+    return target
+
+
+def _compute_network(
+    input_sequences: AttrDict,
+    input_species: AttrDict | None,
+    target: Path,
+    work_dir: Path,
+    options: PipelineOptions,
+    recorder: StageRecorder,
+) -> Path:
+    from .tasks.haplodemo import process
+    from .tasks.haplodemo.work import get_network_dict
+    from .yamlify import yamlify
+
+    results = process.execute(
+        work_dir,
+        input_sequences,
+        input_species,
+        None,
+        options.tree_contruction_method,
+        options.network_algorithm,
+        options.transversions_only,
+        options.epsilon,
+        options.search_seconds,
+        options.search_moves,
+        options.persistent_cache,
+    )
+    recorder.extend(results.stages, "network: ")
+
+    data = get_network_dict(results.haplo_tree, results.haplo_graph)
+    data = {
+        "algorithm": options.network_algorithm.label,
+        **data,
+        "spartition": results.spartition,
+        "spartitions": results.spartitions,
+    }
+    target.write_text(yamlify(data))
+    return target
+
+
+def run_pipeline(
+    path: Path, output_dir: Path, work_dir: Path, options: PipelineOptions
+) -> PipelineResult:
+    """
+    Calls the same process functions as the GUI tasks. Sequences that are
+    not phased are phased first, unless phasing is turned off. Warnings
+    are collected in the result, or abort the pipeline in strict mode.
+    The metrics of every stage are kept in the result, and are also
+    written next to the outputs if requested.
+    """
+    from .model.phased_sequence import PhasedSequenceModel
+    from .tasks.common.work import get_phased_file_info
+
+    ts = perf_counter()
+
+    recorder = StageRecorder()
+    warns = []
+    itaxotools.get_feedback = partial(_get_feedback, warns, options.strict)
+    if options.verbose:
+        itaxotools.progress_handler = partial(_print_progress, path.name, set())
+
+    source = path
+    paths = get_output_paths(path, output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    outputs = []
+
+    phased_info = get_phased_file_info(path)
+    if options.phase and not phased_info.is_phased:
+        (work_dir / "phase").mkdir(parents=True)
+        with recorder.stage("phase"):
+            path = _phase_sequences(path, paths.phased, work_dir / "phase")
+        outputs.append(path)
+        phased_info = get_phased_file_info(path)
+
+    input_sequences = PhasedSequenceModel.from_file_info(
+        phased_info.info, phased_info.is_phased
+    ).as_dict()
+    input_sequences.use_cache = options.persistent_cache
+    input_sequences.memory_budget = options.memory_budget
+    input_species = _get_species_model(path, options)
+
+    if options.stats:
+        (work_dir / "stats").mkdir(parents=True)
+        outputs.append(
+            _compute_stats(
+                input_sequences,
+                input_species,
+                paths.stats,
+                work_dir / "stats",
+                options,
+                recorder,
+            )
+        )
+
+    if options.network:
+        (work_dir / "network").mkdir(parents=True)
+        outputs.append(
+            _compute_network(
+                input_sequences,
+                input_species,
+                paths.network,
+                work_dir / "network",
+                options,
+                recorder,
+            )
+        )
+
+    stages = tuple(recorder.stages)
+    if options.metrics:
+        paths.stages.write_text(stages_to_json(stages))
+        outputs.append(paths.stages)
+
+    tf = perf_counter()
+
+    return PipelineResult(source, outputs, warns, tf - ts, stages)
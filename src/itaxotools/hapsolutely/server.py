@@ -0,0 +1,409 @@
+# -----------------------------------------------------------------------------
+# Hapsolutely - Reconstruct haplotypes and produce genealogy graphs
+# Copyright (C) 2023  Patmanidis Stefanos
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+# -----------------------------------------------------------------------------
+
+
+"""Local job server for pipeline runs"""
+
+from __future__ import annotations
+
+import json
+import os
+import shutil
+import threading
+from concurrent.futures.process import BrokenProcessPool
+from hashlib import sha256
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from socketserver import ThreadingMixIn, UnixStreamServer
+from typing import Any
+
+from .batch import BatchJob, JobStatus
+from .pipeline import PipelineOptions, get_pipeline_options
+
+DEFAULT_PORT = 8021
+MAX_REQUEST_SIZE = 1024 * 2**20
+
+JOB_FILE = "job.json"
+
+_server_parameters = {"species", "verbose"}
+
+
+class ServerJob(BatchJob):
+    def __init__(self, id: str, path: Path, species: Path | None, options):
+        super().__init__(path, species)
+        self.id = id
+        self.options = options
+
+    @property
+    def output_dir(self) -> Path:
+        return self.path.parent.parent / "output"
+
+    def as_dict(self) -> dict[str, Any]:
+        result = self.result
+        return {
+            "id": self.id,
+            "status": self.status.value,
+            "attempts": self.attempts,
+            "error": self.error,
+            "seconds": result.seconds_taken if result else None,
+            "outputs": [path.name for path in result.outputs] if result else [],
+            "warnings": list(result.warns) if result else [],
+        }
+
+
+def _read_input(data: dict, key: str) -> tuple[str, bytes] | None:
+    """Inputs are given as objects with a file name and its text content"""
+    input = data.get(key)
+    if input is None:
+        return None
+    try:
+        name = Path(input["name"]).name
+        content = input["content"].encode("utf-8")
+    except (KeyError, TypeError, AttributeError):
+        raise ValueError(f"Input {repr(key)} must have a name and content")
+    if not name or name.startswith("."):
+        raise ValueError(f"Invalid file name for input {repr(key)}")
+    return name, content
+
+
+def get_job_key(
+    sequences: tuple[str, bytes],
+    species: tuple[str, bytes] | None,
+    options: PipelineOptions,
+) -> str:
+    """Digest of the input contents and the options that affect the outputs"""
+    digest = sha256()
+    for input in (sequences, species):
+        if input is None:
+            digest.update(b"\0")
+            continue
+        name, content = input
+        digest.update(name.encode("utf-8") + b"\0")
+        digest.update(sha256(content).digest())
+    fields = options._replace(species=None, verbose=False)
+    digest.update(repr(tuple(fields)).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class JobServer:
+    """
+    Jobs run the headless pipeline on a pool of at most max_workers
+    processes. They are stored under the root directory by the digest
+    of their inputs and parameters, so identical submissions share the
+    same job. Finished jobs are found again after a restart.
+    """
+
+    def __init__(self, root: Path, max_workers: int):
+        self.root = root
+        self.max_workers = max_workers
+        self.jobs: dict[str, ServerJob] = {}
+        self.lock = threading.Lock()
+        self.slots = threading.Semaphore(max_workers)
+        self.pending: list[ServerJob] = []
+        self.wakeup = threading.Condition(self.lock)
+        self.pool = None
+        self.executor = None
+        self.dispatcher = None
+        self.closed = False
+
+    def _start_pool(self):
+        from .pipeline import initialize_worker
+        from .tasks.common.work import process_pool
+
+        self.pool = process_pool(self.max_workers, initializer=initialize_worker)
+        self.executor = self.pool.__enter__()
+
+    def _stop_pool(self):
+        if self.executor is not None:
+            self.pool.__exit__(None, None, None)
+            self.executor = None
+
+    def start(self):
+        self._start_pool()
+        self.dispatcher = threading.Thread(target=self._dispatch, daemon=True)
+        self.dispatcher.start()
+
+    def close(self):
+        """Stop dispatching and wait for the running jobs to finish"""
+        with self.lock:
+            self.closed = True
+            self.wakeup.notify_all()
+        self.slots.release()
+        if self.dispatcher is not None:
+            self.dispatcher.join()
+        self._stop_pool()
+
+    def submit(self, data: dict) -> tuple[ServerJob, bool]:
+        """Returns the job and whether it was newly queued"""
+        sequences = _read_input(data, "sequences")
+        if sequences is None:
+            raise ValueError("Missing input: 'sequences'")
+        species = _read_input(data, "species")
+
+        parameters = data.get("parameters", {})
+        if not isinstance(parameters, dict):
+            raise ValueError("Parameters must be an object")
+        unknown = set(parameters) - (set(PipelineOptions._fields) - _server_parameters)
+        if unknown:
+            raise ValueError(f"Unknown parameters: {', '.join(sorted(unknown))}")
+        options = get_pipeline_options(**parameters)
+
+        id = get_job_key(sequences, species, options)
+        with self.lock:
+            job = self.jobs.get(id) or self._load_job(id)
+            if job is not None and job.status != JobStatus.Failed:
+                return job, False
+            previous = job
+            job = self._create_job(id, sequences, species, options)
+            if previous is not None:
+                # Later attempts use new work directories
+                job.attempts = previous.attempts
+            self.jobs[id] = job
+            self.pending.append(job)
+            self.wakeup.notify()
+        return job, True
+
+    def get(self, id: str) -> ServerJob | None:
+        with self.lock:
+            return self.jobs.get(id) or self._load_job(id)
+
+    def list(self) -> list[ServerJob]:
+        with self.lock:
+            return list(self.jobs.values())
+
+    def _get_job_dir(self, id: str) -> Path:
+        return self.root / "jobs" / id
+
+    def _create_job(
+        self,
+        id: str,
+        sequences: tuple[str, bytes],
+        species: tuple[str, bytes] | None,
+        options: PipelineOptions,
+    ) -> ServerJob:
+        job_dir = self._get_job_dir(id)
+        input_dir = job_dir / "input"
+        input_dir.mkdir(parents=True, exist_ok=True)
+        paths = []
+        for input in (sequences, species):
+            if input is None:
+                paths.append(None)
+                continue
+            name, content = input
+            path = input_dir / name
+            path.write_bytes(content)
+            paths.append(path)
+        (job_dir / JOB_FILE).unlink(missing_ok=True)
+        return ServerJob(id, paths[0], paths[1], options._replace(species=paths[1]))
+
+    def _load_job(self, id: str) -> ServerJob | None:
+        """Finished jobs are restored from their job file"""
+        from .pipeline import PipelineResult
+
+        if len(id) != 64 or any(c not in "0123456789abcdef" for c in id):
+            return None
+        try:
+            data = json.loads((self._get_job_dir(id) / JOB_FILE).read_text())
+            path = Path(data["input"])
+            job = ServerJob(id, path, None, None)
+            job.status = JobStatus.Done
+            job.attempts = data["attempts"]
+            job.result = PipelineResult(
+                path,
+                [job.output_dir / name for name in data["outputs"]],
+                data["warnings"],
+                data["seconds"],
+            )
+        except Exception:
+            return None
+        self.jobs[id] = job
+        return job
+
+    def _save_job(self, job: ServerJob):
+        data = job.as_dict() | {"input": str(job.path)}
+        path = self._get_job_dir(job.id) / JOB_FILE
+        path.write_text(json.dumps(data, indent=2))
+
+    def _dispatch(self):
+        """Submit pending jobs whenever a worker is free"""
+        from .pipeline import run_pipeline
+
+        while True:
+            self.slots.acquire()
+            with self.lock:
+                while not self.pending and not self.closed:
+                    self.wakeup.wait()
+                if self.closed:
+                    return
+                job = self.pending.pop(0)
+                job.attempts += 1
+                job.error = None
+                job.status = JobStatus.Running
+            work_dir = self._get_job_dir(job.id) / f"work_{job.attempts}"
+            # Failed jobs are not restored, a restart can leave stale attempts
+            shutil.rmtree(work_dir, ignore_errors=True)
+            args = (job.path, job.output_dir, work_dir, job.options)
+            try:
+                future = self.executor.submit(run_pipeline, *args)
+            except BrokenProcessPool:
+                # A worker died, the jobs it took along have already failed
+                self._stop_pool()
+                self._start_pool()
+                future = self.executor.submit(run_pipeline, *args)
+            future.add_done_callback(lambda future, job=job: self._collect(job, future))
+
+    def _collect(self, job: ServerJob, future):
+        try:
+            result = future.result()
+        except Exception as exception:
+            with self.lock:
+                job.error = str(exception) or type(exception).__name__
+                job.status = JobStatus.Failed
+        else:
+            with self.lock:
+                job.result = result
+                job.status = JobStatus.Done
+                self._save_job(job)
+        self.slots.release()
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    """
+    POST /jobs          submit a job, returns its status
+    GET /jobs           status of all jobs
+    GET /jobs/ID        status of a job
+    GET /jobs/ID/NAME   contents of an output file
+    """
+
+    server_version = "Hapsolutely"
+
+    def address_string(self) -> str:
+        return str(self.client_address[0]) if self.client_address else "local"
+
+    @property
+    def jobs(self) -> JobServer:
+        return self.server.jobs
+
+    def _send(self, code: int, body: bytes, content_type: str):
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, code: int, data: Any):
+        body = json.dumps(data, indent=2).encode("utf-8")
+        self._send(code, body, "application/json")
+
+    def _send_error(self, code: int, message: str):
+        self._send_json(code, {"error": message})
+
+    def do_GET(self):
+        parts = [part for part in self.path.split("?")[0].split("/") if part]
+        if parts == ["jobs"]:
+            self._send_json(200, [job.as_dict() for job in self.jobs.list()])
+            return
+        if len(parts) not in (2, 3) or parts[0] != "jobs":
+            self._send_error(404, "Not found")
+            return
+        job = self.jobs.get(parts[1])
+        if job is None:
+            self._send_error(404, "Job not found")
+            return
+        if len(parts) == 2:
+            self._send_json(200, job.as_dict())
+            return
+        outputs = {path.name: path for path in job.result.outputs} if job.result else {}
+        if parts[2] not in outputs:
+            self._send_error(404, "Output not found")
+            return
+        self._send(200, outputs[parts[2]].read_bytes(), "text/plain; charset=utf-8")
+
+    def do_POST(self):
+        if self.path.rstrip("/") != "/jobs":
+            self._send_error(404, "Not found")
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        if length > MAX_REQUEST_SIZE:
+            self._send_error(413, "Request too large")
+            return
+        try:
+            data = json.loads(self.rfile.read(length))
+            if not isinstance(data, dict):
+                raise ValueError("Request must be an object")
+            job, created = self.jobs.submit(data)
+        except (ValueError, TypeError) as exception:
+            self._send_error(400, str(exception))
+            return
+        self._send_json(202 if created else 200, job.as_dict())
+
+
+class UnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+    def get_request(self):
+        request, _ = super().get_request()
+        return request, ("local", 0)
+
+
+def run():
+    """Serve jobs on a local port or Unix socket until interrupted"""
+
+    from argparse import ArgumentParser
+
+    from .cache import get_user_cache_dir
+    from .tasks.common.work import get_pool_size
+
+    parser = ArgumentParser(
+        prog="hapsolutely-server", description="Local job server for Hapsolutely"
+    )
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="Local port")
+    parser.add_argument("--socket", type=Path, help="Serve on a Unix socket instead")
+    parser.add_argument(
+        "--root", type=Path, help="Directory for job inputs and outputs"
+    )
+    parser.add_argument("-j", "--jobs", type=int, help="Number of worker processes")
+    args = parser.parse_args()
+
+    root = args.root or get_user_cache_dir() / "server"
+    jobs = JobServer(root, args.jobs or get_pool_size(os.cpu_count() or 1))
+    jobs.start()
+
+    if args.socket is not None:
+        args.socket.unlink(missing_ok=True)
+        server = UnixHTTPServer(str(args.socket), RequestHandler)
+        address = args.socket
+    else:
+        server = ThreadingHTTPServer(("127.0.0.1", args.port), RequestHandler)
+        address = f"http://127.0.0.1:{args.port}"
+    server.jobs = jobs
+
+    print(f"Serving jobs on {address}, storing results in {root}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        jobs.close()
+        if args.socket is not None:
+            args.socket.unlink(missing_ok=True)
+
+
+if __name__ == "__main__":
+    run()
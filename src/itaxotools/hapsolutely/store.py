@@ -0,0 +1,129 @@
+# -----------------------------------------------------------------------------
+# Hapsolutely - Reconstruct haplotypes and produce genealogy graphs
+# Copyright (C) 2023  Patmanidis Stefanos
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+# -----------------------------------------------------------------------------
+
+from __future__ import annotations
+
+from pickle import PickleBuffer
+
+import numpy as np
+
+from itaxotools.taxi2.sequences import Sequence, Sequences
+
+DEFAULT_MEMORY_BUDGET = 2**30
+
+
+class _Missing:
+    """Placeholder for extras not defined by a sequence"""
+
+    def __reduce__(self):
+        return "_missing"
+
+
+_missing = _Missing()
+
+
+class SequenceStore(Sequences):
+    """
+    Sequences materialized in memory, so that they can be iterated
+    many times without replaying the parsers. Identifiers and extras are
+    kept as columns, while sequence data are kept in a single byte buffer.
+    When all sequences have the same length, the buffer is also exposed
+    as a fixed-width alignment matrix. The buffer may be memory-mapped.
+    """
+
+    def __init__(
+        self,
+        ids: list[str],
+        extras: dict[str, list[str]],
+        data: bytes | memoryview,
+        offsets: np.ndarray,
+    ):
+        super().__init__(self._iter_sequences)
+        self.ids = ids
+        self.extras = extras
+        self.data = data
+        self.offsets = offsets
+        self.buffer = np.frombuffer(data, dtype=np.uint8)
+
+    def __reduce_ex__(self, protocol: int):
+        data = PickleBuffer(self.data) if protocol >= 5 else bytes(self.data)
+        return (type(self), (self.ids, self.extras, data, self.offsets))
+
+    @classmethod
+    def from_sequences(cls, sequences: Sequences) -> SequenceStore:
+        ids = []
+        extras = {}
+        chunks = []
+        for index, sequence in enumerate(sequences):
+            ids.append(sequence.id)
+            for key in extras.keys() - sequence.extras.keys():
+                extras[key].append(_missing)
+            for key, value in sequence.extras.items():
+                if key not in extras:
+                    extras[key] = [_missing] * index
+                extras[key].append(value)
+            chunks.append(sequence.seq.encode("utf-8"))
+
+        offsets = np.zeros(len(chunks) + 1, dtype=np.int64)
+        np.cumsum([len(chunk) for chunk in chunks], out=offsets[1:])
+        return cls(ids, extras, b"".join(chunks), offsets)
+
+    def _iter_sequences(self) -> iter[Sequence]:
+        data = self.data
+        offsets = self.offsets.tolist()
+        columns = list(self.extras.items())
+        for index, id in enumerate(self.ids):
+            extras = {
+                key: column[index]
+                for key, column in columns
+                if column[index] is not _missing
+            }
+            seq = str(data[offsets[index] : offsets[index + 1]], "utf-8")
+            yield Sequence(id, seq, extras)
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def nbytes(self) -> int:
+        return self.buffer.nbytes + self.offsets.nbytes
+
+    @property
+    def is_aligned(self) -> bool:
+        lengths = np.diff(self.offsets)
+        return bool(len(lengths)) and bool(np.all(lengths == lengths[0]))
+
+    @property
+    def matrix(self) -> np.ndarray | None:
+        """Sequence bytes as rows of an alignment, or None if not aligned"""
+        if not self.is_aligned or self.buffer.max(initial=0) >= 0x80:
+            return None
+        return self.buffer.reshape(len(self.ids), -1)
+
+
+def get_materialized_sequences(
+    sequences: Sequences,
+    estimated_size: int,
+    memory_budget: int | None = DEFAULT_MEMORY_BUDGET,
+) -> Sequences:
+    """Keep streaming from the source if the sequences would exceed the budget"""
+    if isinstance(sequences, SequenceStore):
+        return sequences
+    if memory_budget is not None and estimated_size > memory_budget:
+        return sequences
+    return SequenceStore.from_sequences(sequences)
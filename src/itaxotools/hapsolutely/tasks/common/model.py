@@ -25,10 +25,12 @@ from pathlib import Path
 from itaxotools.common.bindings import Binder
 from itaxotools.common.utility import override
 from itaxotools.hapsolutely import app
+from itaxotools.hapsolutely.cancellation import CANCEL_GRACE_MS, request_cancel
 from itaxotools.taxi_gui import app as global_app
+from itaxotools.taxi_gui.loop import ReportProgress
 from itaxotools.taxi_gui.model.common import ItemModel
 from itaxotools.taxi_gui.model.input_file import InputFileModel
-from itaxotools.taxi_gui.model.tasks import SubtaskModel
+from itaxotools.taxi_gui.model.tasks import SubtaskModel, TaskModel
 from itaxotools.taxi_gui.tasks.common.model import DataFileProtocol, ImportedInputModel
 from itaxotools.taxi_gui.threading import ReportDone
 from itaxotools.taxi_gui.types import FileInfo, Notification
@@ -161,6 +163,8 @@ class PhasedItemProxyModel(QtCore.QAbstractProxyModel):
 
 
 class PhasedInputModel(ImportedInputModel):
+    phased_info_requested = QtCore.Signal(Path)
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         item_model = global_app.model.items
@@ -174,6 +178,13 @@ class PhasedInputModel(ImportedInputModel):
     def set_index_phased(self, index: QtCore.QModelIndex):
         if index == self.index:
             return
+        info = self._get_info_from_index(index)
+        if info is not None and info.path not in self.phased_table:
+            # Files not yet sniffed this session are sniffed by the worker,
+            # which adds them back through add_phased_info() when done
+            self.phased_info_requested.emit(info.path)
+            self.properties.index.update()
+            return
         try:
             object = self._cast_from_index_phased(index)
         except Exception:
@@ -186,15 +197,20 @@ class PhasedInputModel(ImportedInputModel):
         self._set_object(object)
         self.index = index
 
-    def _cast_from_index_phased(
-        self, index: QtCore.QModelIndex
-    ) -> DataFileProtocol | None:
+    def _get_info_from_index(self, index: QtCore.QModelIndex) -> FileInfo | None:
         if not index:
-            return
+            return None
         item = self.model.data(index, PhasedItemProxyModel.ItemRole)
         if not item:
             return None
-        info = item.object.info
+        return item.object.info
+
+    def _cast_from_index_phased(
+        self, index: QtCore.QModelIndex
+    ) -> DataFileProtocol | None:
+        info = self._get_info_from_index(index)
+        if info is None:
+            return None
         is_phased = self.phased_table[info.path]
         return self.cast_type.from_file_info(
             info, *self.cast_args, is_phased=is_phased, **self.cast_kwargs
@@ -215,3 +231,30 @@ class PhasedFileInfoSubtaskModel(SubtaskModel):
         app.is_path_phased[info.path] = is_phased
         self.done.emit(info)
         self.busy = False
+
+
+class CancellableTaskModel(TaskModel):
+    """
+    Stopping asks the computation in the work directory to cancel itself
+    at its next checkpoint, which keeps the worker process alive. If it is
+    still running after a grace period, or if stop is pressed again,
+    the worker is terminated instead.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.work_dir = None
+
+    def stop(self):
+        if self.work_dir is not None and request_cancel(self.work_dir):
+            self.progression.emit(ReportProgress("Cancelling..."))
+            work_dir = self.work_dir
+            QtCore.QTimer.singleShot(
+                CANCEL_GRACE_MS, lambda: self._stop_unresponsive(work_dir)
+            )
+            return
+        super().stop()
+
+    def _stop_unresponsive(self, work_dir: Path):
+        if self.busy and self.work_dir == work_dir:
+            super().stop()
@@ -18,22 +18,78 @@
 
 from __future__ import annotations
 
+import os
+import signal
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+from itertools import chain
+from multiprocessing import active_children, current_process, get_context
+from multiprocessing.process import BaseProcess
+from os import cpu_count
 from pathlib import Path
+from time import perf_counter
+from typing import Callable
+
+import numpy as np
 
 from itaxotools.common.utility import AttrDict
 from itaxotools.taxi2.file_types import FileFormat
 from itaxotools.taxi2.files import get_info
 from itaxotools.taxi2.handlers import FileHandler
 from itaxotools.taxi2.partitions import Partition
-from itaxotools.taxi2.sequences import SequenceHandler, Sequences
-from itaxotools.taxi_gui.tasks.common.process import partition_from_model
-
+from itaxotools.taxi2.sequences import Sequence, Sequences
+from itaxotools.taxi_gui.tasks.common.process import (
+    partition_from_model,
+    progress_handler,
+    sequences_from_model,
+)
+
+from ...cache import DEFAULT_CACHE_SIZE, DiskCache, get_file_key
+from ...cancellation import checkpoint
+from ...indexed_fasta import read_indexed_fasta
+from ...store import SequenceStore
 from .types import PhasedFileInfo
 
-
-def _guess_if_sequence_ids_include_alleles(sequences: Sequences) -> bool:
-    for sequence in sequences:
-        *segments, allele = sequence.id.split("_")
+SNIFF_MAX_RECORDS = 1000
+SNIFF_MAX_BYTES = 4 * 2**20
+SNIFF_CACHE_SIZE = 16 * 2**20
+
+# Cached inputs are memory-mapped back, larger ones are always parsed again
+INPUT_CACHE_MAX_SIZE = DEFAULT_CACHE_SIZE // 2
+
+PROGRESS_INTERVAL = 0.2
+
+
+def _iter_fasta_ids_from_prefix(
+    path: Path,
+    separator: str | None,
+    max_records: int | None,
+    max_bytes: int | None,
+) -> iter[str]:
+    """Yield the identifiers of the first records, skipping over sequence data"""
+    records = 0
+    size = 0
+    with open(path, "r") as handle:
+        for line in handle:
+            size += len(line)
+            if line.startswith(">"):
+                id = line[1:].rstrip()
+                if separator:
+                    id = id.split(separator, 1)[0]
+                yield id
+                records += 1
+                if max_records is not None and records >= max_records:
+                    return
+            if max_bytes is not None and size >= max_bytes:
+                return
+
+
+def _guess_if_sequence_ids_include_alleles(ids: iter[str]) -> bool:
+    for id in ids:
+        *segments, allele = id.split("_")
         if len(segments) < 1:
             return False
         if len(allele) > 1:
@@ -41,7 +97,32 @@ def _guess_if_sequence_ids_include_alleles(sequences: Sequences) -> bool:
     return True
 
 
-def get_phased_file_info(path: Path) -> PhasedFileInfo:
+def get_phased_file_info(
+    path: Path,
+    max_records: int | None = SNIFF_MAX_RECORDS,
+    max_bytes: int | None = SNIFF_MAX_BYTES,
+) -> PhasedFileInfo:
+    """
+    Phasing is guessed from a bounded prefix of FASTA files, so that opening
+    large files stays responsive. The tasks verify every identifier when
+    they start: missing alleles are reported by the haplodemo phasing check,
+    while haplostats fails to parse them or warns about unexpected alleles.
+    Results are kept in the user cache until the file is modified.
+    """
+    cache = DiskCache.from_namespace("sniff", SNIFF_CACHE_SIZE)
+    key = get_file_key(Path(path), max_records, max_bytes)
+    phased_info = cache.get(key)
+    if phased_info is None:
+        phased_info = _get_phased_file_info(path, max_records, max_bytes)
+        cache.put(key, phased_info)
+    return phased_info
+
+
+def _get_phased_file_info(
+    path: Path,
+    max_records: int | None,
+    max_bytes: int | None,
+) -> PhasedFileInfo:
     info = get_info(path)
     is_phased = False
 
@@ -50,95 +131,325 @@ def get_phased_file_info(path: Path) -> PhasedFileInfo:
         is_phased = bool("allele" in headers)
 
     elif info.format == FileFormat.Fasta:
-        sequences = Sequences.fromPath(
-            info.path,
-            SequenceHandler.Fasta,
-            parse_organism=info.has_subsets,
-            organism_separator=info.subset_separator,
-            organism_tag="organism",
-        )
-        is_phased = _guess_if_sequence_ids_include_alleles(sequences)
+        separator = info.subset_separator if info.has_subsets else None
+        ids = _iter_fasta_ids_from_prefix(info.path, separator, max_records, max_bytes)
+        is_phased = _guess_if_sequence_ids_include_alleles(ids)
 
     return PhasedFileInfo(info, is_phased)
 
 
-def scan_sequence_ambiguity(sequences: Sequences) -> list[str]:
-    ambiguity = set()
-    for sequence in sequences:
-        for character in sequence.seq:
-            if character.upper() not in "ACGT":
-                ambiguity.add(character)
-    if ambiguity:
-        codes = "".join(c for c in ambiguity)
-        return [f"Ambiguity codes detected: {repr(codes)}"]
-    return []
+class ProgressThrottle:
+    """
+    Same signature as progress_handler, but reports are only forwarded once
+    per interval, so that they can be sent from inside tight loops without
+    flooding the pipe to the GUI. The first and the final report always pass.
+    """
 
+    def __init__(
+        self,
+        handler: Callable[[str, int, int], None] = progress_handler,
+        interval: float = PROGRESS_INTERVAL,
+    ):
+        self.handler = handler
+        self.interval = interval
+        self.last = None
+
+    def __call__(self, caption: str, value: int, maximum: int):
+        now = perf_counter()
+        finished = maximum and value >= maximum
+        if finished or self.last is None or now - self.last >= self.interval:
+            self.last = now
+            self.handler(caption, value, maximum)
+
+
+class SequenceScanner(ABC):
+    """Inspect sequences one at a time and report any warnings at the end"""
+
+    @abstractmethod
+    def add(self, sequence: Sequence):
+        ...
+
+    def get_warns(self) -> list[str]:
+        return []
+
+
+_ambiguous_bytes = np.ones(256, dtype=bool)
+_ambiguous_bytes[np.frombuffer(b"ACGTacgt", dtype=np.uint8)] = False
+
+
+class AmbiguityScanner(SequenceScanner):
+    """Count non-ACGT symbols per sequence using a byte lookup table"""
+
+    def __init__(self):
+        self.ambiguity = set()
+        self.ambiguous_ids: dict[str, int] = {}
+
+    def add(self, sequence: Sequence):
+        if sequence.seq.isascii():
+            data = np.frombuffer(sequence.seq.encode("ascii"), dtype=np.uint8)
+            mask = _ambiguous_bytes[data]
+            count = int(np.count_nonzero(mask))
+            if count:
+                self.ambiguity.update(np.unique(data[mask]).tobytes().decode("ascii"))
+        else:
+            characters = [c for c in sequence.seq if c.upper() not in "ACGT"]
+            self.ambiguity.update(characters)
+            count = len(characters)
+
+        if count:
+            self.ambiguous_ids[sequence.id] = (
+                self.ambiguous_ids.get(sequence.id, 0) + count
+            )
+
+    def get_warns(self) -> list[str]:
+        if not self.ambiguity:
+            return []
+        codes = "".join(c for c in self.ambiguity)
+        ids = list(self.ambiguous_ids)
+        ids_str = ", ".join(repr(id) for id in ids[:3])
+        if len(ids) > 3:
+            ids_str += f" and {len(ids) - 3} more"
+        s = "s" if len(ids) > 1 else ""
+        return [f"Ambiguity codes detected: {repr(codes)} in individual{s}: {ids_str}"]
+
+
+class ProgressScanner(SequenceScanner):
+    """
+    Report the sequences read so far against the size of their file.
+    The bytes consumed are estimated from the identifiers, sequences and
+    extras of each record, and never exceed the file size.
+    """
 
-def match_partition_to_phased_sequences(
-    partition: Partition, sequences: Sequences, allele_header="allele"
-) -> tuple[Partition, list[str]]:
+    def __init__(self, caption: str, size: int, progress: ProgressThrottle = None):
+        self.caption = caption
+        self.size = size
+        self.progress = progress or ProgressThrottle()
+        self.consumed = 0
+
+    def add(self, sequence: Sequence):
+        self.consumed += len(sequence.id) + len(sequence.seq) + 3
+        for value in sequence.extras.values():
+            self.consumed += len(str(value)) + 1
+        self.progress(self.caption, min(self.consumed, self.size), self.size)
+
+    def done(self):
+        self.progress(self.caption, self.size, self.size)
+
+
+class PartitionIndex:
     """
     It is possible that the allele markers are suffixed to the
     individuals name in the partition but not the sequences, or vice versa.
-    Detect such mismatches and return a partition suitable for the sequences.
-    If some individuals could not be matched, return a warning.
-    """
+    Resolve each sequence to the partition key it corresponds to.
 
-    matched = dict()
-    unknowns = set()
+    Resolving only depends on which keys are assigned a subset, so results
+    are cached per key set and shared between partitions with the same keys,
+    such as all spartitions of the same SPART file.
+    """
 
-    def has_subset(index: str, partition: Partition) -> bool:
-        if index not in partition:
-            return False
-        if not partition[index]:
-            return False
-        return True
+    def __init__(self, allele_header="allele"):
+        self.allele_header = allele_header
+        self.candidates: dict[tuple[str, str | None], tuple[str, ...]] = {}
+        self.resolved: dict[frozenset[str], dict[tuple[str, str | None], str]] = {}
+
+    def _get_candidates(self, key: tuple[str, str | None]) -> tuple[str, ...]:
+        if key not in self.candidates:
+            id, allele = key
+            stripped_id = "_".join(id.split("_")[:-1])
+            candidates = (id, id[:-1], stripped_id)
+            if allele is not None:
+                candidates += (id + "_" + allele,)
+            self.candidates[key] = candidates
+        return self.candidates[key]
+
+    def get_resolver(self, partition: Partition) -> dict[tuple[str, str | None], str]:
+        """Return a mutable cache of resolved keys that fits the partition"""
+        keys = frozenset(key for key, subset in partition.items() if subset)
+        if keys not in self.resolved:
+            self.resolved[keys] = {}
+        return self.resolved[keys]
+
+    def resolve(
+        self,
+        sequence: Sequence,
+        partition: Partition,
+        resolver: dict[tuple[str, str | None], str],
+    ) -> str | None:
+        key = (sequence.id, sequence.extras.get(self.allele_header))
+        if key in resolver:
+            return resolver[key]
+
+        for candidate in self._get_candidates(key):
+            if partition.get(candidate):
+                resolver[key] = candidate
+                return candidate
+
+        resolver[key] = None
+        return None
+
+
+class PartitionMatcher(SequenceScanner):
+    """
+    Build a partition suitable for the sequences, as resolved by the index.
+    If some individuals could not be matched, return a warning.
+    """
 
-    for sequence in sequences:
-        if has_subset(sequence.id, partition):
-            matched[sequence.id] = partition[sequence.id]
-            continue
-
-        if has_subset(sequence.id[:-1], partition):
-            matched[sequence.id] = partition[sequence.id[:-1]]
-            continue
-
-        segments = sequence.id.split("_")[:-1]
-        stripped_id = "_".join(segments)
-        if has_subset(stripped_id, partition):
-            matched[sequence.id] = partition[stripped_id]
-            continue
-
-        if allele_header in sequence.extras:
-            allele = sequence.extras[allele_header]
-            suffixed_id = sequence.id + "_" + allele
-            if has_subset(suffixed_id, partition):
-                matched[sequence.id] = partition[suffixed_id]
-                continue
-
-        matched[sequence.id] = "unknown"
-        unknowns.add(sequence.id)
-
-    if unknowns:
-        unknowns = list(unknowns)
+    def __init__(
+        self,
+        partition: Partition | None,
+        allele_header="allele",
+        index: PartitionIndex | None = None,
+    ):
+        self.source = partition
+        self.index = index or PartitionIndex(allele_header)
+        self.resolver = None
+        if partition is not None:
+            self.resolver = self.index.get_resolver(partition)
+        self.partition = Partition()
+        self.unknowns = dict()
+
+    def match(self, sequence: Sequence) -> str | None:
+        key = self.index.resolve(sequence, self.source, self.resolver)
+        if key is None:
+            return None
+        return self.source[key]
+
+    def add(self, sequence: Sequence):
+        if self.source is None:
+            self.partition[sequence.id] = "unknown"
+            return
+
+        subset = self.match(sequence)
+        if subset is None:
+            subset = "unknown"
+            self.unknowns[sequence.id] = None
+        self.partition[sequence.id] = subset
+
+    def get_warns(self) -> list[str]:
+        if not self.unknowns:
+            return []
+        unknowns = list(self.unknowns)
         unknowns_str = ", ".join(repr(id) for id in unknowns[:3])
         if len(unknowns) > 3:
             unknowns_str += f" and {len(unknowns) - 3} more"
         s = "s" if len(unknowns) > 1 else ""
-        warns = [f"Could not match individual{s} to partition: {unknowns_str}"]
-    else:
-        warns = []
+        return [f"Could not match individual{s} to partition: {unknowns_str}"]
+
+
+def iter_scanned_sequences(
+    sequences: Sequences, scanners: list[SequenceScanner]
+) -> iter[Sequence]:
+    """Feed each sequence to all scanners before passing it on"""
+    for sequence in sequences:
+        checkpoint()
+        for scanner in scanners:
+            scanner.add(sequence)
+        yield sequence
+
+
+def scan_sequences(sequences: Sequences, scanners: list[SequenceScanner]) -> list[str]:
+    """Run all scanners in a single pass and gather their warnings in order"""
+    for _ in iter_scanned_sequences(sequences, scanners):
+        pass
+    return list(chain(*(scanner.get_warns() for scanner in scanners)))
+
+
+def _iter_sequences_with_progress(
+    sequences: Sequences, caption: str, size: int, progress: ProgressThrottle
+) -> iter[Sequence]:
+    scanner = ProgressScanner(caption, size, progress)
+    yield from iter_scanned_sequences(sequences, [scanner])
+    scanner.done()
 
-    return matched, warns
+
+def get_sequences_with_progress(
+    sequences: Sequences,
+    caption: str,
+    size: int,
+    progress: ProgressThrottle = None,
+) -> Sequences:
+    """Report progress against the file size every time the sequences are read"""
+    return Sequences(_iter_sequences_with_progress, sequences, caption, size, progress)
+
+
+def scan_sequence_ambiguity(sequences: Sequences) -> list[str]:
+    return scan_sequences(sequences, [AmbiguityScanner()])
+
+
+def match_partition_to_phased_sequences(
+    partition: Partition,
+    sequences: Sequences,
+    allele_header="allele",
+    index: PartitionIndex | None = None,
+) -> tuple[Partition, list[str]]:
+    matcher = PartitionMatcher(partition, allele_header, index)
+    warns = scan_sequences(sequences, [matcher])
+    return matcher.partition, warns
+
+
+def _get_parse_options(input: AttrDict) -> tuple:
+    if input.info.format == FileFormat.Fasta:
+        return (str(input.info.format), input.parse_subset, input.subset_separator)
+    return (str(input.info.format), input.index_column, input.sequence_column)
+
+
+def sequences_from_phased_model(
+    input: AttrDict, caption: str | None = None, progress: ProgressThrottle = None
+) -> Sequences:
+    """
+    If use_cache is set, parsed sequences are kept in the user cache,
+    keyed by the file and the parse options. Indexed files are not cached. If a caption is
+    given, progress is reported while the file is parsed.
+    """
+    sequences = _sequences_from_phased_model(input)
+    if caption is not None:
+        progress = progress or ProgressThrottle()
+        sequences = get_sequences_with_progress(
+            sequences, caption, input.info.size, progress
+        )
+
+    if (
+        not input.get("use_cache", False)
+        or input.get("use_index", False)
+        or input.info.size > INPUT_CACHE_MAX_SIZE
+    ):
+        return sequences
+
+    cache = DiskCache.from_namespace("inputs", mapped=True)
+    key = get_file_key(input.info.path, *_get_parse_options(input))
+    store = cache.get(key)
+    if store is None:
+        store = SequenceStore.from_sequences(sequences)
+        cache.put(key, store)
+    elif caption is not None:
+        progress(caption, input.info.size, input.info.size)
+    return store
+
+
+def _sequences_from_phased_model(input: AttrDict) -> Sequences:
+    """Large FASTA files are read through a memory-mapped index"""
+    if input.info.format == FileFormat.Fasta and input.get("use_index", False):
+        return read_indexed_fasta(
+            input.info.path,
+            parse_organism=input.parse_subset,
+            organism_separator=input.subset_separator,
+            organism_tag="organism",
+        )
+    return sequences_from_model(input)
+
+
+def get_partition_from_optional_model(
+    input_species: AttrDict | None,
+) -> Partition | None:
+    if input_species is None:
+        return None
+    return partition_from_model(input_species)
 
 
 def get_matched_partition_from_optional_model(
     input_species: AttrDict | None, sequences: Sequences
 ) -> tuple[Partition, list[str]]:
-    if input_species is None:
-        partition = Partition({sequence.id: "unknown" for sequence in sequences})
-        return partition, []
-    partition = partition_from_model(input_species)
+    partition = get_partition_from_optional_model(input_species)
     return match_partition_to_phased_sequences(partition, sequences)
 
 
@@ -185,3 +496,74 @@ def get_all_possible_partition_models(input: AttrDict) -> iter[AttrDict]:
         model = AttrDict(input)
         model.spartition = partition
         yield model
+
+
+def get_pool_size(jobs: int) -> int:
+    return max(1, min(cpu_count() or 1, jobs))
+
+
+def _init_pool_worker(initializer: Callable | None, initargs: tuple):
+    # Forked workers inherit the handler of their parent, see process_pool()
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    if initializer is not None:
+        initializer(*initargs)
+
+
+@contextmanager
+def process_pool(
+    max_workers: int, initializer: Callable | None = None, initargs: tuple = ()
+) -> iter[ProcessPoolExecutor]:
+    """
+    Tasks are executed on daemonic worker processes, which are not allowed
+    to have children of their own. Lift the flag while the pool is alive.
+
+    If the caller exits with an exception, such as a cancellation, pending
+    tasks are dropped and the workers are terminated instead of waited for.
+    The workers are also terminated if this process receives SIGTERM, which
+    is how the GUI stops an unresponsive task, so that they are not left
+    running on their own. This does not apply on Windows, where processes
+    are terminated without a signal.
+    """
+    context = get_context()
+    existing = set(active_children())
+    process = current_process()
+    daemon = process.daemon
+    process.daemon = False
+
+    def get_workers() -> list[BaseProcess]:
+        return [child for child in active_children() if child not in existing]
+
+    previous = None
+    if threading.current_thread() is threading.main_thread():
+        previous = signal.getsignal(signal.SIGTERM)
+
+        def on_terminate(signum, frame):
+            _terminate_workers(get_workers())
+            signal.signal(signum, previous or signal.SIG_DFL)
+            os.kill(os.getpid(), signum)
+
+        signal.signal(signal.SIGTERM, on_terminate)
+
+    try:
+        with ProcessPoolExecutor(
+            max_workers,
+            mp_context=context,
+            initializer=partial(_init_pool_worker, initializer, initargs),
+        ) as executor:
+            try:
+                yield executor
+            except BaseException:
+                executor.shutdown(wait=False, cancel_futures=True)
+                _terminate_workers(get_workers())
+                raise
+    finally:
+        if previous is not None:
+            signal.signal(signal.SIGTERM, previous)
+        process.daemon = daemon
+
+
+def _terminate_workers(workers: list[BaseProcess]):
+    for worker in workers:
+        worker.terminate()
+    for worker in workers:
+        worker.join()
@@ -26,23 +26,24 @@ from itaxotools.common.utility import override
 from itaxotools.haplodemo.types import HaploGraph, HaploTreeNode
 from itaxotools.hapsolutely.model.phased_sequence import PhasedSequenceModel
 from itaxotools.taxi_gui import app as global_app
-from itaxotools.taxi_gui.loop import DataQuery
+from itaxotools.taxi_gui.loop import DataQuery, ReportProgress
 from itaxotools.taxi_gui.model.common import ItemModel
 from itaxotools.taxi_gui.model.input_file import InputFileModel
 from itaxotools.taxi_gui.model.partition import PartitionModel
-from itaxotools.taxi_gui.model.tasks import SubtaskModel, TaskModel
+from itaxotools.taxi_gui.model.tasks import SubtaskModel
 from itaxotools.taxi_gui.model.tree import TreeModel
 from itaxotools.taxi_gui.tasks.common.model import ImportedInputModel
 from itaxotools.taxi_gui.types import FileFormat, Notification
 from itaxotools.taxi_gui.utility import human_readable_seconds
 
 from ..common.model import (
+    CancellableTaskModel,
     PhasedFileInfoSubtaskModel,
     PhasedInputModel,
     PhasedItemProxyModel,
 )
 from . import process, title
-from .types import NetworkAlgorithm, TreeContructionMethod
+from .types import NetworkAlgorithm, NetworkResult, TreeContructionMethod
 
 
 class TreeItemProxyModel(QtCore.QAbstractProxyModel):
@@ -177,16 +178,18 @@ class TreeInputModel(ImportedInputModel):
         self.method = self.model.data(index, role=TreeItemProxyModel.MethodRole)
 
 
-class Model(TaskModel):
+class Model(CancellableTaskModel):
     task_name = title
 
     request_confirmation = QtCore.Signal(object, object, object)
     haplo_ready = QtCore.Signal()
+    networks_changed = QtCore.Signal(list)
 
     haplo_tree = Property(HaploTreeNode, None)
     haplo_graph = Property(HaploGraph, None)
     spartitions = Property(dict, None)
     spartition = Property(str, None)
+    network_label = Property(str, None)
 
     can_lock_distances = Property(bool, False)
 
@@ -204,6 +207,13 @@ class Model(TaskModel):
 
     transversions_only = Property(bool, False)
     epsilon = Property(int, 0)
+    epsilon_max = Property(int, 9)
+    sweep_epsilon = Property(bool, False)
+    search_seconds = Property(int, 60)
+    search_moves = Property(int, 0)
+    persistent_cache = Property(bool, False)
+    compute_all = Property(bool, False)
+    uses_tree_search = Property(bool, False)
 
     input_is_phased = Property(bool, False)
     draw_haploweb_option = Property(bool, True)
@@ -213,6 +223,7 @@ class Model(TaskModel):
         super().__init__(name)
         self.can_open = True
         self.can_save = True
+        self.networks: dict[str, NetworkResult] = {}
 
         self.menu_open.add("network", "Open haplotype network", "Open previous results")
         self.menu_open.add("data", "Import sequences", "Import sequences & partitions")
@@ -252,6 +263,13 @@ class Model(TaskModel):
             self.properties.draw_haploweb_option, self.update_draw_haploweb
         )
 
+        self.binder.bind(
+            self.properties.network_algorithm, self.update_uses_tree_search
+        )
+        self.binder.bind(
+            self.input_tree.properties.method, self.update_uses_tree_search
+        )
+
         self.binder.bind(self.query, self.on_query)
 
         for handle in [
@@ -283,20 +301,51 @@ class Model(TaskModel):
         timestamp = datetime.now().strftime("%Y%m%dT%H%M%S")
         work_dir = self.temporary_path / timestamp
         work_dir.mkdir()
+        self.work_dir = work_dir
+
+        self.clear_networks()
+
+        input_sequences = self.input_sequences.as_dict()
+        input_sequences.use_cache = self.persistent_cache
+
+        if self.network_algorithm == NetworkAlgorithm.MJN and self.sweep_epsilon:
+            self.exec(
+                process.execute_sweep,
+                work_dir=work_dir,
+                input_sequences=input_sequences,
+                input_species=self.input_species.as_dict(),
+                epsilon=self.epsilon,
+                epsilon_max=self.epsilon_max,
+                persistent_cache=self.persistent_cache,
+            )
+            return
 
         self.exec(
-            process.execute,
+            process.execute_all if self.compute_all else process.execute,
             work_dir=work_dir,
-            input_sequences=self.input_sequences.as_dict(),
+            input_sequences=input_sequences,
             input_species=self.input_species.as_dict(),
             input_tree=self.input_tree.as_dict(),
             tree_contruction_method=self.input_tree.method,
             network_algorithm=self.network_algorithm,
             transversions_only=self.transversions_only,
             epsilon=self.epsilon,
+            search_seconds=self.search_seconds,
+            search_moves=self.search_moves,
+            persistent_cache=self.persistent_cache,
         )
 
+    def stop(self):
+        if self.work_dir is not None and process.request_search_stop(self.work_dir):
+            self.progression.emit(ReportProgress("Stopping tree search..."))
+            return
+        super().stop()
+
     def on_query(self, query: DataQuery):
+        if isinstance(query.data, NetworkResult):
+            self.add_network(query.data)
+            self.answer(True)
+            return
         warns = query.data
         if not warns:
             self.answer(True)
@@ -337,11 +386,21 @@ class Model(TaskModel):
     def update_draw_haploweb(self):
         self.draw_haploweb = self.input_is_phased and self.draw_haploweb_option
 
+    def update_uses_tree_search(self):
+        self.uses_tree_search = bool(
+            self.network_algorithm == NetworkAlgorithm.Fitchi
+            and self.input_tree.method == TreeContructionMethod.MP
+        )
+
     def onDone(self, report):
         time_taken = human_readable_seconds(report.result.seconds_taken)
+        summary = "".join(
+            f"\n- {network.description}" for network in report.result.networks
+        )
         self.notification.emit(
             Notification.Info(
                 f"{self.name} completed successfully!\nTime taken: {time_taken}."
+                + (f"\n\nNetworks computed:{summary}" if summary else "")
             )
         )
 
@@ -351,17 +410,50 @@ class Model(TaskModel):
         self.spartition = report.result.spartition
         self.input_network = Path()
 
+        for network in report.result.networks:
+            self.add_network(network)
+        self.network_label = next(
+            (
+                network.label
+                for network in report.result.networks
+                if network.haplo_tree is self.haplo_tree
+                and network.haplo_graph is self.haplo_graph
+            ),
+            None,
+        )
+
         self.can_lock_distances = bool(self.haplo_tree is not None)
 
         self.haplo_ready.emit()
         self.busy = False
         self.done = True
 
+    def add_network(self, network: NetworkResult):
+        self.networks[network.label] = network
+        self.networks_changed.emit(list(self.networks))
+
+    def clear_networks(self):
+        self.networks = {}
+        self.network_label = None
+        self.networks_changed.emit([])
+
+    def select_network(self, label: str):
+        """Show one of the networks computed by the last run"""
+        if label == self.network_label or label not in self.networks:
+            return
+        network = self.networks[label]
+        self.haplo_tree = network.haplo_tree
+        self.haplo_graph = network.haplo_graph
+        self.network_label = label
+        self.can_lock_distances = bool(self.haplo_tree is not None)
+        self.haplo_ready.emit()
+
     def clear(self):
         self.haplo_tree = None
         self.haplo_graph = None
         self.spartitions = None
         self.spartition = None
+        self.clear_networks()
         self.done = False
 
     def open(self, path: Path):
@@ -17,11 +17,84 @@
 # -----------------------------------------------------------------------------
 
 from pathlib import Path
-from time import perf_counter
 
 from itaxotools.common.utility import AttrDict
 
-from .types import NetworkAlgorithm, Results, TreeContructionMethod
+from ...cancellation import cancellable, checkpoint, install_token
+from ...metrics import StageRecorder
+from .types import (
+    NetworkAlgorithm,
+    NetworkParameters,
+    NetworkResult,
+    Results,
+    TreeContructionMethod,
+)
+
+SEARCH_RUNNING = "search.running"
+SEARCH_STOP = "search.stop"
+
+
+def request_search_stop(work_dir: Path) -> bool:
+    """
+    Ask a running tree search to finish early with its best tree so far.
+    Returns False if no search is running or if a stop was already requested.
+    """
+    if not (work_dir / SEARCH_RUNNING).exists():
+        return False
+    if (work_dir / SEARCH_STOP).exists():
+        return False
+    (work_dir / SEARCH_STOP).touch()
+    return True
+
+
+def _make_tree_mp_with_budget(
+    work_dir: Path, sequences, search_seconds: int, search_moves: int
+) -> tuple[str, bool]:
+    """
+    Also returns whether the tree can be reused for the same budget, which
+    is not the case if the search was stopped or ran out of time.
+    """
+    from time import perf_counter
+
+    from ..common.work import ProgressThrottle
+    from .work import make_tree_mp
+
+    progress = ProgressThrottle()
+
+    def callback(score: int, moves: int, seconds: float):
+        text = f"Searching for MP tree, score: {score}"
+        if search_seconds:
+            value = min(int(seconds), search_seconds)
+            progress(text, value, search_seconds)
+        elif search_moves:
+            progress(text, moves, search_moves)
+        else:
+            progress(text, 0, 0)
+
+    running = work_dir / SEARCH_RUNNING
+    stop = work_dir / SEARCH_STOP
+    stopped = False
+
+    def should_stop() -> bool:
+        nonlocal stopped
+        stopped = stop.exists()
+        return stopped
+
+    running.touch()
+    start = perf_counter()
+    try:
+        newick_string = make_tree_mp(
+            sequences,
+            max_seconds=search_seconds,
+            max_moves=search_moves,
+            should_stop=should_stop,
+            callback=callback,
+        )
+        timed_out = bool(search_seconds) and (perf_counter() - start >= search_seconds)
+        return newick_string, not (stopped or timed_out)
+    finally:
+        running.unlink(missing_ok=True)
+        stop.unlink(missing_ok=True)
 
 
 def initialize():
@@ -35,125 +108,513 @@ def initialize():
     from . import work  # noqa
 
 
-def execute(
-    work_dir: Path,
+def _init_network_worker(work_dir: Path):
+    import itaxotools
+
+    itaxotools.progress_handler = lambda *args, **kwargs: None
+    install_token(work_dir)
+
+
+def _prepare_inputs(
     input_sequences: AttrDict,
     input_species: AttrDict,
     input_tree: AttrDict,
-    tree_contruction_method: TreeContructionMethod,
-    network_algorithm: NetworkAlgorithm,
-    transversions_only: bool,
-    epsilon: int,
-) -> tuple[Path, float]:
-    from itaxotools import abort, get_feedback
-    from itaxotools.popart_networks import (
-        Sequence,
-        build_mjn,
-        build_msn,
-        build_tcs,
-        build_tsw,
-    )
-    from itaxotools.taxi_gui.tasks.common.process import (
-        progress_handler,
-        sequences_from_model,
+    network_algorithms: list[NetworkAlgorithm],
+    recorder: StageRecorder,
+) -> AttrDict:
+    """Load and validate the inputs, returning them along with any warnings"""
+    from itaxotools.hapsolutely.store import (
+        DEFAULT_MEMORY_BUDGET,
+        get_materialized_sequences,
     )
 
     from ..common.work import (
         check_is_input_phased,
         get_matched_partition_from_optional_model,
         scan_sequence_ambiguity,
+        sequences_from_phased_model,
     )
     from .work import (
         append_alleles_to_sequence_ids,
         get_newick_string_from_tree,
         get_tree_from_model,
-        make_haplo_graph,
-        make_haplo_tree,
-        make_tree_mp,
-        make_tree_nj,
-        prune_alleles_from_haplo_graph,
-        prune_alleles_from_haplo_tree,
-        prune_alleles_from_spartitions,
-        retrieve_spartitions,
         validate_sequences_in_tree,
     )
 
-    haplo_tree = None
-    haplo_graph = None
+    with recorder.stage("sequence read") as stage:
+        sequences = sequences_from_phased_model(input_sequences, "Reading sequences")
+        sequences = get_materialized_sequences(
+            sequences,
+            input_sequences.info.size,
+            input_sequences.get("memory_budget", DEFAULT_MEMORY_BUDGET),
+        )
+        stage.items = len(sequences)
 
-    ts = perf_counter()
+    with recorder.stage("ambiguity scan") as stage:
+        sequence_warns = scan_sequence_ambiguity(sequences)
+        stage.items = len(sequences)
 
-    progress_handler("Computing network", 0, 0)
+    with recorder.stage("allele check") as stage:
+        is_phased, phased_warns = check_is_input_phased(input_sequences, sequences)
+        sequences, allele_warns = append_alleles_to_sequence_ids(
+            input_sequences, sequences
+        )
+        stage.items = len(sequences)
 
-    sequences = sequences_from_model(input_sequences)
-    sequence_warns = scan_sequence_ambiguity(sequences)
+    with recorder.stage("partition match") as stage:
+        partition, partition_warns = get_matched_partition_from_optional_model(
+            input_species, sequences
+        )
+        stage.items = len(partition)
 
-    is_phased, phased_warns = check_is_input_phased(input_sequences, sequences)
+    newick_string = None
+    if NetworkAlgorithm.Fitchi in network_algorithms and input_tree is not None:
+        with recorder.stage("tree read"):
+            tree = get_tree_from_model(input_tree)
+            tree_warns = validate_sequences_in_tree(sequences, tree)
+            newick_string = get_newick_string_from_tree(tree)
+    else:
+        tree_warns = []
 
-    sequences, allele_warns = append_alleles_to_sequence_ids(input_sequences, sequences)
+    warns = sequence_warns + phased_warns + allele_warns + partition_warns + tree_warns
 
-    partition, partition_warns = get_matched_partition_from_optional_model(
-        input_species, sequences
+    return AttrDict(
+        sequences=sequences,
+        partition=partition,
+        is_phased=is_phased,
+        newick_string=newick_string,
+        warns=warns,
     )
 
-    if network_algorithm == NetworkAlgorithm.Fitchi and input_tree is not None:
-        tree = get_tree_from_model(input_tree)
-        tree_warns = validate_sequences_in_tree(sequences, tree)
-    else:
-        tree_warns = []
 
-    warns = sequence_warns + phased_warns + allele_warns + partition_warns + tree_warns
+def compute_network(
+    work_dir: Path,
+    sequences,
+    partition: dict[str, str],
+    is_phased: bool,
+    newick_string: str | None,
+    parameters: NetworkParameters,
+    persistent_cache: bool = False,
+) -> NetworkResult:
+    """Build a single network, or load it from the result cache"""
+    from itaxotools.popart_networks import (
+        Sequence,
+        build_mjn,
+        build_msn,
+        build_tcs,
+        build_tsw,
+    )
+    from itaxotools.taxi_gui.tasks.common.process import progress_handler
 
-    tm = perf_counter()
+    from ..common.work import ProgressThrottle
+    from .work import (
+        get_cached_result,
+        get_network_size,
+        get_result_caches,
+        get_result_key,
+        make_haplo_graph,
+        make_haplo_tree,
+        make_tree_nj,
+        prune_alleles_from_haplo_graph,
+        prune_alleles_from_haplo_tree,
+        put_cached_result,
+    )
 
-    if warns:
-        answer = get_feedback(warns)
-        if not answer:
-            abort()
+    recorder = StageRecorder()
 
-    tx = perf_counter()
+    if parameters.network_algorithm == NetworkAlgorithm.Fitchi:
+        phases = [
+            "Checking result cache",
+            "Constructing tree",
+            "Computing haplotype genealogy",
+            "Pruning alleles",
+        ]
+    else:
+        phases = [
+            "Checking result cache",
+            f"Building {parameters.network_algorithm.label} network",
+            "Converting network",
+            "Pruning alleles",
+        ]
+
+    def report_phase(index: int):
+        checkpoint()
+        text = f"{parameters.label}: {phases[index]}"
+        progress_handler(text, index, len(phases))
 
-    if network_algorithm == NetworkAlgorithm.Fitchi:
-        if input_tree is None:
-            if tree_contruction_method == TreeContructionMethod.MP:
-                newick_string = make_tree_mp(sequences)
-            elif tree_contruction_method == TreeContructionMethod.NJ:
-                newick_string = make_tree_nj(sequences)
-        else:
-            newick_string = get_newick_string_from_tree(tree)
-        haplo_tree = make_haplo_tree(
-            sequences, partition, newick_string, transversions_only
+    haplo_tree = None
+    haplo_graph = None
+    reusable = True
+
+    report_phase(0)
+    with recorder.stage("result cache lookup"):
+        result_caches = get_result_caches(work_dir, persistent_cache)
+        result_key = get_result_key(
+            sequences,
+            partition,
+            *parameters.get_result_parameters(newick_string),
+            is_phased,
         )
+        cached = get_cached_result(result_caches, result_key)
+
+    if cached is not None:
+        haplo_tree, haplo_graph = cached
+    elif parameters.network_algorithm == NetworkAlgorithm.Fitchi:
+        if newick_string is None:
+            report_phase(1)
+            with recorder.stage("tree construction") as stage:
+                if parameters.tree_contruction_method == TreeContructionMethod.MP:
+                    newick_string, reusable = _make_tree_mp_with_budget(
+                        work_dir,
+                        sequences,
+                        parameters.search_seconds,
+                        parameters.search_moves,
+                    )
+                elif parameters.tree_contruction_method == TreeContructionMethod.NJ:
+                    progress = ProgressThrottle()
+                    newick_string = make_tree_nj(
+                        sequences,
+                        lambda joins, total: progress(
+                            f"{parameters.label}: Joining neighbours", joins, total
+                        ),
+                    )
+                stage.items = len(sequences)
+
+        report_phase(2)
+        with recorder.stage("network build"):
+            haplo_tree = make_haplo_tree(
+                sequences, partition, newick_string, parameters.transversions_only
+            )
 
         if is_phased:
-            prune_alleles_from_haplo_tree(haplo_tree)
+            report_phase(3)
+            with recorder.stage("allele pruning"):
+                prune_alleles_from_haplo_tree(haplo_tree)
     else:
         build_method, args = {
             NetworkAlgorithm.MSN: (build_msn, []),
-            NetworkAlgorithm.MJN: (build_mjn, [epsilon]),
+            NetworkAlgorithm.MJN: (build_mjn, [parameters.epsilon]),
             NetworkAlgorithm.TCS: (build_tcs, []),
             NetworkAlgorithm.TSW: (build_tsw, []),
-        }[network_algorithm]
+        }[parameters.network_algorithm]
 
-        popart_sequences = (
-            Sequence(sequence.id, sequence.seq, partition.get(sequence.id, "unknown"))
-            for sequence in sequences
-        )
+        def iter_popart_sequences():
+            for sequence in sequences:
+                checkpoint()
+                subset = partition.get(sequence.id, "unknown")
+                yield Sequence(sequence.id, sequence.seq, subset)
+
+        report_phase(1)
+        with recorder.stage("network build") as stage:
+            graph = build_method(iter_popart_sequences(), *args)
+            stage.items = len(sequences)
 
-        graph = build_method(popart_sequences, *args)
+        report_phase(2)
+        with recorder.stage("graph conversion"):
+            haplo_graph = make_haplo_graph(graph)
 
-        haplo_graph = make_haplo_graph(graph)
+        if is_phased:
+            report_phase(3)
+            with recorder.stage("allele pruning"):
+                prune_alleles_from_haplo_graph(haplo_graph)
+
+    if cached is None and reusable:
+        with recorder.stage("result cache store"):
+            put_cached_result(result_caches, result_key, (haplo_tree, haplo_graph))
+
+    node_count, edge_count = get_network_size(haplo_tree, haplo_graph)
+
+    return NetworkResult(
+        parameters.label,
+        haplo_tree,
+        haplo_graph,
+        recorder.seconds_taken,
+        node_count,
+        edge_count,
+        tuple(recorder.stages),
+    )
+
+
+def _get_spartitions(
+    input_species: AttrDict, sequences, is_phased: bool, recorder: StageRecorder
+):
+    from .work import prune_alleles_from_spartitions, retrieve_spartitions
+
+    with recorder.stage("spartition retrieval") as stage:
+        spartitions, spartition = retrieve_spartitions(input_species, sequences)
 
         if is_phased:
-            prune_alleles_from_haplo_graph(haplo_graph)
+            spartitions = prune_alleles_from_spartitions(spartitions)
+        stage.items = len(spartitions)
+
+    return spartitions, spartition
+
+
+@cancellable
+def execute(
+    work_dir: Path,
+    input_sequences: AttrDict,
+    input_species: AttrDict,
+    input_tree: AttrDict,
+    tree_contruction_method: TreeContructionMethod,
+    network_algorithm: NetworkAlgorithm,
+    transversions_only: bool,
+    epsilon: int,
+    search_seconds: int = 0,
+    search_moves: int = 0,
+    persistent_cache: bool = False,
+) -> tuple[Path, float]:
+    from itaxotools import abort, get_feedback
+    from itaxotools.taxi_gui.tasks.common.process import progress_handler
+
+    recorder = StageRecorder()
+
+    progress_handler("Computing network", 0, 0)
+
+    inputs = _prepare_inputs(
+        input_sequences, input_species, input_tree, [network_algorithm], recorder
+    )
+
+    if inputs.warns:
+        answer = get_feedback(inputs.warns)
+        if not answer:
+            abort()
 
-    spartitions, spartition = retrieve_spartitions(input_species, sequences)
+    parameters = NetworkParameters(
+        network_algorithm,
+        tree_contruction_method if input_tree is None else None,
+        transversions_only,
+        epsilon,
+        search_seconds,
+        search_moves,
+    )
 
-    if is_phased:
-        spartitions = prune_alleles_from_spartitions(spartitions)
+    result = compute_network(
+        work_dir,
+        inputs.sequences,
+        inputs.partition,
+        inputs.is_phased,
+        inputs.newick_string,
+        parameters,
+        persistent_cache,
+    )
+    recorder.extend(result.stages)
+
+    spartitions, spartition = _get_spartitions(
+        input_species, inputs.sequences, inputs.is_phased, recorder
+    )
 
     progress_handler("Computing network", 1, 1)
 
-    tf = perf_counter()
+    return Results(
+        result.haplo_tree,
+        result.haplo_graph,
+        spartitions,
+        spartition,
+        recorder.seconds_taken,
+        stages=tuple(recorder.stages),
+    )
+
+
+def _compute_networks_in_parallel(
+    work_dir: Path,
+    inputs: AttrDict,
+    jobs: list[NetworkParameters],
+    persistent_cache: bool,
+) -> tuple[NetworkResult, ...]:
+    """
+    Each network is sent to the model as a NetworkResult query as soon as
+    it is ready. Results are returned in the order of the jobs. Workers
+    watch the same work directory, so they are cancelled along with us.
+    """
+    from concurrent.futures import FIRST_COMPLETED, wait
+
+    from itaxotools import get_feedback
+    from itaxotools.taxi_gui.tasks.common.process import progress_handler
+
+    from ...cancellation import CHECK_INTERVAL
+    from ..common.work import get_pool_size, process_pool
+
+    results = {}
+    progress_handler("Computing networks", 0, len(jobs))
+    with process_pool(
+        get_pool_size(len(jobs)),
+        initializer=_init_network_worker,
+        initargs=(work_dir,),
+    ) as executor:
+        futures = {
+            executor.submit(
+                compute_network,
+                work_dir,
+                inputs.sequences,
+                inputs.partition,
+                inputs.is_phased,
+                inputs.newick_string,
+                parameters,
+                persistent_cache,
+            ): parameters
+            for parameters in jobs
+        }
+        pending = set(futures)
+        while pending:
+            finished, pending = wait(
+                pending, timeout=CHECK_INTERVAL, return_when=FIRST_COMPLETED
+            )
+            checkpoint()
+            for future in finished:
+                result = future.result()
+                results[futures[future]] = result
+                get_feedback(result)
+                progress_handler(
+                    f"Computed {result.description}", len(results), len(jobs)
+                )
+
+    return tuple(results[parameters] for parameters in jobs)
+
+
+@cancellable
+def execute_all(
+    work_dir: Path,
+    input_sequences: AttrDict,
+    input_species: AttrDict,
+    input_tree: AttrDict,
+    tree_contruction_method: TreeContructionMethod,
+    network_algorithm: NetworkAlgorithm,
+    transversions_only: bool,
+    epsilon: int,
+    search_seconds: int = 0,
+    search_moves: int = 0,
+    persistent_cache: bool = False,
+) -> tuple[Path, float]:
+    """
+    Compute a network for every algorithm on a pool of worker processes.
+    The network of the selected algorithm is shown first.
+    """
+    from itaxotools import abort, get_feedback
+    from itaxotools.taxi_gui.tasks.common.process import progress_handler
+
+    recorder = StageRecorder()
+
+    progress_handler("Computing networks", 0, 0)
+
+    inputs = _prepare_inputs(
+        input_sequences, input_species, input_tree, list(NetworkAlgorithm), recorder
+    )
+
+    if inputs.warns:
+        answer = get_feedback(inputs.warns)
+        if not answer:
+            abort()
+
+    if input_tree is not None:
+        tree_contruction_method = None
+
+    jobs = [
+        NetworkParameters(
+            algorithm,
+            tree_contruction_method,
+            transversions_only,
+            epsilon,
+            search_seconds,
+            search_moves,
+        )
+        for algorithm in NetworkAlgorithm
+        if algorithm != NetworkAlgorithm.Fitchi
+        or tree_contruction_method is not None
+        or inputs.newick_string is not None
+    ]
+
+    with recorder.stage("network pool") as stage:
+        networks = _compute_networks_in_parallel(
+            work_dir, inputs, jobs, persistent_cache
+        )
+        stage.items = len(jobs)
+
+    selected = next(
+        (
+            network
+            for parameters, network in zip(jobs, networks)
+            if parameters.network_algorithm == network_algorithm
+        ),
+        networks[0],
+    )
+
+    spartitions, spartition = _get_spartitions(
+        input_species, inputs.sequences, inputs.is_phased, recorder
+    )
+
+    # Worker stages overlap the pool stage, so they are left out of the total
+    seconds_taken = recorder.seconds_taken
+    for network in networks:
+        recorder.extend(network.stages, f"{network.label}: ")
+
+    return Results(
+        selected.haplo_tree,
+        selected.haplo_graph,
+        spartitions,
+        spartition,
+        seconds_taken,
+        networks,
+        tuple(recorder.stages),
+    )
+
+
+@cancellable
+def execute_sweep(
+    work_dir: Path,
+    input_sequences: AttrDict,
+    input_species: AttrDict,
+    epsilon: int,
+    epsilon_max: int,
+    persistent_cache: bool = False,
+) -> tuple[Path, float]:
+    """
+    Compute median joining networks for every epsilon in the given range
+    on a pool of worker processes. The network for the first epsilon is
+    shown first, and the rest can be picked from the results.
+    """
+    from itaxotools import abort, get_feedback
+    from itaxotools.taxi_gui.tasks.common.process import progress_handler
+
+    recorder = StageRecorder()
+
+    progress_handler("Computing networks", 0, 0)
+
+    inputs = _prepare_inputs(
+        input_sequences, input_species, None, [NetworkAlgorithm.MJN], recorder
+    )
+
+    if inputs.warns:
+        answer = get_feedback(inputs.warns)
+        if not answer:
+            abort()
 
-    return Results(haplo_tree, haplo_graph, spartitions, spartition, tm - ts + tf - tx)
+    jobs = [
+        NetworkParameters(NetworkAlgorithm.MJN, None, False, value)
+        for value in range(epsilon, max(epsilon, epsilon_max) + 1)
+    ]
+
+    with recorder.stage("network pool") as stage:
+        networks = _compute_networks_in_parallel(
+            work_dir, inputs, jobs, persistent_cache
+        )
+        stage.items = len(jobs)
+
+    spartitions, spartition = _get_spartitions(
+        input_species, inputs.sequences, inputs.is_phased, recorder
+    )
+
+    # Worker stages overlap the pool stage, so they are left out of the total
+    seconds_taken = recorder.seconds_taken
+    for network in networks:
+        recorder.extend(network.stages, f"{network.label}: ")
+
+    return Results(
+        networks[0].haplo_tree,
+        networks[0].haplo_graph,
+        spartitions,
+        spartition,
+        seconds_taken,
+        networks,
+        tuple(recorder.stages),
+    )
@@ -21,6 +21,25 @@ from typing import NamedTuple
 
 from itaxotools.haplodemo.types import HaploGraph, HaploTreeNode
 
+from ...metrics import StageMetrics
+
+
+class NetworkResult(NamedTuple):
+    label: str
+    haplo_tree: HaploTreeNode | None
+    haplo_graph: HaploGraph | None
+    seconds_taken: float
+    node_count: int = 0
+    edge_count: int = 0
+    stages: tuple[StageMetrics, ...] = ()
+
+    @property
+    def description(self) -> str:
+        return (
+            f"{self.label}: {self.node_count} nodes, {self.edge_count} edges, "
+            f"{self.seconds_taken:.2f}s"
+        )
+
 
 class Results(NamedTuple):
     haplo_tree: HaploTreeNode
@@ -28,6 +47,8 @@ class Results(NamedTuple):
     spartitions: dict[str, dict[str, str]]
     spartition: str | None
     seconds_taken: float
+    networks: tuple[NetworkResult, ...] = ()
+    stages: tuple[StageMetrics, ...] = ()
 
 
 class NetworkAlgorithm(Enum):
@@ -43,9 +64,46 @@ class NetworkAlgorithm(Enum):
 
 
 class TreeContructionMethod(Enum):
-    MP = "MP", "Maximum Parsimony (slow)"
+    MP = "MP", "Maximum Parsimony (bounded search)"
     NJ = "NJ", "Neighbour Joining (fast)"
 
     def __init__(self, label, description):
         self.label = label
         self.description = description
+
+
+class NetworkParameters(NamedTuple):
+    network_algorithm: NetworkAlgorithm
+    tree_contruction_method: TreeContructionMethod | None
+    transversions_only: bool
+    epsilon: int
+    search_seconds: int = 0
+    search_moves: int = 0
+
+    @property
+    def label(self) -> str:
+        if self.network_algorithm == NetworkAlgorithm.Fitchi:
+            if self.tree_contruction_method is None:
+                return "Fitchi (input tree)"
+            return f"Fitchi ({self.tree_contruction_method.label})"
+        if self.network_algorithm == NetworkAlgorithm.MJN:
+            return f"MJN (epsilon {self.epsilon})"
+        return self.network_algorithm.label
+
+    def get_result_parameters(self, newick_string: str | None = None) -> tuple:
+        """Only the parameters used by the algorithm, to identify its result"""
+        if self.network_algorithm == NetworkAlgorithm.Fitchi:
+            if newick_string is not None:
+                tree_source = (newick_string,)
+            elif self.tree_contruction_method == TreeContructionMethod.MP:
+                tree_source = (
+                    self.tree_contruction_method,
+                    self.search_seconds,
+                    self.search_moves,
+                )
+            else:
+                tree_source = (self.tree_contruction_method,)
+            return (self.network_algorithm, *tree_source, self.transversions_only)
+        if self.network_algorithm == NetworkAlgorithm.MJN:
+            return (self.network_algorithm, self.epsilon)
+        return (self.network_algorithm,)
@@ -296,6 +296,12 @@ class HaploView(QtWidgets.QFrame):
         toggle_scale = SideToggleButton("Scale")
         toggle_scale.setIcon(icons.scale.resource)
 
+        network_selector = QtWidgets.QComboBox()
+
+        network_frame = CategoryFrame("Network")
+        network_frame.addWidget(network_selector)
+        network_frame.setVisible(False)
+
         partition_frame = CategoryFrame("Species partition")
         partition_frame.addWidget(partition_selector)
 
@@ -329,6 +335,7 @@ class HaploView(QtWidgets.QFrame):
         sidebar_layout = QtWidgets.QVBoxLayout()
         sidebar_layout.setContentsMargins(8, 12, 8, 12)
         sidebar_layout.setSpacing(12)
+        sidebar_layout.addWidget(network_frame)
         sidebar_layout.addWidget(partition_frame)
         sidebar_layout.addWidget(edit_frame)
         sidebar_layout.addWidget(appearance_frame)
@@ -373,6 +380,8 @@ class HaploView(QtWidgets.QFrame):
 
         self.partition_frame = partition_frame
         self.partition_selector = partition_selector
+        self.network_frame = network_frame
+        self.network_selector = network_selector
 
         self.binder = Binder()
 
@@ -597,6 +606,40 @@ class TransversionsOnlySelector(Card):
         self.controls.title.setChecked(checked)
 
 
+class ComputeAllSelector(Card):
+    toggled = QtCore.Signal(bool)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+
+        title = QtWidgets.QCheckBox("  Compute all:")
+        title.setStyleSheet("""font-size: 16px;""")
+        title.toggled.connect(self.toggled)
+        title.setMinimumWidth(180)
+
+        description = QtWidgets.QLabel(
+            "Build the networks of all algorithms in parallel and switch between "
+            "them after computation (default: off)."
+        )
+        description.setStyleSheet("""padding-top: 2px;""")
+        description.setWordWrap(True)
+
+        contents = QtWidgets.QHBoxLayout()
+        contents.addWidget(title)
+        contents.addWidget(description, 1)
+        contents.setSpacing(16)
+
+        layout = QtWidgets.QHBoxLayout()
+        layout.addLayout(contents, 1)
+        layout.addSpacing(80)
+        self.addLayout(layout)
+
+        self.controls.title = title
+
+    def setChecked(self, checked: bool):
+        self.controls.title.setChecked(checked)
+
+
 class EpsilonSelector(Card):
     def __init__(self, parent=None):
         super().__init__(parent)
@@ -623,7 +666,72 @@ class EpsilonSelector(Card):
         layout.setSpacing(16)
         self.addLayout(layout)
 
+        sweep = QtWidgets.QCheckBox("Sweep up to:")
+        sweep.setMinimumWidth(140)
+
+        sweep_description = QtWidgets.QLabel(
+            "Compute a network for each epsilon in range, in parallel, "
+            "and pick one after comparing their sizes."
+        )
+        sweep_description.setStyleSheet("""padding-top: 2px;""")
+        sweep_description.setWordWrap(True)
+
+        sweep_max = QtWidgets.QSpinBox()
+        sweep_max.setFixedWidth(80)
+        sweep_max.setMinimum(0)
+        sweep_max.setMaximum(9)
+        sweep.toggled.connect(sweep_max.setEnabled)
+        sweep_max.setEnabled(False)
+
+        sweep_layout = QtWidgets.QHBoxLayout()
+        sweep_layout.addWidget(sweep)
+        sweep_layout.addWidget(sweep_description, 1)
+        sweep_layout.addWidget(sweep_max)
+        sweep_layout.setSpacing(16)
+        self.addLayout(sweep_layout)
+
         self.controls.epsilon = control
+        self.controls.sweep = sweep
+        self.controls.sweep_max = sweep_max
+
+
+class SearchBudgetSelector(Card):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+
+        title = QtWidgets.QLabel("Search budget:")
+        title.setStyleSheet("""font-size: 16px;""")
+        title.setMinimumWidth(140)
+
+        description = QtWidgets.QLabel(
+            "Stop the MP tree search after this many seconds or moves and keep "
+            "the best tree found so far. Set to zero for no limit (default: 60s)."
+        )
+        description.setStyleSheet("""padding-top: 2px;""")
+        description.setWordWrap(True)
+
+        seconds = QtWidgets.QSpinBox()
+        seconds.setFixedWidth(80)
+        seconds.setMinimum(0)
+        seconds.setMaximum(86400)
+        seconds.setSuffix("s")
+
+        moves = QtWidgets.QSpinBox()
+        moves.setFixedWidth(130)
+        moves.setMinimum(0)
+        moves.setMaximum(1000000)
+        moves.setSuffix(" moves")
+
+        layout = QtWidgets.QHBoxLayout()
+        layout.addWidget(title)
+        layout.addWidget(description, 1)
+        layout.addWidget(seconds)
+        layout.addWidget(moves)
+        layout.setSpacing(16)
+        self.addLayout(layout)
+
+        self.controls.seconds = seconds
+        self.controls.moves = moves
 
 
 class HaplowebSelector(Card):
@@ -710,7 +818,9 @@ class View(TaskView):
         )
         self.cards.draw_haploweb = HaplowebSelector(self)
         self.cards.network_algorithm = NetworkAlgorithmSelector(self)
+        self.cards.compute_all = ComputeAllSelector(self)
         self.cards.input_tree = InputSelector("Fitchi tree", self)
+        self.cards.search_budget = SearchBudgetSelector(self)
         self.cards.transversions_only = TransversionsOnlySelector(self)
         self.cards.epsilon = EpsilonSelector(self)
 
@@ -739,7 +849,7 @@ class View(TaskView):
 
         self.binder.bind(object.notification, self.showNotification)
         self.binder.bind(object.request_confirmation, self.requestConfirmation)
-        self.binder.bind(object.progression, self.cards.progress.showProgress)
+        self.binder.bind(object.progression, self.showProgress)
         self.binder.bind(object.properties.done, self.setDone)
 
         self.binder.bind(object.properties.name, self.cards.title.setTitle)
@@ -773,6 +883,56 @@ class View(TaskView):
             lambda algo: algo == NetworkAlgorithm.MJN,
         )
 
+        self.binder.bind(self.cards.compute_all.toggled, object.properties.compute_all)
+        self.binder.bind(
+            object.properties.compute_all, self.cards.compute_all.setChecked
+        )
+
+        self.binder.bind(object.networks_changed, self.set_network_labels)
+        self.binder.bind(object.properties.network_label, self.set_network_label)
+        self.binder.bind(
+            self.haplo_view.network_selector.activated,
+            object.select_network,
+            lambda index: self.haplo_view.network_selector.itemData(index),
+        )
+
+        self.binder.bind(
+            self.cards.epsilon.controls.sweep.toggled, object.properties.sweep_epsilon
+        )
+        self.binder.bind(
+            object.properties.sweep_epsilon,
+            self.cards.epsilon.controls.sweep.setChecked,
+        )
+        self.binder.bind(
+            self.cards.epsilon.controls.sweep_max.valueChanged,
+            object.properties.epsilon_max,
+        )
+        self.binder.bind(
+            object.properties.epsilon_max,
+            self.cards.epsilon.controls.sweep_max.setValue,
+        )
+
+        self.binder.bind(
+            self.cards.search_budget.controls.seconds.valueChanged,
+            object.properties.search_seconds,
+        )
+        self.binder.bind(
+            object.properties.search_seconds,
+            self.cards.search_budget.controls.seconds.setValue,
+        )
+        self.binder.bind(
+            self.cards.search_budget.controls.moves.valueChanged,
+            object.properties.search_moves,
+        )
+        self.binder.bind(
+            object.properties.search_moves,
+            self.cards.search_budget.controls.moves.setValue,
+        )
+        self.binder.bind(
+            object.properties.uses_tree_search,
+            self.cards.search_budget.roll_animation.setAnimatedVisible,
+        )
+
         self.binder.bind(
             self.cards.transversions_only.toggled, object.properties.transversions_only
         )
@@ -836,6 +996,7 @@ class View(TaskView):
     def _bind_phased_input_selector(self, card, object, subtask):
         self.binder.bind(card.addInputFile, subtask.start)
         self.binder.bind(card.indexChanged, object.set_index_phased)
+        self.binder.bind(object.phased_info_requested, subtask.start)
         self.binder.bind(object.properties.model, card.set_model)
         self.binder.bind(object.properties.index, card.set_index)
         self.binder.bind(object.properties.object, card.bind_object)
@@ -871,6 +1032,26 @@ class View(TaskView):
         else:
             abort()
 
+    def set_network_labels(self, labels: list[str]):
+        selector = self.haplo_view.network_selector
+        selector.clear()
+        for label in labels:
+            network = self.object.networks[label]
+            selector.addItem(label, label)
+            selector.setItemData(
+                selector.count() - 1, network.description, QtCore.Qt.ToolTipRole
+            )
+        self.set_network_label(self.object.network_label)
+        self.haplo_view.network_frame.setVisible(len(labels) > 1)
+
+    def set_network_label(self, label: str | None):
+        selector = self.haplo_view.network_selector
+        selector.setCurrentIndex(selector.findData(label))
+
+    def showProgress(self, report):
+        self.cards.progress.showProgress(report)
+        self.cards.progress.setFormat(f"{report.text} (%p%)")
+
     def setDone(self, done):
         widget = self.haplo_view if done else self.area
         self.stack.setCurrentWidget(widget)
@@ -882,7 +1063,9 @@ class View(TaskView):
         self.cards.input_species.setEnabled(editable)
         self.cards.draw_haploweb.setEnabled(editable)
         self.cards.network_algorithm.setEnabled(editable)
+        self.cards.compute_all.setEnabled(editable)
         self.cards.input_tree.setEnabled(editable)
+        self.cards.search_budget.setEnabled(editable)
         self.cards.transversions_only.setEnabled(editable)
         self.cards.epsilon.setEnabled(editable)
         self.haplo_view.setEnabled(not editable)
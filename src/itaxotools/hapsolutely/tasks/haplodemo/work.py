@@ -19,21 +19,15 @@
 from __future__ import annotations
 
 from collections import Counter
+from functools import partial
+from hashlib import sha256
 from io import StringIO
+from pathlib import Path
+from typing import Any, Callable
 
-from Bio.Align import MultipleSeqAlignment
 from Bio.Phylo import NewickIO
 from Bio.Phylo.BaseTree import Clade
 from Bio.Phylo.BaseTree import Tree as BioTree
-from Bio.Phylo.TreeConstruction import (
-    DistanceCalculator,
-    DistanceTreeConstructor,
-    NNITreeSearcher,
-    ParsimonyScorer,
-    ParsimonyTreeConstructor,
-)
-from Bio.Seq import Seq
-from Bio.SeqRecord import SeqRecord
 
 from itaxotools.common.utility import AttrDict
 from itaxotools.convphase.phase import iter_phase
@@ -52,11 +46,22 @@ from itaxotools.taxi2.sequences import Sequence, Sequences
 from itaxotools.taxi2.trees import Tree, Trees
 from itaxotools.taxi_gui.tasks.common.process import partition_from_model
 
+from ...cache import DiskCache
+from ...distances import (
+    DistanceMetric,
+    encode_alignment,
+    get_cached_distance_matrix,
+)
+from ...neighbor_joining import neighbor_joining
+from ...parsimony import get_parsimony_tree
 from ..common.work import (
+    PartitionIndex,
     get_all_possible_partition_models,
     match_partition_to_phased_sequences,
 )
 
+RESULT_CACHE_SIZE = 256 * 2**20
+
 
 def phase_sequences(sequences: Sequences) -> Sequences:
     unphased = (UnphasedSequence(x.id, x.seq) for x in sequences)
@@ -101,23 +106,82 @@ def _tree_to_string(tree: BioTree) -> str:
     return _format_newick_for_fitchi(newick_string)
 
 
-def make_tree_mp(sequences: Sequences) -> str:
-    scorer = ParsimonyScorer()
-    searcher = NNITreeSearcher(scorer)
-    constructor = ParsimonyTreeConstructor(searcher)
-
-    align = MultipleSeqAlignment([SeqRecord(Seq(x.seq), id=x.id) for x in sequences])
-    tree = constructor.build_tree(align)
+def collapse_haplotypes(sequences: Sequences) -> dict[str, list[Sequence]]:
+    """Group identical sequences, keyed by the id of the first member"""
+    haplotypes: dict[str, list[Sequence]] = {}
+    for sequence in sequences:
+        haplotypes.setdefault(sequence.seq, []).append(sequence)
+    return {members[0].id: members for members in haplotypes.values()}
+
+
+def _expand_haplotypes(tree: BioTree, haplotypes: dict[str, list[Sequence]]):
+    """Polytomies are resolved as zero-length ladders, since taxi2 trees are binary"""
+    for clade in tree.get_terminals():
+        members = haplotypes.get(clade.name, [])
+        for member in members[1:]:
+            clade.clades = [Clade(0.0, clade.name), Clade(0.0, member.id)]
+            clade.name = None
+            clade = clade.clades[0]
+
+
+def _make_tree_from_haplotypes(
+    sequences: Sequences, build_tree: Callable[[Sequences], BioTree]
+) -> str:
+    """Build the tree over distinct haplotypes, then attach duplicates as polytomies"""
+    haplotypes = collapse_haplotypes(sequences)
+    if len(haplotypes) > 1:
+        representatives = Sequences(
+            [Sequence(id, members[0].seq) for id, members in haplotypes.items()]
+        )
+        tree = build_tree(representatives)
+    else:
+        tree = BioTree(Clade(name=next(iter(haplotypes), None)))
+    _expand_haplotypes(tree, haplotypes)
     return _tree_to_string(tree)
 
 
-def make_tree_nj(sequences: Sequences) -> str:
-    calculator = DistanceCalculator("identity")
-    constructor = DistanceTreeConstructor(calculator, "nj")
+def _build_tree_mp(sequences: Sequences, **kwargs) -> BioTree:
+    ids, matrix = encode_alignment(sequences)
+    distances = get_cached_distance_matrix(matrix, DistanceMetric.Identity)
+    start = neighbor_joining(ids, distances)
+    return get_parsimony_tree(ids, matrix, start, **kwargs)
+
+
+def _build_tree_nj(
+    sequences: Sequences, callback: Callable[[int, int], None] | None = None
+) -> BioTree:
+    ids, matrix = encode_alignment(sequences)
+    distances = get_cached_distance_matrix(matrix, DistanceMetric.Identity)
+    return neighbor_joining(ids, distances, callback)
+
+
+def make_tree_mp(
+    sequences: Sequences,
+    max_seconds: float = 0,
+    max_moves: int = 0,
+    should_stop: Callable[[], bool] | None = None,
+    callback: Callable[[int, int, float], None] | None = None,
+) -> str:
+    """The search stops early on budget or request, keeping the best tree so far"""
+    return _make_tree_from_haplotypes(
+        sequences,
+        partial(
+            _build_tree_mp,
+            max_seconds=max_seconds,
+            max_moves=max_moves,
+            should_stop=should_stop,
+            callback=callback,
+        ),
+    )
 
-    align = MultipleSeqAlignment([SeqRecord(Seq(x.seq), id=x.id) for x in sequences])
-    tree = constructor.build_tree(align)
-    return _tree_to_string(tree)
+
+def make_tree_nj(
+    sequences: Sequences, callback: Callable[[int, int], None] | None = None
+) -> str:
+    """The callback receives the number of joins done and the total"""
+    return _make_tree_from_haplotypes(
+        sequences, partial(_build_tree_nj, callback=callback)
+    )
 
 
 def get_tree_from_model(model: AttrDict) -> Tree:
@@ -155,6 +219,67 @@ def make_haplo_tree(
     return compute_fitchi_tree(sequence_dict, partition, tree, transversions_only)
 
 
+def get_network_size(
+    haplo_tree: HaploTreeNode | None, haplo_graph: HaploGraph | None
+) -> tuple[int, int]:
+    """Return the number of nodes and edges of either kind of network"""
+    if haplo_graph is not None:
+        return len(haplo_graph.nodes), len(haplo_graph.edges)
+    if haplo_tree is None:
+        return 0, 0
+    nodes = 0
+    stack = [haplo_tree]
+    while stack:
+        node = stack.pop()
+        nodes += 1
+        stack.extend(node.children)
+    return nodes, nodes - 1
+
+
+def _get_node_dict(node: HaploTreeNode | HaploGraphNode) -> dict:
+    return {
+        "id": node.id,
+        "weight": node.get_size(),
+        "pops": dict(sorted(node.pops.items())),
+        "members": sorted(node.members),
+    }
+
+
+def get_network_dict(
+    haplo_tree: HaploTreeNode | None, haplo_graph: HaploGraph | None
+) -> dict:
+    """
+    Nodes and edges of either kind of network as plain data. Haplotype
+    genealogies also keep their root, with edges pointing to the children.
+    """
+    if haplo_graph is not None:
+        nodes = haplo_graph.nodes
+        return {
+            "root": None,
+            "nodes": [_get_node_dict(node) for node in nodes],
+            "edges": [
+                {
+                    "u": nodes[edge.node_a].id,
+                    "v": nodes[edge.node_b].id,
+                    "mutations": edge.mutations,
+                }
+                for edge in haplo_graph.edges
+            ],
+        }
+    if haplo_tree is None:
+        return {"root": None, "nodes": [], "edges": []}
+    nodes = []
+    edges = []
+    stack = [haplo_tree]
+    while stack:
+        node = stack.pop()
+        nodes.append(_get_node_dict(node))
+        for child in node.children:
+            edges.append({"u": node.id, "v": child.id, "mutations": child.mutations})
+        stack.extend(reversed(node.children))
+    return {"root": haplo_tree.id, "nodes": nodes, "edges": edges}
+
+
 def make_haplo_graph(graph: Network) -> HaploGraph:
     digits = len(str(len(graph.vertices))) + 1
 
@@ -238,11 +363,51 @@ def retrieve_spartitions(
         return {}, None
     if input.info.format != FileFormat.Spart:
         return {}, None
+    index = PartitionIndex()
     models = get_all_possible_partition_models(input)
     spartitions = {model.spartition: partition_from_model(model) for model in models}
     spartitions = {
-        name: match_partition_to_phased_sequences(partition, sequences)[0]
+        name: match_partition_to_phased_sequences(partition, sequences, index=index)[0]
         for name, partition in spartitions.items()
     }
     spartitions = {name: dict(partition) for name, partition in spartitions.items()}
     return spartitions, input.spartition
+
+
+def get_result_key(sequences: Sequences, partition: Partition, *parameters: Any) -> str:
+    """Digest of the sequences, the partition and the parameters of a run"""
+    digest = sha256()
+    for sequence in sequences:
+        digest.update(f"{sequence.id}\t{sequence.seq}\n".encode("utf-8"))
+    digest.update(b"\0")
+    for id, subset in sorted(partition.items()):
+        digest.update(f"{id}\t{subset}\n".encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(repr(parameters).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def get_result_caches(work_dir: Path, persistent: bool = False) -> list[DiskCache]:
+    """
+    Results are cached next to the work directories of the task, which only
+    last as long as the session, and optionally in the user cache directory.
+    """
+    caches = [DiskCache(work_dir.parent / "results", RESULT_CACHE_SIZE)]
+    if persistent:
+        caches.append(DiskCache.from_namespace("results", RESULT_CACHE_SIZE))
+    return caches
+
+
+def get_cached_result(caches: list[DiskCache], key: str) -> Any:
+    for index, cache in enumerate(caches):
+        result = cache.get(key)
+        if result is not None:
+            for faster in caches[:index]:
+                faster.put(key, result)
+            return result
+    return None
+
+
+def put_cached_result(caches: list[DiskCache], key: str, result: Any):
+    for cache in caches:
+        cache.put(key, result)
@@ -26,11 +26,12 @@ from itaxotools.common.bindings import Property
 from itaxotools.hapsolutely.model.phased_sequence import PhasedSequenceModel
 from itaxotools.taxi_gui.loop import DataQuery
 from itaxotools.taxi_gui.model.partition import PartitionModel
-from itaxotools.taxi_gui.model.tasks import SubtaskModel, TaskModel
+from itaxotools.taxi_gui.model.tasks import SubtaskModel
 from itaxotools.taxi_gui.types import FileFormat, Notification
 from itaxotools.taxi_gui.utility import human_readable_seconds
 
 from ..common.model import (
+    CancellableTaskModel,
     PhasedFileInfoSubtaskModel,
     PhasedInputModel,
     PhasedItemProxyModel,
@@ -38,7 +39,7 @@ from ..common.model import (
 from . import process, title
 
 
-class Model(TaskModel):
+class Model(CancellableTaskModel):
     task_name = title
 
     request_confirmation = QtCore.Signal(object, object, object)
@@ -54,6 +55,7 @@ class Model(TaskModel):
     )
 
     bulk_mode = Property(bool, False)
+    bulk_parallel = Property(bool, False)
 
     def __init__(self, name=None):
         super().__init__(name)
@@ -105,6 +107,7 @@ class Model(TaskModel):
         timestamp = datetime.now().strftime("%Y%m%dT%H%M%S")
         work_dir = self.temporary_path / timestamp
         work_dir.mkdir()
+        self.work_dir = work_dir
 
         self.exec(
             process.execute,
@@ -112,6 +115,7 @@ class Model(TaskModel):
             input_sequences=self.input_sequences.as_dict(),
             input_species=self.input_species.as_dict(),
             bulk_mode=self.bulk_mode,
+            bulk_parallel=self.bulk_parallel,
         )
 
     def on_query(self, query: DataQuery):
@@ -16,12 +16,12 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 # -----------------------------------------------------------------------------
 
-from itertools import chain
 from pathlib import Path
-from time import perf_counter
 
 from itaxotools.common.utility import AttrDict
 
+from ...cancellation import cancellable
+from ...metrics import StageRecorder
 from .types import Results
 
 
@@ -32,11 +32,13 @@ def initialize():
     from . import work  # noqa
 
 
+@cancellable
 def execute(
     work_dir: Path,
     input_sequences: AttrDict,
     input_species: AttrDict,
     bulk_mode: bool,
+    bulk_parallel: bool = False,
 ) -> tuple[Path, float]:
     if not bulk_mode:
         return execute_single(
@@ -49,6 +51,7 @@ def execute(
             work_dir=work_dir,
             input_sequences=input_sequences,
             input_species=input_species,
+            parallel=bulk_parallel,
         )
 
 
@@ -60,61 +63,57 @@ def execute_single(
     from itaxotools import abort, get_feedback
     from itaxotools.taxi_gui.tasks.common.process import progress_handler
 
-    from ..common.work import (
-        get_matched_partition_from_optional_model,
-        scan_sequence_ambiguity,
-    )
+    from ..common.work import get_partition_from_optional_model
     from .work import (
         get_sequences_from_phased_model,
-        scan_sequence_alleles,
+        get_stats_from_sequences,
         write_stats_to_path,
     )
 
     haplotype_stats = work_dir / "out"
 
-    ts = perf_counter()
+    recorder = StageRecorder()
 
     progress_handler("Computing statistics", 0, 0)
 
     is_phased = input_sequences.is_phased
     is_partitioned = input_species is not None
 
-    sequences = get_sequences_from_phased_model(input_sequences)
-    ambiguity_warns = scan_sequence_ambiguity(sequences)
-
-    allele_warns = scan_sequence_alleles(sequences) if is_phased else []
-
-    partition, partition_warns = get_matched_partition_from_optional_model(
-        input_species, sequences
-    )
+    with recorder.stage("partition read") as stage:
+        partition = get_partition_from_optional_model(input_species)
+        stage.items = len(partition) if partition is not None else None
 
-    warns = ambiguity_warns + allele_warns + partition_warns
-
-    tm = perf_counter()
+    # Parsing, ambiguity scan, allele checks and partition match share a pass
+    with recorder.stage("scan and bundle") as stage:
+        sequences = get_sequences_from_phased_model(
+            input_sequences, "Reading sequences"
+        )
+        stats, warns = get_stats_from_sequences(sequences, is_phased, partition)
+        stage.items = len(stats.indexer)
 
     if warns:
         answer = get_feedback(warns)
         if not answer:
             abort()
 
-    tx = perf_counter()
+    progress_handler("Writing statistics", 0, 0)
 
     partition_name = input_species.partition_name if is_partitioned else "unknown"
-    write_stats_to_path(
-        sequences, is_phased, is_partitioned, partition, partition_name, haplotype_stats
-    )
+    with recorder.stage("output write"):
+        write_stats_to_path(
+            stats, is_phased, is_partitioned, partition_name, haplotype_stats
+        )
 
     progress_handler("Computing statistics", 1, 1)
 
-    tf = perf_counter()
-
-    return Results(haplotype_stats, tm - ts + tf - tx)
+    return Results(haplotype_stats, recorder.seconds_taken, tuple(recorder.stages))
 
 
 def execute_bulk(
     work_dir: Path,
     input_sequences: AttrDict,
     input_species: AttrDict,
+    parallel: bool = False,
 ) -> tuple[Path, float]:
     from itaxotools import abort, get_feedback
     from itaxotools.taxi_gui.tasks.common.process import (
@@ -123,56 +122,79 @@ def execute_bulk(
     )
 
     from ..common.work import (
+        AmbiguityScanner,
+        PartitionIndex,
+        ProgressThrottle,
         get_all_possible_partition_models,
         match_partition_to_phased_sequences,
-        scan_sequence_ambiguity,
+        scan_sequences,
     )
     from .work import (
+        AlleleScanner,
+        HaplotypeTable,
         get_sequences_from_phased_model,
-        scan_sequence_alleles,
         write_bulk_stats_to_path,
     )
 
     haplotype_stats = work_dir / "out"
 
-    ts = perf_counter()
+    recorder = StageRecorder()
 
     progress_handler("Computing statistics", 0, 0)
 
     is_phased = input_sequences.is_phased
     names = input_species.info.spartitions
 
-    sequences = get_sequences_from_phased_model(input_sequences)
-    ambiguity_warns = scan_sequence_ambiguity(sequences)
-
-    allele_warns = scan_sequence_alleles(sequences) if is_phased else []
-
-    models = get_all_possible_partition_models(input_species)
-    partitions = (partition_from_model(model) for model in models)
-    partitions, partition_warns = zip(
-        *(
-            match_partition_to_phased_sequences(partition, sequences)
-            for partition in partitions
+    # Parsing, ambiguity scan and allele checks share a pass
+    with recorder.stage("sequence scan") as stage:
+        sequences = get_sequences_from_phased_model(
+            input_sequences, "Reading sequences"
         )
-    )
-
-    partition_warns = list(set(chain(*partition_warns)))
 
-    warns = ambiguity_warns + allele_warns + partition_warns
-
-    tm = perf_counter()
+        table = HaplotypeTable()
+        scanners = [AmbiguityScanner()]
+        if is_phased:
+            scanners += [AlleleScanner()]
+        scanners += [table]
+        sequence_warns = scan_sequences(sequences, scanners)
+        stage.items = len(table.records)
+
+    with recorder.stage("partition match") as stage:
+        index = PartitionIndex()
+        models = get_all_possible_partition_models(input_species)
+        partitions = []
+        partition_warns = []
+        for model in models:
+            progress_handler("Matching partitions", len(partitions), len(names))
+            partition, warns = match_partition_to_phased_sequences(
+                partition_from_model(model), table.records, index=index
+            )
+            partitions.append(partition)
+            partition_warns.extend(warns)
+        stage.items = len(partitions)
+
+    partition_warns = list(set(partition_warns))
+
+    warns = sequence_warns + partition_warns
 
     if warns:
         answer = get_feedback(warns)
         if not answer:
             abort()
 
-    tx = perf_counter()
-
-    write_bulk_stats_to_path(sequences, is_phased, partitions, names, haplotype_stats)
+    throttle = ProgressThrottle()
+    with recorder.stage("output write") as stage:
+        write_bulk_stats_to_path(
+            table,
+            is_phased,
+            partitions,
+            names,
+            haplotype_stats,
+            parallel,
+            lambda count: throttle("Writing statistics", count, len(partitions)),
+        )
+        stage.items = len(partitions)
 
     progress_handler("Computing statistics", 1, 1)
 
-    tf = perf_counter()
-
-    return Results(haplotype_stats, tm - ts + tf - tx)
+    return Results(haplotype_stats, recorder.seconds_taken, tuple(recorder.stages))
@@ -21,10 +21,13 @@ from __future__ import annotations
 from pathlib import Path
 from typing import NamedTuple
 
+from ...metrics import StageMetrics
+
 
 class Results(NamedTuple):
     haplotype_stats: Path
     seconds_taken: float
+    stages: tuple[StageMetrics, ...] = ()
 
 
 class Entry(NamedTuple):
@@ -32,20 +32,18 @@ from ..common.view import GraphicTitleCard, PhasedSequenceSelector
 from . import long_description, pixmap_medium, title
 
 
-class BulkModeSelector(Card):
+class CheckBoxCard(Card):
     toggled = QtCore.Signal(bool)
 
-    def __init__(self, parent=None):
+    def __init__(self, text: str, description: str, parent=None):
         super().__init__(parent)
 
-        title = QtWidgets.QCheckBox("  Bulk mode:")
+        title = QtWidgets.QCheckBox(f"  {text}")
         title.setStyleSheet("""font-size: 16px;""")
         title.toggled.connect(self.toggled)
         title.setMinimumWidth(140)
 
-        description = QtWidgets.QLabel(
-            "Get statistics for each spartition in the SPART file."
-        )
+        description = QtWidgets.QLabel(description)
         description.setStyleSheet("""padding-top: 2px;""")
         description.setWordWrap(True)
 
@@ -122,7 +120,14 @@ class View(ScrollTaskView):
         self.cards.input_species = PartitionSelector(
             "Input partition", "Partition", "Individuals", self
         )
-        self.cards.bulk_mode = BulkModeSelector(self)
+        self.cards.bulk_mode = CheckBoxCard(
+            "Bulk mode:", "Get statistics for each spartition in the SPART file.", self
+        )
+        self.cards.bulk_parallel = CheckBoxCard(
+            "Parallel:",
+            "Compute spartitions simultaneously using all processor cores.",
+            self,
+        )
 
         layout = QtWidgets.QVBoxLayout()
         for card in self.cards:
@@ -165,6 +170,19 @@ class View(ScrollTaskView):
             lambda format: format == FileFormat.Spart,
         )
 
+        self.binder.bind(
+            self.cards.bulk_parallel.toggled, object.properties.bulk_parallel
+        )
+        self.binder.bind(
+            object.properties.bulk_parallel, self.cards.bulk_parallel.setChecked
+        )
+        self.binder.bind(
+            object.input_species.properties.format, self._update_bulk_parallel_visible
+        )
+        self.binder.bind(
+            object.properties.bulk_mode, self._update_bulk_parallel_visible
+        )
+
         self.binder.bind(object.properties.haplotype_stats, self.cards.results.setPath)
         self.binder.bind(
             object.properties.haplotype_stats,
@@ -184,9 +202,15 @@ class View(ScrollTaskView):
         # defined last to override `set_busy` calls
         self.binder.bind(object.properties.editable, self.setEditable)
 
+    def _update_bulk_parallel_visible(self, *args, **kwargs):
+        visible = self.object.input_species.format == FileFormat.Spart
+        visible = visible and self.object.bulk_mode
+        self.cards.bulk_parallel.roll_animation.setAnimatedVisible(visible)
+
     def _bind_phased_input_selector(self, card, object, subtask):
         self.binder.bind(card.addInputFile, subtask.start)
         self.binder.bind(card.indexChanged, object.set_index_phased)
+        self.binder.bind(object.phased_info_requested, subtask.start)
         self.binder.bind(object.properties.model, card.set_model)
         self.binder.bind(object.properties.index, card.set_index)
         self.binder.bind(object.properties.object, card.bind_object)
@@ -229,6 +253,7 @@ class View(ScrollTaskView):
         self.cards.input_sequences.setEnabled(editable)
         self.cards.input_species.setEnabled(editable)
         self.cards.bulk_mode.setEnabled(editable)
+        self.cards.bulk_parallel.setEnabled(editable)
 
     def view_results(self, text, path):
         dialog = ResultDialog(text, path, self.window())
@@ -19,17 +19,32 @@
 from __future__ import annotations
 
 from collections import Counter
+from contextlib import closing
+from io import StringIO
+from itertools import chain
 from pathlib import Path
-from typing import TextIO
+from typing import Callable, TextIO
 
 from itaxotools.common.utility import AttrDict
 from itaxotools.haplostats import HaploStats
+from itaxotools.haplostats.indexer import StringIndexer
 from itaxotools.hapsolutely.yamlify import dump, yamlify
 from itaxotools.taxi2.file_types import FileFormat
 from itaxotools.taxi2.partitions import Partition
 from itaxotools.taxi2.sequences import Sequence, Sequences
-from itaxotools.taxi_gui.tasks.common.process import sequences_from_model
 
+from ...cancellation import checkpoint
+from ..common.work import (
+    AmbiguityScanner,
+    PartitionMatcher,
+    ProgressThrottle,
+    SequenceScanner,
+    get_pool_size,
+    iter_scanned_sequences,
+    process_pool,
+    scan_sequences,
+    sequences_from_phased_model,
+)
 from .types import Entry
 
 
@@ -127,89 +142,164 @@ def write_stats_to_file(
 
 def bundle_entries(sequences: Sequences, partition: Partition) -> iter[Entry]:
     cached_id = None
-    cached_subset = None
     cached_seqs = None
 
+    # The subset is looked up only once all sequences of an individual
+    # were consumed, since the partition may be matched while iterating
     for sequence in sequences:
+        checkpoint()
         if sequence.id == cached_id:
             cached_seqs.append(sequence.seq)
             continue
 
         if cached_id is not None:
-            yield Entry(cached_id, cached_subset, cached_seqs)
+            yield Entry(cached_id, partition[cached_id], cached_seqs)
 
         cached_id = sequence.id
-        cached_subset = partition[sequence.id]
         cached_seqs = [sequence.seq]
 
-    yield Entry(cached_id, cached_subset, cached_seqs)
+    yield Entry(cached_id, partition[cached_id], cached_seqs)
+
+
+def get_stats_from_sequences(
+    sequences: Sequences, is_phased: bool, partition: Partition | None
+) -> tuple[HaploStats, list[str]]:
+    """
+    Validate the sequences and gather their statistics in a single pass.
+    Nothing is written until the caller decides what to do with the warnings.
+    """
+    matcher = PartitionMatcher(partition)
+    scanners = [AmbiguityScanner()]
+    if is_phased:
+        scanners += [AlleleScanner()]
+    scanners += [matcher]
+
+    stats = HaploStats()
+    scanned = iter_scanned_sequences(sequences, scanners)
+    for entry in bundle_entries(scanned, matcher.partition):
+        stats.add(entry.subset, entry.seqs)
+
+    warns = list(chain(*(scanner.get_warns() for scanner in scanners)))
+    return stats, warns
 
 
 def write_stats_to_path(
-    sequences: Sequences,
+    stats: HaploStats,
     phased: bool,
     partitioned: bool,
-    partition: Partition,
     name: str,
     path: Path,
 ):
-    stats = HaploStats()
-    for entry in bundle_entries(sequences, partition):
-        stats.add(entry.subset, entry.seqs)
-
     with open(path, "w") as file:
         write_stats_to_file(phased, partitioned, name, stats, file)
 
 
-def write_bulk_stats_to_path(
-    sequences: Sequences,
-    phased: bool,
-    partitions: iter[Partition],
-    names: list[str],
-    path: Path,
-):
-    with open(path, "w") as file:
-        for partition, name in zip(partitions, names):
-            print("---", file=file)
+class HaplotypeTable(SequenceScanner):
+    """
+    Intern each distinct sequence to an integer haplotype id in a single pass.
+    Since every partition is given the same sequences in the same order,
+    the ids match those HaploStats would assign, and the statistics of
+    each partition only need grouping the ids of each individual by subset.
+    """
+
+    def __init__(self):
+        self.indexer = StringIndexer()
+        self.records: list[Sequence] = []
+        self.ids: list[str] = []
+        self.haplotypes: list[list[int]] = []
+
+    def add(self, sequence: Sequence):
+        haplotype = self.indexer.add(sequence.seq)
+        self.records.append(Sequence(sequence.id, "", sequence.extras))
+        if self.ids and self.ids[-1] == sequence.id:
+            self.haplotypes[-1].append(haplotype)
+        else:
+            self.ids.append(sequence.id)
+            self.haplotypes.append([haplotype])
 
-            stats = HaploStats()
-            for entry in bundle_entries(sequences, partition):
-                stats.add(entry.subset, entry.seqs)
+    def get_stats(self, partition: Partition) -> HaploStats:
+        stats = HaploStats()
+        stats.indexer = self.indexer
+        for id, haplotypes in zip(self.ids, self.haplotypes):
+            subset = partition[id]
+            stats.counters.update(subset, haplotypes)
+            stats.fors.add(subset, haplotypes)
+        return stats
 
-            write_stats_to_file(phased, True, name, stats, file)
 
+def get_bulk_stats_section(
+    table: HaplotypeTable, phased: bool, partition: Partition, name: str
+) -> str:
+    file = StringIO()
+    print("---", file=file)
+    stats = table.get_stats(partition)
+    write_stats_to_file(phased, True, name, stats, file)
+    return file.getvalue()
 
-def _check_fasta_allele_definitions(sequences: Sequences):
-    previous_id = None
-    cached_alleles = set()
-    cached_ids = set()
-    for sequence in sequences:
-        *segments, allele = sequence.id.split("_")
-        new_id = "_".join(segments)
 
-        if not new_id:
-            raise Exception(
-                f"Could not parse allele for identifier: {repr(sequence.id)}"
-            )
+_worker_table: HaplotypeTable = None
 
-        if new_id == previous_id:
-            if allele in cached_alleles:
-                raise Exception(
-                    f"Duplicate allele entry for individual {repr(new_id)} and allele {repr(allele)}"
-                )
-        else:
-            cached_alleles.clear()
-            if new_id in cached_ids:
-                raise Exception(
-                    f"Out of order definition: {repr(new_id)}, {repr(allele)}"
-                )
 
-        previous_id = new_id
-        cached_alleles.add(allele)
-        cached_ids.add(new_id)
+def _init_bulk_stats_worker(table: HaplotypeTable):
+    global _worker_table
+    _worker_table = table
+
+
+def _get_bulk_stats_section_from_worker(
+    phased: bool, partition: Partition, name: str
+) -> str:
+    return get_bulk_stats_section(_worker_table, phased, partition, name)
 
 
-def _check_tabfile_allele_definitions(sequences: Sequences, header: str):
+def iter_bulk_stats_sections_in_parallel(
+    table: HaplotypeTable,
+    phased: bool,
+    partitions: list[Partition],
+    names: list[str],
+) -> iter[str]:
+    """Sections are yielded in the original spartition order"""
+    partitions = list(partitions)
+    workers = get_pool_size(len(partitions))
+    with process_pool(
+        workers, initializer=_init_bulk_stats_worker, initargs=(table,)
+    ) as executor:
+        yield from executor.map(
+            _get_bulk_stats_section_from_worker,
+            [phased] * len(partitions),
+            partitions,
+            names,
+        )
+
+
+def write_bulk_stats_to_path(
+    table: HaplotypeTable,
+    phased: bool,
+    partitions: iter[Partition],
+    names: list[str],
+    path: Path,
+    parallel: bool = False,
+    callback: Callable[[int], None] | None = None,
+):
+    """The callback receives the number of sections written so far"""
+    if parallel:
+        sections = iter_bulk_stats_sections_in_parallel(
+            table, phased, partitions, names
+        )
+    else:
+        sections = (
+            get_bulk_stats_section(table, phased, partition, name)
+            for partition, name in zip(partitions, names)
+        )
+
+    with closing(sections), open(path, "w") as file:
+        for count, section in enumerate(sections, 1):
+            checkpoint()
+            file.write(section)
+            if callback is not None:
+                callback(count)
+
+
+def _iter_check_allele_definitions(sequences: Sequences, header: str) -> iter[Sequence]:
     previous_id = None
     cached_alleles = set()
     cached_ids = set()
@@ -233,6 +323,8 @@ def _check_tabfile_allele_definitions(sequences: Sequences, header: str):
         cached_alleles.add(allele)
         cached_ids.add(new_id)
 
+        yield sequence
+
 
 def _rename_allele_header(sequences: Sequences, before: str, after: str) -> Sequences:
     for sequence in sequences:
@@ -243,60 +335,79 @@ def _extract_alleles_from_ids(sequences: Sequences, header: str) -> Sequences:
     for sequence in sequences:
         *segments, allele = sequence.id.split("_")
         new_id = "_".join(segments)
+        if not new_id:
+            raise Exception(
+                f"Could not parse allele for identifier: {repr(sequence.id)}"
+            )
         yield Sequence(new_id, sequence.seq, {header: allele})
 
 
-def _get_phased_sequences_from_phased_model(input: AttrDict) -> Sequences:
-    sequences = sequences_from_model(input)
+def _get_phased_sequences_from_phased_model(
+    input: AttrDict, caption: str | None, progress: ProgressThrottle
+) -> Sequences:
+    sequences = sequences_from_phased_model(input, caption, progress)
 
     if input.info.format == FileFormat.Tabfile:
         allele_header = input.info.headers[input.allele_column]
-        _check_tabfile_allele_definitions(sequences, allele_header)
-        return Sequences(_rename_allele_header, sequences, allele_header, "allele")
+        sequences = Sequences(_rename_allele_header, sequences, allele_header, "allele")
+    elif input.info.format == FileFormat.Fasta:
+        sequences = Sequences(_extract_alleles_from_ids, sequences, "allele")
+    else:
+        return None
 
-    if input.info.format == FileFormat.Fasta:
-        _check_fasta_allele_definitions(sequences)
-        return Sequences(_extract_alleles_from_ids, sequences, "allele")
+    return Sequences(_iter_check_allele_definitions, sequences, "allele")
 
 
-def get_sequences_from_phased_model(input: AttrDict) -> Sequences:
+def get_sequences_from_phased_model(
+    input: AttrDict, caption: str | None = None, progress: ProgressThrottle = None
+) -> Sequences:
+    """If a caption is given, progress is reported while the file is parsed"""
     if input.is_phased:
-        return _get_phased_sequences_from_phased_model(input)
-    return sequences_from_model(input)
+        return _get_phased_sequences_from_phased_model(input, caption, progress)
+    return sequences_from_phased_model(input, caption, progress)
+
+
+class AlleleScanner(SequenceScanner):
+    def __init__(self):
+        self.alleles = set()
+        self.counters = Counter()
+
+    def add(self, sequence: Sequence):
+        self.alleles.add(sequence.extras["allele"])
+        self.counters[sequence.id] += 1
+
+    def get_warns(self) -> list[str]:
+        warns = []
+
+        unexpected_alleles = self.alleles - set(["a", "b"])
+        if unexpected_alleles:
+            unexpected_alleles_str = ", ".join(repr(a) for a in unexpected_alleles)
+            warns += [f"Unexpected alleles (not 'a' or 'b'): {unexpected_alleles_str}"]
+
+        counters = self.counters
+
+        single_allele_ids = [id for id, alleles in counters.items() if alleles == 1]
+        if single_allele_ids:
+            single_allele_ids_str = ", ".join(repr(id) for id in single_allele_ids[:3])
+            if len(single_allele_ids) > 3:
+                single_allele_ids_str += f" and {len(single_allele_ids) - 3} more"
+            s = "s" if len(single_allele_ids) > 1 else ""
+            warns += [
+                f"Only a single allele defined for individual{s}: {single_allele_ids_str}"
+            ]
+
+        many_allele_ids = [id for id, alleles in counters.items() if alleles > 2]
+        if many_allele_ids:
+            many_allele_ids_str = ", ".join(repr(id) for id in many_allele_ids[:3])
+            if len(many_allele_ids) > 3:
+                many_allele_ids_str += f" and {len(many_allele_ids) - 3} more"
+            s = "s" if len(many_allele_ids) > 1 else ""
+            warns += [
+                f"More than two alleles defined for individual{s}: {many_allele_ids_str}"
+            ]
+
+        return warns
 
 
 def scan_sequence_alleles(sequences: Sequences) -> list[str]:
-    alleles = set()
-    counters = Counter()
-    for sequence in sequences:
-        alleles.add(sequence.extras["allele"])
-        counters[sequence.id] += 1
-
-    warns = []
-
-    unexpected_alleles = alleles - set(["a", "b"])
-    if unexpected_alleles:
-        unexpected_alleles_str = ", ".join(repr(a) for a in unexpected_alleles)
-        warns += [f"Unexpected alleles (not 'a' or 'b'): {unexpected_alleles_str}"]
-
-    single_allele_ids = [id for id, alleles in counters.items() if alleles == 1]
-    if single_allele_ids:
-        single_allele_ids_str = ", ".join(repr(id) for id in single_allele_ids[:3])
-        if len(single_allele_ids) > 3:
-            single_allele_ids_str += f" and {len(single_allele_ids) - 3} more"
-        s = "s" if len(single_allele_ids) > 1 else ""
-        warns += [
-            f"Only a single allele defined for individual{s}: {single_allele_ids_str}"
-        ]
-
-    many_allele_ids = [id for id, alleles in counters.items() if alleles > 2]
-    if many_allele_ids:
-        many_allele_ids_str = ", ".join(repr(id) for id in many_allele_ids[:3])
-        if len(many_allele_ids) > 3:
-            many_allele_ids_str += f" and {len(many_allele_ids) - 3} more"
-        s = "s" if len(many_allele_ids) > 1 else ""
-        warns += [
-            f"More than two alleles defined for individual{s}: {many_allele_ids_str}"
-        ]
-
-    return warns
+    return scan_sequences(sequences, [AlleleScanner()])
@@ -14,3 +14,10 @@ def app_factory(argv):
 @pytest.fixture(scope="session")
 def qapp_cls():
     return app_factory
+
+
+@pytest.fixture(autouse=True)
+def user_cache_dir(tmp_path, monkeypatch):
+    path = tmp_path / "cache"
+    monkeypatch.setenv("HAPSOLUTELY_CACHE_DIR", str(path))
+    return path
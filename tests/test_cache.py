@@ -0,0 +1,160 @@
+import os
+from pathlib import Path
+
+from itaxotools.hapsolutely.cache import DiskCache, get_file_key
+from itaxotools.hapsolutely.store import SequenceStore
+from itaxotools.taxi2.sequences import Sequence, Sequences
+
+
+def test_cache_eviction(user_cache_dir: Path):
+    cache = DiskCache.from_namespace("test", max_size=3500)
+    for key in "abc":
+        cache.put(key, bytes(1000))
+        os.utime(cache._get_path(key), ns=(0, ord(key)))
+    assert cache.get("a") is not None  # refreshed, "b" is now the oldest
+    cache.put("d", bytes(1000))
+    assert cache.get("b") is None
+    assert all(cache.get(key) is not None for key in "acd")
+
+
+def test_cache_file_key(tmp_path: Path):
+    path = tmp_path / "file.txt"
+    path.write_text("abc")
+    key = get_file_key(path, "option")
+    assert key == get_file_key(path, "option")
+    assert key != get_file_key(path, "other")
+    path.write_text("abcd")
+    assert key != get_file_key(path, "option")
+
+
+def test_cache_sequence_store(user_cache_dir: Path):
+    sequences = Sequences(
+        [
+            Sequence("id1", "ACGT", {"allele": "a"}),
+            Sequence("id2", "ACGG", {}),
+        ]
+    )
+    cache = DiskCache.from_namespace("test")
+    cache.put("store", SequenceStore.from_sequences(sequences))
+    assert list(cache.get("store")) == list(sequences)
+
+
+def test_cache_mapped_sequence_store(user_cache_dir: Path):
+    sequences = Sequences(
+        [
+            Sequence("id1", "ACGT", {"allele": "a"}),
+            Sequence("id2", "ACGG", {}),
+        ]
+    )
+    cache = DiskCache.from_namespace("test", mapped=True)
+    cache.put("store", SequenceStore.from_sequences(sequences))
+    stored = cache.get("store")
+    assert isinstance(stored.data, memoryview)
+    assert list(stored) == list(sequences)
+    assert stored.matrix.tolist() == [list(b"ACGT"), list(b"ACGG")]
+    assert cache.get("other") is None
+
+
+def test_result_cache(tmp_path: Path, user_cache_dir: Path):
+    from itaxotools.hapsolutely.tasks.haplodemo.work import (
+        get_cached_result,
+        get_result_caches,
+        get_result_key,
+        put_cached_result,
+    )
+
+    sequences = Sequences([Sequence("a", "ACGT"), Sequence("b", "ACGA")])
+    key = get_result_key(sequences, {"a": "x", "b": "y"}, "TCS", 0, False)
+    assert key != get_result_key(sequences, {"a": "x", "b": "x"}, "TCS", 0, False)
+    assert key != get_result_key(sequences, {"a": "x", "b": "y"}, "TCS", 1, False)
+
+    work_dir = tmp_path / "run"
+    put_cached_result(get_result_caches(work_dir, persistent=True), key, "result")
+    (tmp_path / "results").rename(tmp_path / "removed")
+    assert get_cached_result(get_result_caches(work_dir), key) is None
+    assert get_cached_result(get_result_caches(work_dir, True), key) == "result"
+    assert get_cached_result(get_result_caches(work_dir), key) == "result"
+
+
+def test_result_parameters():
+    from itaxotools.hapsolutely.tasks.haplodemo.types import (
+        NetworkAlgorithm,
+        NetworkParameters,
+        TreeContructionMethod,
+    )
+
+    def get_result_parameters(algorithm, method=None, newick=None, **kwargs):
+        parameters = NetworkParameters(algorithm, method, False, 0)
+        changed = parameters._replace(**kwargs)
+        return (
+            parameters.get_result_parameters(newick),
+            changed.get_result_parameters(newick),
+        )
+
+    same = [
+        (NetworkAlgorithm.TCS, None, None, dict(epsilon=1, transversions_only=True)),
+        (NetworkAlgorithm.MJN, None, None, dict(transversions_only=True)),
+        (NetworkAlgorithm.Fitchi, TreeContructionMethod.NJ, None, dict(epsilon=1)),
+        (NetworkAlgorithm.Fitchi, TreeContructionMethod.NJ, None, dict(search_moves=9)),
+        (NetworkAlgorithm.Fitchi, None, "(a,b);", dict(search_seconds=9)),
+    ]
+    for algorithm, method, newick, kwargs in same:
+        before, after = get_result_parameters(algorithm, method, newick, **kwargs)
+        assert before == after
+
+    different = [
+        (NetworkAlgorithm.MJN, None, None, dict(epsilon=1)),
+        (NetworkAlgorithm.Fitchi, None, "(a,b);", dict(transversions_only=True)),
+        (NetworkAlgorithm.Fitchi, TreeContructionMethod.MP, None, dict(search_moves=9)),
+    ]
+    for algorithm, method, newick, kwargs in different:
+        before, after = get_result_parameters(algorithm, method, newick, **kwargs)
+        assert before != after
+
+
+def test_stopped_search_not_reusable(tmp_path: Path):
+    from itaxotools.hapsolutely.pipeline import initialize_worker
+    from itaxotools.hapsolutely.tasks.haplodemo.process import (
+        SEARCH_STOP,
+        _make_tree_mp_with_budget,
+    )
+
+    sequences = Sequences(
+        [
+            Sequence("a", "ACGTACGT"),
+            Sequence("b", "ACGAACGT"),
+            Sequence("c", "TCGAACGA"),
+            Sequence("d", "TCGTACCA"),
+        ]
+    )
+    initialize_worker()
+    _, reusable = _make_tree_mp_with_budget(tmp_path, sequences, 0, 0)
+    assert reusable
+
+    (tmp_path / SEARCH_STOP).touch()
+    _, reusable = _make_tree_mp_with_budget(tmp_path, sequences, 0, 0)
+    assert not reusable
+
+
+def test_input_cache_opt_in(tmp_path: Path, user_cache_dir: Path):
+    from itaxotools.common.utility import AttrDict
+    from itaxotools.hapsolutely.tasks.common.work import sequences_from_phased_model
+    from itaxotools.taxi2.files import get_info
+
+    path = tmp_path / "input.fas"
+    path.write_text(">a\nACGT\n>b\nACGA\n")
+    model = AttrDict(info=get_info(path), parse_subset=False, subset_separator="|")
+    expected = list(sequences_from_phased_model(model))
+
+    assert not isinstance(sequences_from_phased_model(model), SequenceStore)
+    assert not (user_cache_dir / "inputs").exists()
+
+    model.use_index = True
+    model.use_cache = True
+    assert not isinstance(sequences_from_phased_model(model), SequenceStore)
+
+    model.use_index = False
+    stored = sequences_from_phased_model(model)
+    assert isinstance(stored, SequenceStore)
+    assert list(stored) == expected
+    assert any((user_cache_dir / "inputs").iterdir())
@@ -0,0 +1,118 @@
+import os
+import signal
+import sys
+import time
+from multiprocessing import get_context
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+import itaxotools
+from itaxotools.hapsolutely.cancellation import (
+    CANCEL_REQUEST,
+    Cancelled,
+    cancellable,
+    cancellation_scope,
+    checkpoint,
+    request_cancel,
+)
+from itaxotools.hapsolutely.neighbor_joining import neighbor_joining
+from itaxotools.hapsolutely.tasks.common.work import process_pool
+
+
+class Aborted(Exception):
+    pass
+
+
+def test_neighbor_joining_cancelled(tmp_path: Path):
+    names = [f"seq{i}" for i in range(8)]
+    distances = np.random.default_rng(0).random((8, 8))
+    distances = distances + distances.T
+    np.fill_diagonal(distances, 0)
+
+    with cancellation_scope(tmp_path) as token:
+        assert request_cancel(tmp_path)
+        assert not request_cancel(tmp_path)
+        token.interval = 0
+        with pytest.raises(Cancelled):
+            neighbor_joining(names, distances)
+
+    assert not (tmp_path / CANCEL_REQUEST).exists()
+
+
+def test_cancellable_aborts(tmp_path: Path, monkeypatch):
+    def abort():
+        raise Aborted()
+
+    monkeypatch.setattr(itaxotools, "abort", abort, raising=False)
+
+    @cancellable
+    def execute(work_dir: Path, value: int) -> int:
+        request_cancel(work_dir)
+        time.sleep(0.2)
+        checkpoint()
+        return value
+
+    with pytest.raises(Aborted):
+        execute(tmp_path, 1)
+    assert not (tmp_path / CANCEL_REQUEST).exists()
+
+    @cancellable
+    def finish(work_dir: Path, value: int) -> int:
+        checkpoint()
+        return value
+
+    assert finish(tmp_path, 2) == 2
+
+
+def test_process_pool_terminated():
+    start = time.monotonic()
+    with pytest.raises(KeyboardInterrupt):
+        with process_pool(2) as executor:
+            futures = [executor.submit(time.sleep, 60) for _ in range(4)]
+            time.sleep(0.5)
+            raise KeyboardInterrupt()
+    for future in futures:
+        while not (future.cancelled() or future.done()):
+            assert time.monotonic() - start < 30
+            time.sleep(0.05)
+    assert time.monotonic() - start < 30
+
+
+def _run_pool_until_terminated(pids):
+    with process_pool(2) as executor:
+        futures = [executor.submit(os.getpid) for _ in range(2)]
+        futures += [executor.submit(time.sleep, 60) for _ in range(2)]
+        for future in futures[:2]:
+            future.result()
+        pids.put([child.pid for child in get_context().active_children()])
+        for future in futures:
+            future.result()
+
+
+def _is_running(pid: int) -> bool:
+    try:
+        with open(f"/proc/{pid}/stat") as file:
+            return file.read().rsplit(")", 1)[1].split()[0] != "Z"
+    except FileNotFoundError:
+        return False
+
+
+@pytest.mark.skipif(sys.platform != "linux", reason="reads process states")
+def test_process_pool_terminated_with_parent():
+    context = get_context()
+    pids = context.SimpleQueue()
+    parent = context.Process(target=_run_pool_until_terminated, args=(pids,))
+    parent.start()
+    workers = pids.get()
+    assert workers and all(_is_running(pid) for pid in workers)
+
+    parent.terminate()
+    parent.join()
+    assert parent.exitcode == -signal.SIGTERM
+
+    start = time.monotonic()
+    while any(_is_running(pid) for pid in workers):
+        assert time.monotonic() - start < 10
+        time.sleep(0.05)
@@ -0,0 +1,140 @@
+import numpy as np
+import pytest
+from Bio.Align import MultipleSeqAlignment
+from Bio.Phylo.TreeConstruction import (
+    DistanceCalculator,
+    DistanceMatrix,
+    DistanceTreeConstructor,
+)
+from Bio.Seq import Seq
+from Bio.SeqRecord import SeqRecord
+
+from itaxotools.hapsolutely.distances import (
+    DistanceCache,
+    DistanceMetric,
+    PackedAlignment,
+    condense_distances,
+    encode_alignment,
+    expand_distances,
+    get_cached_distance_matrix,
+    get_distance_matrix,
+)
+from itaxotools.hapsolutely.neighbor_joining import neighbor_joining
+from itaxotools.taxi2.sequences import Sequence, Sequences
+
+
+def get_splits(tree, names: list[str]) -> set[frozenset[str]]:
+    everything = frozenset(names)
+    splits = set()
+    for clade in tree.find_clades():
+        split = frozenset(terminal.name for terminal in clade.get_terminals())
+        if 1 < len(split) < len(names) - 1:
+            splits.add(min(split, everything - split, key=sorted))
+    return splits
+
+
+def test_identity_distances():
+    rng = np.random.default_rng(0)
+    letters = np.frombuffer(b"ACGTN-acgt", dtype=np.uint8)
+    matrix = rng.choice(letters, (12, 30))
+    sequences = Sequences(
+        [Sequence(f"id{i}", row.tobytes().decode()) for i, row in enumerate(matrix)]
+    )
+    align = MultipleSeqAlignment([SeqRecord(Seq(x.seq), id=x.id) for x in sequences])
+    expected = DistanceCalculator("identity").get_distance(align)
+
+    ids, matrix = encode_alignment(sequences)
+    distances = get_distance_matrix(matrix, block_size=5)
+    for i in range(len(ids)):
+        for j in range(len(ids)):
+            assert distances[i, j] == pytest.approx(expected[i, j])
+
+
+@pytest.mark.parametrize(
+    "metric, expected",
+    [
+        (DistanceMetric.PDistance, [[0, 3 / 4, 0], [3 / 4, 0, 2 / 3], [0, 2 / 3, 0]]),
+        (
+            DistanceMetric.Transversions,
+            [[0, 1 / 4, 0], [1 / 4, 0, 1 / 3], [0, 1 / 3, 0]],
+        ),
+    ],
+)
+def test_site_distances(metric: DistanceMetric, expected: list[list[float]]):
+    matrix = np.frombuffer(b"ACGTN-AGACGTacgtct", dtype=np.uint8).reshape(3, 6)
+    distances = get_distance_matrix(matrix, metric)
+    assert distances == pytest.approx(np.array(expected))
+
+
+@pytest.mark.parametrize("metric", list(DistanceMetric))
+def test_packed_distances(metric: DistanceMetric):
+    rng = np.random.default_rng(1)
+    letters = b"ACGT" if metric == DistanceMetric.Identity else b"ACGTacgt"
+    matrix = rng.choice(np.frombuffer(letters, dtype=np.uint8), (9, 130))
+    if metric != DistanceMetric.Identity:
+        matrix[rng.random(matrix.shape) < 0.2] = ord("N")
+    packed = PackedAlignment.from_matrix(matrix)
+    assert packed.mask.shape == (3, 9)
+
+    upper = np.frombuffer(matrix.tobytes().upper(), dtype=np.uint8)
+    upper = upper.reshape(matrix.shape)
+    purines = np.isin(upper, list(b"AG"))
+    bases = np.isin(upper, list(b"ACGT"))
+    distances = get_distance_matrix(matrix, metric, block_size=4)
+    for i in range(len(matrix)):
+        for j in range(len(matrix)):
+            if metric == DistanceMetric.Identity:
+                expected = np.mean(matrix[i] != matrix[j])
+            else:
+                valid = bases[i] & bases[j]
+                if metric == DistanceMetric.PDistance:
+                    different = upper[i] != upper[j]
+                else:
+                    different = purines[i] != purines[j]
+                expected = np.sum(different & valid) / np.sum(valid)
+            assert distances[i, j] == pytest.approx(expected)
+
+
+@pytest.mark.parametrize("count", [3, 4, 10, 40, 150])
+def test_neighbor_joining(count: int):
+    rng = np.random.default_rng(count)
+    distances = rng.random((count, count))
+    distances = distances + distances.T
+    np.fill_diagonal(distances, 0)
+    names = [f"id{i}" for i in range(count)]
+    matrix = DistanceMatrix(
+        names, [[distances[i, j] for j in range(i + 1)] for i in range(count)]
+    )
+    expected = DistanceTreeConstructor().nj(matrix)
+    tree = neighbor_joining(names, distances)
+    assert get_splits(tree, names) == get_splits(expected, names)
+
+
+def test_distance_cache():
+    rng = np.random.default_rng(0)
+    matrix = rng.choice(np.frombuffer(b"ACGT", dtype=np.uint8), (10, 20))
+    expected = get_distance_matrix(matrix, DistanceMetric.PDistance)
+
+    cache = DistanceCache(max_size=2 * 45 * 8)
+    for metric in [DistanceMetric.Identity, DistanceMetric.PDistance]:
+        key = DistanceCache.get_key(matrix, metric)
+        distances = get_distance_matrix(matrix, metric)
+        cache.put(key, condense_distances(distances))
+    assert cache.get(DistanceCache.get_key(matrix, DistanceMetric.Identity)) is not None
+
+    key = DistanceCache.get_key(matrix[1:], DistanceMetric.PDistance)
+    cache.put(key, condense_distances(get_distance_matrix(matrix[1:])))
+    assert len(cache.entries) == 2
+    assert cache.get(DistanceCache.get_key(matrix, DistanceMetric.PDistance)) is None
+
+    key = DistanceCache.get_key(matrix, DistanceMetric.Identity)
+    assert np.array_equal(
+        expand_distances(cache.get(key), len(matrix)),
+        get_distance_matrix(matrix, DistanceMetric.Identity),
+    )
+    assert np.array_equal(
+        get_cached_distance_matrix(matrix, DistanceMetric.PDistance), expected
+    )
+    assert np.array_equal(
+        get_cached_distance_matrix(matrix, DistanceMetric.PDistance), expected
+    )
@@ -0,0 +1,102 @@
+from pathlib import Path
+
+import pytest
+
+from itaxotools.common.utility import AttrDict
+from itaxotools.hapsolutely.tasks.common.work import ProgressThrottle
+from itaxotools.hapsolutely.tasks.haplostats.work import (
+    get_sequences_from_phased_model,
+    get_stats_from_sequences,
+)
+from itaxotools.taxi2.file_types import FileFormat
+from itaxotools.taxi2.files import get_info
+
+TEST_DATA_DIR = Path(__file__).parent / "test_haplostats"
+
+
+def get_phased_model(path: Path) -> AttrDict:
+    info = get_info(path)
+    model = AttrDict(info=info, is_phased=True)
+    if info.format == FileFormat.Fasta:
+        model.subset_separator = info.subset_separator
+        model.parse_subset = info.has_subsets
+    elif info.format == FileFormat.Tabfile:
+        model.index_column = info.headers.index(info.header_individuals)
+        model.sequence_column = info.headers.index(info.header_sequences)
+        model.allele_column = info.headers.index("allele")
+    return model
+
+
+@pytest.mark.parametrize(
+    "filename, warning",
+    [
+        ("single_allele.fas", "Only a single allele defined for individual"),
+        ("single_allele.tsv", "Only a single allele defined for individual"),
+        ("multiple_allele.fas", "More than two alleles defined for individual"),
+        ("multiple_allele.tsv", "More than two alleles defined for individual"),
+        ("unexpected_allele.fas", "Unexpected alleles (not 'a' or 'b')"),
+        ("unexpected_allele.tsv", "Unexpected alleles (not 'a' or 'b')"),
+    ],
+)
+def test_stats_warns(filename: str, warning: str):
+    model = get_phased_model(TEST_DATA_DIR / "warn" / filename)
+    sequences = get_sequences_from_phased_model(model)
+    stats, warns = get_stats_from_sequences(sequences, True, None)
+    assert any(warn.startswith(warning) for warn in warns)
+    assert stats.get_dataset_sizes()["haplotypes"] > 0
+
+
+@pytest.mark.parametrize(
+    "filename, error",
+    [
+        ("duplicate_allele.fas", "Duplicate allele entry"),
+        ("duplicate_allele.tsv", "Duplicate allele entry"),
+        ("out_of_order_allele.fas", "Out of order definition"),
+    ],
+)
+def test_stats_errors(filename: str, error: str):
+    model = get_phased_model(TEST_DATA_DIR / "error" / filename)
+    sequences = get_sequences_from_phased_model(model)
+    with pytest.raises(Exception, match=error):
+        get_stats_from_sequences(sequences, True, None)
+
+
+def test_stats_progress():
+    path = TEST_DATA_DIR / "warn" / "single_allele.fas"
+    model = get_phased_model(path)
+    reports = []
+    progress = ProgressThrottle(lambda *args: reports.append(args), interval=0)
+    sequences = get_sequences_from_phased_model(model, "Reading", progress)
+    get_stats_from_sequences(sequences, True, None)
+    values = [value for _, value, _ in reports]
+    assert values == sorted(values)
+    assert 0 < values[0] and values[-1] <= model.info.size
+    assert all(report[2] == model.info.size for report in reports)
+
+    reports.clear()
+    throttled = ProgressThrottle(lambda *args: reports.append(args), interval=60)
+    for value in range(10):
+        throttled("Writing", value, 9)
+    assert reports == [("Writing", 0, 9), ("Writing", 9, 9)]
+
+
+def test_stats_progress_cached():
+    path = TEST_DATA_DIR / "warn" / "single_allele.fas"
+    model = get_phased_model(path)
+    model.use_cache = True
+    size = model.info.size
+    reports = []
+    progress = ProgressThrottle(lambda *args: reports.append(args), interval=0)
+
+    # Progress follows parsing, which happens before the sequences are cached
+    get_sequences_from_phased_model(model, "Reading", progress)
+    values = [value for _, value, _ in reports]
+    assert len(values) > 2
+    assert values == sorted(values)
+    assert values[-1] == size
+
+    reports.clear()
+    sequences = get_sequences_from_phased_model(model, "Reading", progress)
+    assert reports == [("Reading", size, size)]
+    get_stats_from_sequences(sequences, True, None)
+    assert reports == [("Reading", size, size)]
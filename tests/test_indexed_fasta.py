@@ -0,0 +1,66 @@
+from pathlib import Path
+
+import pytest
+
+from itaxotools.hapsolutely.indexed_fasta import IndexedFasta, read_indexed_fasta
+from itaxotools.taxi2.sequences import SequenceHandler
+
+TEST_DATA_DIR = Path(__file__).parent / "test_haplostats"
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        b"",
+        b">a\nACGT\n>b\nAC\nGT\n",
+        b">a|x \r\nAC GT\r\n>b\r\n\r\n>c|y|z\r\nAAA",
+        b"junk\n>a\n>b\nTT\n",
+        b">a\nAC\tGT",
+        b">a\nA C\tGT\t \r\nTT\x0b\n>b\nG\x0cG\x0c\n>c\nC\xc2\xa0C\xc2\xa0\n",
+    ],
+)
+@pytest.mark.parametrize("parse_organism", [False, True])
+def test_indexed_fasta(tmp_path: Path, data: bytes, parse_organism: bool):
+    path = tmp_path / "test.fas"
+    path.write_bytes(data)
+
+    with SequenceHandler.Fasta(path, parse_organism=parse_organism) as file:
+        expected = list(file)
+
+    for _ in range(2):  # build index, then load it from the sidecar
+        with IndexedFasta(path) as fasta:
+            sequences = fasta.get_sequences(parse_organism=parse_organism)
+            assert list(sequences) == expected
+    assert IndexedFasta.get_default_index_path(path).exists()
+
+
+def test_indexed_fasta_lookup(tmp_path: Path):
+    path = tmp_path / "test.fas"
+    path.write_bytes((TEST_DATA_DIR / "warn" / "single_allele.fas").read_bytes())
+
+    with IndexedFasta(path) as fasta:
+        expected = list(fasta.get_sequences())
+        for sequence in reversed(expected):
+            assert fasta.get(sequence.id) == sequence
+            assert (
+                bytes(fasta.get_bytes(fasta.titles[sequence.id]))
+                == sequence.seq.encode()
+            )
+
+
+def test_read_indexed_fasta_closes(tmp_path: Path, monkeypatch):
+    path = tmp_path / "test.fas"
+    path.write_bytes((TEST_DATA_DIR / "warn" / "single_allele.fas").read_bytes())
+
+    closed = []
+    close = IndexedFasta.close
+    monkeypatch.setattr(
+        IndexedFasta, "close", lambda self: closed.append(close(self) or True)
+    )
+
+    sequences = read_indexed_fasta(path)
+    assert not closed
+    expected = [sequence for sequence in sequences]
+    assert len(closed) == 1
+    assert [sequence for sequence in sequences] == expected
+    assert len(closed) == 2
@@ -0,0 +1,21 @@
+import pytest
+
+from itaxotools.hapsolutely.metrics import StageRecorder
+
+SIZE = 64 * 2**20
+
+
+def test_stage_peak_rss():
+    recorder = StageRecorder()
+    with recorder.stage("outer"):
+        with recorder.stage("large"):
+            data = b"x" * SIZE
+            del data
+    with recorder.stage("small"):
+        pass
+
+    large, outer, small = recorder.stages
+    if large.peak_rss is None:
+        pytest.skip("peak memory cannot be reset on this platform")
+    assert small.peak_rss < large.peak_rss - SIZE // 2
+    assert outer.peak_rss >= large.peak_rss
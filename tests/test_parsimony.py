@@ -0,0 +1,122 @@
+import numpy as np
+import pytest
+
+from itaxotools.hapsolutely.distances import get_distance_matrix
+from itaxotools.hapsolutely.neighbor_joining import neighbor_joining
+from itaxotools.hapsolutely.parsimony import (
+    ParsimonyTree,
+    compress_sites,
+    encode_states,
+    get_parsimony_tree,
+    search_parsimony_tree,
+)
+
+
+def get_random_alignment(seed: int, count: int, length: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    letters = np.frombuffer(b"ACGTACGTRYN-", dtype=np.uint8)
+    matrix = np.tile(rng.choice(letters[:4], length), (count, 1))
+    mutations = rng.random((count, length)) < 0.2
+    matrix[mutations] = rng.choice(letters, mutations.sum())
+    return matrix
+
+
+def get_fresh_tree(tree: ParsimonyTree) -> ParsimonyTree:
+    neighbors = {node: list(adjacent) for node, adjacent in tree.neighbors.items()}
+    return ParsimonyTree(tree.names, tree.patterns, tree.weights, neighbors)
+
+
+def get_fresh_score(tree: ParsimonyTree) -> int:
+    return get_fresh_tree(tree).score
+
+
+def assert_fresh_sets(tree: ParsimonyTree):
+    fresh = get_fresh_tree(tree)
+    assert tree.costs == fresh.costs
+    assert tree.sets.keys() == fresh.sets.keys()
+    for edge, states in fresh.sets.items():
+        assert np.array_equal(tree.sets[edge], states)
+
+
+def test_compress_sites():
+    matrix = np.frombuffer(b"ACACRN" b"CACAA-", dtype=np.uint8).reshape(2, 6)
+    patterns, weights = compress_sites(encode_states(matrix))
+    assert patterns.shape == (2, 2)
+    assert weights.tolist() == [2, 2]
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_parsimony_moves(seed: int):
+    matrix = get_random_alignment(seed, 12 + seed, 40)
+    names = [f"id{i}" for i in range(len(matrix))]
+    start = neighbor_joining(names, get_distance_matrix(matrix))
+    patterns, weights = compress_sites(encode_states(matrix))
+    tree = ParsimonyTree.from_bio_tree(start, names, patterns, weights)
+
+    for root in range(len(names)):
+        tree.update(root)
+        assert tree.score == get_fresh_score(tree)
+
+    for find, apply in [
+        (tree.find_best_nni, tree.apply_nni),
+        (tree.find_best_spr, tree.apply_spr),
+    ]:
+        delta, move = find()
+        if move is None:
+            continue
+        score = tree.score
+        apply(*move)
+        assert tree.score == score + delta
+        assert tree.score == get_fresh_score(tree)
+        assert_fresh_sets(tree)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_parsimony_incremental_search(seed: int):
+    matrix = get_random_alignment(seed, 20 + seed, 50)
+    names = [f"id{i}" for i in range(len(matrix))]
+    start = neighbor_joining(names, get_distance_matrix(matrix))
+    patterns, weights = compress_sites(encode_states(matrix))
+    tree = ParsimonyTree.from_bio_tree(start, names, patterns, weights)
+
+    for _ in range(10):
+        nni_delta, nni = tree.find_best_nni()
+        spr_delta, spr = tree.find_best_spr()
+        if nni is None and spr is None:
+            break
+        score = tree.score
+        if nni is not None:
+            tree.apply_nni(*nni)
+            assert tree.score == score + nni_delta
+        else:
+            tree.apply_spr(*spr)
+            assert tree.score == score + spr_delta
+        assert_fresh_sets(tree)
+
+
+def test_parsimony_tree():
+    matrix = get_random_alignment(0, 20, 60)
+    names = [f"id{i}" for i in range(len(matrix))]
+    start = neighbor_joining(names, get_distance_matrix(matrix))
+    tree = get_parsimony_tree(names, matrix, start)
+    assert sorted(clade.name for clade in tree.get_terminals()) == sorted(names)
+
+
+def test_parsimony_search_budget():
+    matrix = get_random_alignment(3, 30, 60)
+    names = [f"id{i}" for i in range(len(matrix))]
+    start = neighbor_joining(names, get_distance_matrix(matrix))
+    patterns, weights = compress_sites(encode_states(matrix))
+
+    tree = ParsimonyTree.from_bio_tree(start, names, patterns, weights)
+    score = tree.score
+    assert not search_parsimony_tree(tree, should_stop=lambda: True)
+    assert tree.score == score
+
+    reports = []
+    converged = search_parsimony_tree(
+        tree, max_moves=1, callback=lambda *args: reports.append(args)
+    )
+    assert len(reports) <= 2
+    assert reports[-1][0] == tree.score <= score
+    assert converged == (len(reports) == 1)
@@ -0,0 +1,109 @@
+import json
+from pathlib import Path
+
+import pytest
+import yaml
+
+from itaxotools.hapsolutely.batch import (
+    BatchQueue,
+    JobStatus,
+    get_jobs_from_path,
+)
+from itaxotools.hapsolutely.pipeline import (
+    PipelineAborted,
+    PipelineOptions,
+    initialize_worker,
+    run_pipeline,
+)
+from itaxotools.hapsolutely.store import DEFAULT_MEMORY_BUDGET
+
+SEQUENCES = {
+    "ind1_a|sp1": "ACGTACGTAC",
+    "ind1_b|sp1": "ACGTACGTAC",
+    "ind2_a|sp1": "ACGTACGTTC",
+    "ind2_b|sp1": "ACGTACGTAC",
+    "ind3_a|sp2": "ACGAACGTTC",
+    "ind3_b|sp2": "ACGAACGTTG",
+}
+
+
+def write_fasta(path: Path, sequences: dict[str, str]) -> Path:
+    path.write_text("".join(f">{id}\n{seq}\n" for id, seq in sequences.items()))
+    return path
+
+
+@pytest.mark.parametrize("memory_budget", [DEFAULT_MEMORY_BUDGET, 0])
+def test_pipeline(tmp_path: Path, memory_budget: int):
+    initialize_worker()
+    path = write_fasta(tmp_path / "locus.fas", SEQUENCES)
+    options = PipelineOptions(phase=False, memory_budget=memory_budget)
+    result = run_pipeline(path, tmp_path / "out", tmp_path / "work", options)
+    assert result.warns == []
+    assert [output.name for output in result.outputs] == [
+        "locus.stats.yaml",
+        "locus.network.yaml",
+    ]
+
+    network = yaml.safe_load((tmp_path / "out" / "locus.network.yaml").read_text())
+    members = sorted(member for node in network["nodes"] for member in node["members"])
+    assert members == ["ind1", "ind2", "ind2", "ind3", "ind3"]
+    assert sum(node["pops"].get("sp2", 0) for node in network["nodes"]) == 2
+
+
+def test_pipeline_metrics(tmp_path: Path):
+    initialize_worker()
+    path = write_fasta(tmp_path / "locus.fas", SEQUENCES)
+    options = PipelineOptions(phase=False, metrics=True)
+    result = run_pipeline(path, tmp_path / "out", tmp_path / "work", options)
+    assert result.outputs[-1].name == "locus.stages.json"
+
+    stages = json.loads(result.outputs[-1].read_text())
+    assert [stage["name"] for stage in stages] == [
+        stage.name for stage in result.stages
+    ]
+    names = [stage["name"] for stage in stages]
+    assert "stats: scan and bundle" in names
+    assert "network: network build" in names
+    for stage in stages:
+        assert stage["wall_seconds"] >= 0
+        assert stage["cpu_seconds"] >= 0
+    assert next(
+        stage["items"] for stage in stages if stage["name"] == "network: sequence read"
+    ) == len(SEQUENCES)
+
+
+def test_pipeline_strict(tmp_path: Path):
+    initialize_worker()
+    path = write_fasta(tmp_path / "locus.fas", SEQUENCES | {"ind4_a|sp2": "ACGTACGTAN"})
+    options = PipelineOptions(phase=False, strict=True)
+    with pytest.raises(PipelineAborted):
+        run_pipeline(path, tmp_path / "out", tmp_path / "work", options)
+
+
+def test_batch_queue(tmp_path: Path):
+    write_fasta(tmp_path / "locus1.fas", SEQUENCES)
+    write_fasta(tmp_path / "locus2.fas", SEQUENCES | {"ind4_a|sp2": "ACGT"})
+    write_fasta(tmp_path / "locus3.fas", SEQUENCES)
+    manifest = tmp_path / "manifest.txt"
+    manifest.write_text("# loci\nlocus1.fas\nlocus2.fas\n\nlocus3.fas\n")
+    jobs = get_jobs_from_path(manifest)
+    assert [job.path for job in jobs] == [
+        job.path for job in get_jobs_from_path(tmp_path)
+    ]
+    assert [job.path.name for job in jobs] == ["locus1.fas", "locus2.fas", "locus3.fas"]
+
+    statuses = []
+    queue = BatchQueue(
+        jobs,
+        tmp_path / "out",
+        tmp_path / "work",
+        PipelineOptions(phase=False),
+        max_workers=2,
+        retries=1,
+        callback=lambda job: statuses.append((job.path.name, job.status)),
+    )
+    progress = queue.run()
+    assert (progress.done, progress.failed) == (2, 1)
+    assert [job.attempts for job in jobs] == [1, 2, 1]
+    assert jobs[1].error
+    assert statuses.count(("locus2.fas", JobStatus.Failed)) == 2
@@ -0,0 +1,93 @@
+import json
+import threading
+import time
+from http.server import ThreadingHTTPServer
+from pathlib import Path
+from urllib.request import Request, urlopen
+
+from itaxotools.hapsolutely.batch import JobStatus
+from itaxotools.hapsolutely.server import JobServer, RequestHandler
+
+SEQUENCES = "".join(
+    f">{id}\n{seq}\n"
+    for id, seq in {
+        "ind1_a": "ACGTACGTAC",
+        "ind1_b": "ACGTACGTAC",
+        "ind2_a": "ACGTACGTTC",
+        "ind2_b": "ACGAACGTTG",
+    }.items()
+)
+
+
+def wait_for_job(jobs: JobServer, id: str, timeout: float = 30):
+    start = time.monotonic()
+    while jobs.get(id).status in (JobStatus.Pending, JobStatus.Running):
+        assert time.monotonic() - start < timeout
+        time.sleep(0.05)
+    return jobs.get(id)
+
+
+def test_job_server(tmp_path: Path):
+    jobs = JobServer(tmp_path, max_workers=1)
+    jobs.start()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), RequestHandler)
+    server.jobs = jobs
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    def post(data: dict) -> tuple[int, dict]:
+        request = Request(f"{url}/jobs", json.dumps(data).encode(), method="POST")
+        with urlopen(request) as response:
+            return response.status, json.loads(response.read())
+
+    try:
+        data = {
+            "sequences": {"name": "locus.fas", "content": SEQUENCES},
+            "parameters": {"phase": False, "network_algorithm": "MSN"},
+        }
+        status, job = post(data)
+        assert status == 202
+        assert wait_for_job(jobs, job["id"]).status == JobStatus.Done
+
+        status, cached = post(data)
+        assert status == 200
+        assert cached["id"] == job["id"]
+        assert cached["outputs"] == ["locus.stats.yaml", "locus.network.yaml"]
+
+        with urlopen(f"{url}/jobs/{job['id']}/locus.network.yaml") as response:
+            assert response.read().startswith(b"algorithm: MSN")
+    finally:
+        server.shutdown()
+        server.server_close()
+        jobs.close()
+
+    restarted = JobServer(tmp_path, max_workers=1)
+    assert restarted.get(job["id"]).status == JobStatus.Done
+
+
+def test_job_server_resubmit_failed(tmp_path: Path):
+    jobs = JobServer(tmp_path, max_workers=1)
+    jobs.start()
+    try:
+        data = {
+            "sequences": {
+                "name": "locus.fas",
+                "content": ">ind1_a\nACGTACGTAC\n>ind1_b\nACGT\n",
+            },
+            "parameters": {"phase": False, "network_algorithm": "MSN"},
+        }
+        job, created = jobs.submit(data)
+        assert created
+        job = wait_for_job(jobs, job.id)
+        assert job.status == JobStatus.Failed
+        assert job.attempts == 1
+
+        job, created = jobs.submit(data)
+        assert created
+        job = wait_for_job(jobs, job.id)
+        assert job.status == JobStatus.Failed
+        assert job.attempts == 2
+        assert "File exists" not in job.error
+    finally:
+        jobs.close()
@@ -0,0 +1,53 @@
+import pickle
+
+import pytest
+
+from itaxotools.hapsolutely.store import SequenceStore, get_materialized_sequences
+from itaxotools.taxi2.sequences import Sequence, Sequences
+
+
+def test_sequence_store_round_trip():
+    sequences = Sequences(
+        [
+            Sequence("id1", "ACGT", {"allele": "a"}),
+            Sequence("id2", "ACG", {}),
+            Sequence("id3", "", {"organism": "x", "allele": "b"}),
+            Sequence("id4", "T", {"organism": "y"}),
+        ]
+    )
+    store = SequenceStore.from_sequences(sequences)
+    assert store.ids == ["id1", "id2", "id3", "id4"]
+    assert len(store) == 4
+    for _ in range(2):
+        assert list(store) == list(sequences)
+    assert list(pickle.loads(pickle.dumps(store))) == list(sequences)
+
+
+@pytest.mark.parametrize(
+    "seqs, expected",
+    [
+        (["ACGT", "ACGA"], [list(b"ACGT"), list(b"ACGA")]),
+        (["ACGT", "ACG"], None),
+        (["AÄ", "ÄA"], None),
+        ([], None),
+    ],
+)
+def test_sequence_store_matrix(seqs: list[str], expected: list | None):
+    sequences = Sequences([Sequence(str(i), seq) for i, seq in enumerate(seqs)])
+    store = SequenceStore.from_sequences(sequences)
+    if expected is None:
+        assert store.matrix is None
+    else:
+        assert store.matrix.tolist() == expected
+    assert [sequence.seq for sequence in store] == seqs
+
+
+def test_materialized_sequences_budget():
+    sequences = Sequences([Sequence("a", "ACGT"), Sequence("b", "ACGA")])
+    assert get_materialized_sequences(sequences, 100, 10) is sequences
+
+    store = get_materialized_sequences(sequences, 100, 1000)
+    assert isinstance(store, SequenceStore)
+    assert list(store) == list(sequences)
+    assert isinstance(get_materialized_sequences(sequences, 100, None), SequenceStore)
+    assert get_materialized_sequences(store, 100, 10) is store